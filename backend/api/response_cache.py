@@ -0,0 +1,146 @@
+"""
+In-process LRU cache of API responses with version-based ETags
+
+Read-heavy views are wrapped with ``ResponseCache.cached``, naming the
+``cache_versions`` scopes their payload is built from. A cached body is
+served from memory while it is younger than ``fresh_seconds``; after that
+it is revalidated with one read of its scopes' versions and rebuilt only if
+one of them changed. Bumps made in this process drop entries at once, so
+the ``fresh_seconds`` staleness bound only applies to writes made by other
+processes (e.g. the analysis workers).
+
+ETags are derived from the cache key and the scope versions, so every
+worker process agrees on them and can answer ``If-None-Match`` with 304
+after the version read alone, without building the payload.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request
+from ..database.cache_versions import add_listener, get_versions
+from ..metrics import RESPONSE_CACHE_REQUESTS
+
+# Responses kept per process
+RESPONSE_CACHE_SIZE = 1024
+
+# Seconds a cached response is served without checking its versions
+RESPONSE_CACHE_FRESH_SECONDS = 1.0
+
+class CachedResponse:
+    """A cached response body with the versions it was built from"""
+
+    __slots__ = ("body", "mimetype", "etag", "scopes", "versions", "validated_at")
+
+    def __init__(self, body, mimetype, etag, scopes, versions, validated_at):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.scopes = scopes
+        self.versions = versions
+        self.validated_at = validated_at
+
+class ResponseCache:
+    """Bounded LRU of successful GET responses, keyed by endpoint and arguments"""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, fresh_seconds=RESPONSE_CACHE_FRESH_SECONDS):
+        self.max_entries = max_entries
+        self.fresh_seconds = fresh_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Incremented by every invalidation
+        self._generation = 0
+        add_listener(self.invalidate)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def cached(self, scopes):
+        """
+        Decorate a view whose payload depends only on the given scopes
+
+        ``scopes`` is called with the view's URL arguments and returns the
+        list of ``cache_versions`` scopes. Only 200 responses are cached;
+        anything else, and responses the view marks ``Cache-Control:
+        no-store`` (e.g. results that are not final yet), is passed through
+        untouched.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**view_args):
+                key = (request.endpoint, tuple(sorted(view_args.items())),
+                       tuple(sorted(request.args.items(multi=True))))
+                view_scopes = tuple(scopes(**view_args))
+
+                entry = self._get(key)
+                now = time.monotonic()
+                if entry is not None and now - entry.validated_at < self.fresh_seconds:
+                    RESPONSE_CACHE_REQUESTS.inc(endpoint=request.endpoint, result="hit")
+                    return self._respond(entry)
+
+                # Versions are read before building, so a write racing the
+                # build leaves the entry stale rather than wrongly current
+                versions = get_versions(view_scopes)
+                etag = _make_etag(key, versions)
+                if entry is not None and entry.versions == versions:
+                    entry.validated_at = now
+                    RESPONSE_CACHE_REQUESTS.inc(endpoint=request.endpoint, result="revalidated")
+                    return self._respond(entry)
+                if etag in request.if_none_match:
+                    RESPONSE_CACHE_REQUESTS.inc(endpoint=request.endpoint, result="not_modified")
+                    response = Response(status=304)
+                    response.set_etag(etag)
+                    response.headers["Cache-Control"] = "no-cache"
+                    return response
+
+                RESPONSE_CACHE_REQUESTS.inc(endpoint=request.endpoint, result="miss")
+                generation = self._generation
+                response = make_response(view(**view_args))
+                if response.status_code != 200 or response.cache_control.no_store:
+                    return response
+                entry = CachedResponse(response.get_data(), response.mimetype, etag, view_scopes, versions, now)
+                self._put(key, entry, generation)
+                return self._respond(entry)
+            return wrapper
+        return decorator
+
+    def invalidate(self, scopes):
+        """Drop every entry built from any of ``scopes``"""
+        scopes = set(scopes)
+        with self._lock:
+            self._generation += 1
+            for key in [key for key, entry in self._entries.items() if scopes.intersection(entry.scopes)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, entry, generation):
+        with self._lock:
+            # Built across an invalidation: keep it, but revalidate on next use
+            if generation != self._generation:
+                entry.validated_at = float("-inf")
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _respond(self, entry):
+        response = Response(entry.body, mimetype=entry.mimetype)
+        response.set_etag(entry.etag)
+        # Clients may keep the body but must revalidate it on every use
+        response.headers["Cache-Control"] = "no-cache"
+        return response.make_conditional(request)
+
+def _make_etag(key, versions):
+    return hashlib.blake2b(repr((key, versions)).encode(), digest_size=12).hexdigest()
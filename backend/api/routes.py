@@ -1,18 +1,209 @@
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, jsonify, request, current_app, url_for
+from werkzeug.local import LocalProxy
 from ..database.db import mongo
+from ..database.cache_versions import PATTERNS_SCOPE, bump_versions, preferences_scope, song_scope
 from ..models.chord_analyzer import ChordAnalyzer
-from .spotify import SpotifyAPI
-import json
-from bson import json_util
+from ..models.job_queue import JobQueue, PRIORITY_INTERACTIVE, job_status
+from ..models.language_processor import VocabularyIndex, lemmatize_tokens, tokenize, LANGUAGES
+from ..models.live_detector import LiveSessionStore, LIVE_BASE_SR
+from ..models.pattern_index import PatternIndex
+from ..models.recommendation import ChordRecommender
+from .spotify import SpotifyAPI, SpotifyError
+from .song_service import (
+    ANALYSIS_DONE, ANALYSIS_FAILED, get_or_create_song, analyze_song, record_analysis_status
+)
+from .response_cache import ResponseCache
+from .translation import (
+    TranslationError, TranslationService, backend_options, create_backend, MAX_SEGMENTS, MAX_SEGMENT_CHARS
+)
+import os
+import threading
+import time
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 # Create blueprint
 api_bp = Blueprint('api', __name__)
 
+# Shared service instances, created on first use rather than at import time
+_services = {}
+
+def get_spotify_api():
+    """Return the shared Spotify API client, creating it from the app config"""
+    if 'spotify_api' not in _services:
+        _services['spotify_api'] = SpotifyAPI()
+    return _services['spotify_api']
+
+def get_chord_analyzer():
+    """Return the shared chord analyzer"""
+    if 'chord_analyzer' not in _services:
+        _services['chord_analyzer'] = ChordAnalyzer()
+    return _services['chord_analyzer']
+
+def get_translation_service():
+    """Return the shared translation service, using the configured backend"""
+    if 'translation_service' not in _services:
+        name, options = backend_options(current_app.config)
+        _services['translation_service'] = TranslationService(create_backend(name, **options))
+    return _services['translation_service']
+
 # Initialize Spotify API
-spotify_api = SpotifyAPI()
+spotify_api = LocalProxy(get_spotify_api)
 
 # Initialize chord analyzer
-chord_analyzer = ChordAnalyzer()
+chord_analyzer = LocalProxy(get_chord_analyzer)
+
+# Initialize chord pattern index
+pattern_index = PatternIndex()
+
+# Queue of background analysis jobs
+job_queue = JobQueue()
+
+# Live chord detection sessions served by this process
+live_sessions = LiveSessionStore()
+
+# Seconds a client is asked to wait when every live session slot is taken
+LIVE_SESSION_RETRY_SECONDS = 5
+
+# Cached responses of the read-heavy endpoints, per process
+response_cache = ResponseCache()
+
+# Seconds between checks for analyses saved by other processes
+RECOMMENDER_SYNC_SECONDS = 5
+
+# Held while the recommender is loaded, so concurrent callers wait for one build
+_recommender_lock = threading.Lock()
+
+def get_recommender():
+    """
+    Return the chord recommender, loading or building it if not preloaded
+    
+    A prebuilt index is loaded from RECOMMENDER_INDEX_PATH if set; otherwise
+    the index is built from the database. Analyses saved in this process are
+    added as they are saved; those saved by other processes (the analysis
+    workers) are picked up by a sync at most every RECOMMENDER_SYNC_SECONDS.
+    """
+    recommender = chord_analyzer.recommender
+    if recommender is None:
+        with _recommender_lock:
+            if chord_analyzer.recommender is None:
+                index_path = current_app.config.get('RECOMMENDER_INDEX_PATH')
+                if index_path and os.path.exists(index_path):
+                    recommender = ChordRecommender.load(index_path)
+                    recommender.sync_from_db()
+                else:
+                    recommender = ChordRecommender().build_from_db()
+                chord_analyzer.recommender = recommender
+                _services['recommender_checked_at'] = time.monotonic()
+            return chord_analyzer.recommender
+    
+    now = time.monotonic()
+    if now - _services.get('recommender_checked_at', 0) >= RECOMMENDER_SYNC_SECONDS:
+        _services['recommender_checked_at'] = now
+        recommender.sync_from_db()
+    return recommender
+
+def preload_recommender(app):
+    """
+    Load or build the chord recommender in a background thread
+    
+    Started by ``create_app`` so the index is ready before the first
+    similarity request without delaying the worker's startup; a request
+    arriving during the build waits for it instead of starting another.
+    """
+    def load():
+        with app.app_context():
+            get_recommender()
+    
+    thread = threading.Thread(target=load, name='recommender-preload', daemon=True)
+    thread.start()
+    return thread
+
+# Default seconds after which the vocabulary index is rebuilt, to pick up
+# lyrics and languages written to songs since it was built
+VOCABULARY_REFRESH_SECONDS = 3600
+
+# Held while the vocabulary index is loaded or rebuilt, so only one build runs
+_vocabulary_lock = threading.Lock()
+
+def get_vocabulary_index():
+    """
+    Return the lyrics vocabulary index, loading or building it on first use
+    
+    A prebuilt index is loaded from VOCABULARY_INDEX_PATH if set (see the
+    build-vocabulary-index command); otherwise it is built from the lyrics
+    stored on songs. Lyrics are written to songs outside the API, so once
+    the index is older than VOCABULARY_REFRESH_SECONDS (0 disables this) it
+    is rebuilt from the database in a background thread and swapped in,
+    while requests keep using the current one.
+    """
+    index = _services.get('vocabulary_index')
+    if index is None:
+        with _vocabulary_lock:
+            if 'vocabulary_index' not in _services:
+                index_path = current_app.config.get('VOCABULARY_INDEX_PATH')
+                if index_path and os.path.exists(index_path):
+                    _services['vocabulary_index'] = VocabularyIndex.load(index_path)
+                else:
+                    _services['vocabulary_index'] = VocabularyIndex().build_from_db()
+                _services['vocabulary_built_at'] = time.monotonic()
+            return _services['vocabulary_index']
+    
+    refresh_seconds = current_app.config.get('VOCABULARY_REFRESH_SECONDS', VOCABULARY_REFRESH_SECONDS)
+    age = time.monotonic() - _services['vocabulary_built_at']
+    if refresh_seconds and age >= refresh_seconds and _vocabulary_lock.acquire(blocking=False):
+        # Counted from the start, so a failed rebuild is retried a period later
+        _services['vocabulary_built_at'] = time.monotonic()
+        _services['vocabulary_refresh'] = refresh_vocabulary_index(current_app._get_current_object())
+    return index
+
+def refresh_vocabulary_index(app):
+    """
+    Rebuild the vocabulary index from the database in a background thread
+    
+    The caller holds ``_vocabulary_lock``, which the thread releases once
+    the new index is in place.
+    """
+    def rebuild():
+        try:
+            with app.app_context():
+                index = VocabularyIndex().build_from_db()
+            _services['vocabulary_index'] = index
+        finally:
+            _vocabulary_lock.release()
+    
+    thread = threading.Thread(target=rebuild, name='vocabulary-refresh', daemon=True)
+    thread.start()
+    return thread
+
+# Fields of songs and progressions returned by get_song (what the frontend uses)
+SONG_DETAIL_FIELDS = {
+    "title": 1, "artist": 1, "album": 1, "release_date": 1, "spotify_id": 1, "preview_url": 1,
+    "key": 1, "tempo": 1, "language": 1, "audio_features.mode": 1, "audio_features.tempo": 1,
+    "analysis_status": 1, "analysis_attempts": 1
+}
+PROGRESSION_DETAIL_FIELDS = {
+    "section_index": 1, "progression": 1, "progression_pattern": 1, "section_type": 1, "confidence": 1
+}
+
+# Cursor batch size for lookups, so typical result sets arrive in one round trip
+LOOKUP_BATCH_SIZE = 10000
+
+def fetch_by_ids(collection, ids, projection):
+    """
+    Fetch documents by string ids with a single $in query
+    
+    Returns a dict keyed by the string id; invalid ids are ignored.
+    """
+    object_ids = [ObjectId(i) for i in ids if ObjectId.is_valid(i)]
+    if not object_ids:
+        return {}
+    
+    # One batch large enough for every document keeps this to one round trip
+    cursor = collection.find({"_id": {"$in": object_ids}}, projection).batch_size(max(len(object_ids), LOOKUP_BATCH_SIZE))
+    return {str(doc["_id"]): doc for doc in cursor}
 
 @api_bp.route('/search', methods=['GET'])
 def search_songs():
@@ -24,7 +215,10 @@ def search_songs():
         return jsonify({"error": "Query parameter 'q' is required"}), 400
     
     # Search via Spotify API
-    results = spotify_api.search_track(query, limit=limit)
+    try:
+        results = spotify_api.search_track(query, limit=limit)
+    except SpotifyError as e:
+        return jsonify({"error": str(e)}), 502
     
     # Transform results to our format
     songs = []
@@ -41,78 +235,270 @@ def search_songs():
     return jsonify({"songs": songs})
 
 @api_bp.route('/songs/<spotify_id>', methods=['GET'])
+@response_cache.cached(lambda spotify_id: [song_scope(spotify_id)])
 def get_song(spotify_id):
-    """Get song details including chord progressions"""
-    # Check if song exists in database
-    song = mongo.db.songs.find_one({"spotify_id": spotify_id})
+    """
+    Get song details including chord progressions
     
-    if not song:
-        # Get from Spotify API
-        track = spotify_api.get_track(spotify_id)
-        features = spotify_api.get_audio_features(spotify_id)
+    Songs that have not been analyzed yet are queued for the analysis
+    workers and answered with 202 and a job to poll at /api/jobs/<job_id>.
+    With ANALYSIS_MODE=sync the analysis runs inline instead. Songs whose
+    analysis is done (even with no progressions) or failed for good are
+    answered with their ``analysis_status`` and not queued again.
+    """
+    song, progressions = find_song_details(spotify_id)
+    analysis_status = (song or {}).get("analysis_status")
+    
+    analysis_pending = False
+    if not progressions and analysis_status not in (ANALYSIS_DONE, ANALYSIS_FAILED):
+        # A track whose job failed before its song could be created (e.g. unknown to Spotify)
+        if song is None:
+            job = job_queue.latest(spotify_id)
+            if job is not None and job["status"] == "failed":
+                return jsonify({
+                    "error": "Song could not be analyzed",
+                    "analysis_status": ANALYSIS_FAILED,
+                    "analysis_attempts": job.get("attempts", 0),
+                    "analysis_error": job.get("error")
+                }), 404
         
-        # Create new song document
-        song = {
-            "title": track.get('name'),
-            "artist": track.get('artists', [{}])[0].get('name'),
-            "spotify_id": spotify_id,
-            "album": track.get('album', {}).get('name'),
-            "release_date": track.get('album', {}).get('release_date'),
-            "tempo": features.get('tempo'),
-            "key": features.get('key'),
-            "audio_features": features,
-            "language": spotify_api.detect_language(spotify_id)
-        }
+        if current_app.config.get('ANALYSIS_MODE') != 'sync':
+            job = job_queue.enqueue(spotify_id, priority=PRIORITY_INTERACTIVE)
+            response = jsonify({
+                "job_id": str(job["_id"]),
+                "status": job["status"],
+                "status_url": url_for('api.get_job', job_id=str(job["_id"])),
+                "song": song,
+                "chord_progressions": [],
+                "analysis_pending": True
+            })
+            response.headers["Location"] = url_for('api.get_job', job_id=str(job["_id"]))
+            return response, 202
         
-        # Insert into database
-        result = mongo.db.songs.insert_one(song)
-        song['_id'] = result.inserted_id
+        try:
+            analysis_pending = not analyze_song_sync(spotify_id)
+        except SpotifyError as e:
+            if e.not_found:
+                return jsonify({"error": "Song not found", "analysis_error": str(e)}), 404
+            return jsonify({"error": str(e)}), 502
+        song, progressions = find_song_details(spotify_id)
+        analysis_status = (song or {}).get("analysis_status")
+    
+    response = jsonify({
+        "song": song,
+        "chord_progressions": progressions,
+        "analysis_pending": analysis_pending,
+        "analysis_status": analysis_status or (ANALYSIS_DONE if progressions else None)
+    })
+    # Keep results that may still change out of the response cache
+    if analysis_pending or not progressions:
+        response.cache_control.no_store = True
+    return response
+
+def find_song_details(spotify_id):
+    """Return (song, progressions) with only the fields served by get_song"""
+    song = mongo.db.songs.find_one({"spotify_id": spotify_id}, SONG_DETAIL_FIELDS)
+    if not song:
+        return None, []
+    progressions = list(mongo.db.chord_progressions.find({"song_id": str(song['_id'])}, PROGRESSION_DETAIL_FIELDS))
+    return song, progressions
+
+def analyze_song_sync(spotify_id):
+    """
+    Fetch and analyze a song inside the request (ANALYSIS_MODE=sync)
     
-    # Get chord progressions
-    progressions = list(mongo.db.chord_progressions.find({"song_id": str(song['_id'])}))
+    Returns False if another worker is already analyzing it.
+    """
+    song, bundle = get_or_create_song(spotify_api, spotify_id)
+    if mongo.db.chord_progressions.count_documents({"song_id": str(song['_id'])}, limit=1):
+        return True
     
-    # If no progressions yet, analyze and save
-    if not progressions:
-        analysis = chord_analyzer.analyze_track_from_spotify(spotify_api, spotify_id)
-        chord_analyzer.save_analysis_to_db(str(song['_id']), analysis)
-        progressions = list(mongo.db.chord_progressions.find({"song_id": str(song['_id'])}))
+    # Analyze and save, unless another worker already is
+    if not chord_analyzer.claim_analysis(str(song['_id'])):
+        return False
+    try:
+        analyze_song(spotify_api, chord_analyzer, song, bundle)
+        record_analysis_status(spotify_id, ANALYSIS_DONE)
+    finally:
+        chord_analyzer.release_analysis(str(song['_id']))
+    return True
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status of a background job"""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
     
-    # Prepare response
-    song_data = json.loads(json_util.dumps(song))
-    progression_data = json.loads(json_util.dumps(progressions))
+    status = job_status(job)
+    if job["status"] == "done":
+        status["song_url"] = url_for('api.get_song', spotify_id=job["spotify_id"])
+    return jsonify(status)
+
+@api_bp.route('/songs/<spotify_id>/similar', methods=['GET'])
+def get_similar_songs(spotify_id):
+    """Get songs with chord sequences similar to this one, in any key"""
+    limit = min(int(request.args.get('limit', 10)), 100)
     
-    return jsonify({
-        "song": song_data,
-        "chord_progressions": progression_data
-    })
+    song = mongo.db.songs.find_one({"spotify_id": spotify_id}, {"_id": 1})
+    if not song:
+        return jsonify({"error": "Song not found"}), 404
+    
+    matches = get_recommender().similar_songs(str(song["_id"]), k=limit)
+    return jsonify({"songs": with_song_details(matches)})
+
+@api_bp.route('/recommendations/<user_id>', methods=['GET'])
+def get_recommendations(user_id):
+    """Recommend songs based on a user's saved songs and chord progressions"""
+    limit = min(int(request.args.get('limit', 10)), 100)
+    
+    matches = get_recommender().recommend_for_user(user_id, k=limit)
+    return jsonify({"songs": with_song_details(matches)})
+
+def with_song_details(matches):
+    """Attach title, artist and spotify_id to a list of scored song matches"""
+    songs = fetch_by_ids(mongo.db.songs, [m["song_id"] for m in matches], {"title": 1, "artist": 1, "spotify_id": 1})
+    return [
+        {
+            "song_id": m["song_id"],
+            "title": songs.get(m["song_id"], {}).get("title"),
+            "artist": songs.get(m["song_id"], {}).get("artist"),
+            "spotify_id": songs.get(m["song_id"], {}).get("spotify_id"),
+            "score": m["score"]
+        }
+        for m in matches
+    ]
 
 @api_bp.route('/patterns', methods=['GET'])
+@response_cache.cached(lambda: [PATTERNS_SCOPE])
 def get_chord_patterns():
-    """Get common chord patterns and examples"""
-    common_patterns = chord_analyzer.get_common_progressions()
-    
-    # Add songs from our database that match these patterns
-    for pattern in common_patterns:
-        pattern_str = pattern["pattern"]
-        # Find songs in our database with this pattern
-        matching_progressions = list(mongo.db.chord_progressions.find(
-            {"progression_pattern": pattern_str}
-        ).limit(5))
-        
-        # Get song details for these progressions
-        db_examples = []
-        for prog in matching_progressions:
-            song = mongo.db.songs.find_one({"_id": json_util.ObjectId(prog["song_id"])})
-            if song:
-                db_examples.append({
-                    "title": song.get("title"),
-                    "artist": song.get("artist")
-                })
-        
-        # Add to pattern
-        pattern["db_examples"] = db_examples
+    """Get the most common chord patterns in our database, with examples"""
+    limit = min(int(request.args.get('limit', 20)), 100)
+    
+    # Single indexed read of the materialized statistics
+    patterns = chord_analyzer.pattern_stats.top_patterns(limit)
+    
+    # Nothing analyzed yet: fall back to the well-known patterns
+    if not patterns:
+        patterns = chord_analyzer.get_common_progressions()
+        for pattern in patterns:
+            pattern["db_examples"] = []
+    
+    return jsonify({"patterns": patterns})
+
+@api_bp.route('/patterns/search', methods=['GET'])
+def search_chord_patterns():
+    """Search songs for a chord pattern, e.g. ?q=ii-V-I or ?q=I-*-vi-IV"""
+    query = request.args.get('q', '')
+    limit = min(int(request.args.get('limit', 20)), 100)
+    
+    if not query:
+        return jsonify({"error": "Query parameter 'q' is required"}), 400
+    
+    try:
+        matches = pattern_index.search(query, limit=limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Fetch song details for all matches in one query
+    songs = fetch_by_ids(mongo.db.songs, [m["song_id"] for m in matches], {"title": 1, "artist": 1, "spotify_id": 1})
+    
+    results = []
+    for match in matches:
+        song = songs.get(match["song_id"], {})
+        results.append({
+            "song_id": match["song_id"],
+            "title": song.get("title"),
+            "artist": song.get("artist"),
+            "spotify_id": song.get("spotify_id"),
+            "positions": match["positions"]
+        })
+    
+    return jsonify({"pattern": query, "matches": results})
+
+@api_bp.route('/live/sessions', methods=['POST'])
+def create_live_session():
+    """
+    Start a live chord detection session
+    
+    JSON body (all optional): sr (default 22050), channels (1 or 2) and
+    format ('f32' for little-endian float32 or 's16' for int16 PCM).
+    """
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        session_id, detector = live_sessions.create(
+            sr=int(data.get('sr', LIVE_BASE_SR)),
+            channels=int(data.get('channels', 1)),
+            sample_format=data.get('format', 'f32')
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if session_id is None:
+        response = jsonify({"error": "Too many live sessions, try again later"})
+        response.headers["Retry-After"] = str(LIVE_SESSION_RETRY_SECONDS)
+        return response, 503
+    
+    return jsonify({
+        "session_id": session_id,
+        "sr": detector.sr,
+        "channels": detector.channels,
+        "format": detector.sample_format,
+        "hop_length": detector.hop_length,
+        "max_latency": round(detector.max_latency, 3),
+        "audio_url": url_for('api.feed_live_session', session_id=session_id)
+    }), 201
+
+@api_bp.route('/live/sessions/<session_id>/audio', methods=['POST'])
+def feed_live_session(session_id):
+    """Send the next chunk of raw PCM audio; returns the chord changes detected so far"""
+    detector = live_sessions.get(session_id)
+    if detector is None:
+        return jsonify({"error": "Session not found"}), 404
+    
+    data = read_request_body(detector.max_chunk_bytes)
+    if data is None:
+        return jsonify({"error": "Audio chunk too large"}), 413
+    
+    try:
+        changes = detector.feed(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({
+        "changes": changes,
+        "chord": detector.current_chord,
+        "position": round(detector.position, 3)
+    })
+
+def read_request_body(limit):
+    """
+    Read the raw request body, or return None if it is larger than ``limit`` bytes
     
-    return jsonify({"patterns": common_patterns})
+    A declared Content-Length over the limit is rejected without reading
+    anything; bodies without one (chunked uploads) are read only up to one
+    byte past the limit.
+    """
+    if request.content_length is not None and request.content_length > limit:
+        return None
+    
+    chunks = []
+    size = 0
+    while size <= limit:
+        chunk = request.stream.read(min(1 << 16, limit + 1 - size))
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+        size += len(chunk)
+    return None
+
+@api_bp.route('/live/sessions/<session_id>', methods=['DELETE'])
+def close_live_session(session_id):
+    """End a live chord detection session"""
+    if live_sessions.close(session_id) is None:
+        return jsonify({"error": "Session not found"}), 404
+    return '', 204
 
 @api_bp.route('/preferences', methods=['POST'])
 def save_preference():
@@ -160,37 +546,49 @@ def save_preference():
         result = mongo.db.user_preferences.insert_one(preference)
         message = "Preference saved"
     
+    bump_versions([preferences_scope(preference["user_id"])])
+    
     return jsonify({"message": message, "success": True})
 
 @api_bp.route('/preferences/<user_id>', methods=['GET'])
+@response_cache.cached(lambda user_id: [preferences_scope(user_id)])
 def get_preferences(user_id):
     """Get user preferences"""
-    preferences = list(mongo.db.user_preferences.find({"user_id": user_id}))
+    preferences = list(mongo.db.user_preferences.find({"user_id": user_id}).batch_size(LOOKUP_BATCH_SIZE))
+    
+    # Get song and progression details for all preferences in one query each
+    songs = fetch_by_ids(
+        mongo.db.songs,
+        {pref["song_id"] for pref in preferences if pref.get("song_id")},
+        {"title": 1, "artist": 1, "spotify_id": 1}
+    )
+    progressions = fetch_by_ids(
+        mongo.db.chord_progressions,
+        {pref["chord_progression_id"] for pref in preferences if pref.get("chord_progression_id")},
+        {"progression_pattern": 1, "progression": 1}
+    )
     
-    # Get song details for each preference
     full_preferences = []
     for pref in preferences:
-        if pref.get('song_id'):
-            song = mongo.db.songs.find_one({"_id": json_util.ObjectId(pref["song_id"])})
-            if song:
-                pref["song"] = {
-                    "title": song.get("title"),
-                    "artist": song.get("artist"),
-                    "spotify_id": song.get("spotify_id")
-                }
+        song = songs.get(pref.get("song_id"))
+        if song:
+            pref["song"] = {
+                "title": song.get("title"),
+                "artist": song.get("artist"),
+                "spotify_id": song.get("spotify_id")
+            }
         
-        if pref.get('chord_progression_id'):
-            progression = mongo.db.chord_progressions.find_one({"_id": json_util.ObjectId(pref["chord_progression_id"])})
-            if progression:
-                pref["progression"] = {
-                    "pattern": progression.get("progression_pattern"),
-                    "chords": progression.get("progression")
-                }
+        progression = progressions.get(pref.get("chord_progression_id"))
+        if progression:
+            pref["progression"] = {
+                "pattern": progression.get("progression_pattern"),
+                "chords": progression.get("progression")
+            }
                 
         full_preferences.append(pref)
     
     return jsonify({
-        "preferences": json.loads(json_util.dumps(full_preferences))
+        "preferences": full_preferences
     })
 
 @api_bp.route('/lyrics/<spotify_id>', methods=['GET'])
@@ -204,21 +602,156 @@ def get_lyrics(spotify_id):
         "lyrics": "Placeholder lyrics for demonstration purposes"
     })
 
+@api_bp.route('/vocabulary/words', methods=['GET'])
+def get_vocabulary_words():
+    """Get the most frequent words of the catalog's lyrics, e.g. ?language=Spanish&limit=50"""
+    language = request.args.get('language')
+    limit = min(int(request.args.get('limit', 50)), 1000)
+    offset = max(int(request.args.get('offset', 0)), 0)
+    
+    words = get_vocabulary_index().top_words(language, limit=limit, offset=offset)
+    return jsonify({"language": language, "words": words})
+
+@api_bp.route('/vocabulary/search', methods=['GET'])
+def search_vocabulary():
+    """Find songs whose lyrics use a word in any inflection, e.g. ?q=corazones&language=Spanish"""
+    query = request.args.get('q', '')
+    language = request.args.get('language')
+    limit = min(int(request.args.get('limit', 20)), 100)
+    
+    if not query:
+        return jsonify({"error": "Query parameter 'q' is required"}), 400
+    
+    try:
+        matches = get_vocabulary_index().songs_with_word(query, language=language, limit=limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Fetch song details for all matches in one query
+    songs = fetch_by_ids(mongo.db.songs, [m["song_id"] for m in matches], {"title": 1, "artist": 1, "spotify_id": 1})
+    
+    results = []
+    for match in matches:
+        song = songs.get(match["song_id"], {})
+        results.append({
+            "song_id": match["song_id"],
+            "title": song.get("title"),
+            "artist": song.get("artist"),
+            "spotify_id": song.get("spotify_id"),
+            "count": match["count"],
+            "positions": match["positions"]
+        })
+    
+    return jsonify({"word": query, "matches": results})
+
+@api_bp.route('/vocabulary/<user_id>', methods=['POST'])
+def add_known_words(user_id):
+    """
+    Add words a user knows
+    
+    JSON body: language (one of LANGUAGES) and words, a list of words in any
+    inflection; they are stored as lemmas.
+    """
+    data = request.get_json(silent=True) or {}
+    language = data.get('language')
+    words = data.get('words')
+    
+    if language not in LANGUAGES:
+        return jsonify({"error": f"language must be one of: {', '.join(LANGUAGES)}"}), 400
+    if not isinstance(words, list) or not all(isinstance(word, str) for word in words):
+        return jsonify({"error": "words must be a list of strings"}), 400
+    
+    lemmas = sorted({
+        lemma for word in words for lemma in lemmatize_tokens(tokenize(word), language)
+    })
+    if lemmas:
+        now = datetime.utcnow()
+        try:
+            mongo.db.user_vocabulary.bulk_write([
+                UpdateOne(
+                    {"user_id": user_id, "language": language, "word": lemma},
+                    {"$setOnInsert": {"added_at": now}},
+                    upsert=True
+                )
+                for lemma in lemmas
+            ], ordered=False)
+        except BulkWriteError as e:
+            # A concurrent request added the same word first
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+    
+    return jsonify({"words": lemmas, "success": True})
+
+@api_bp.route('/vocabulary/<user_id>/songs', methods=['GET'])
+def get_known_vocabulary_songs(user_id):
+    """Get songs whose lyrics the user mostly understands, e.g. ?language=Spanish&min_coverage=0.9"""
+    language = request.args.get('language')
+    min_coverage = float(request.args.get('min_coverage', 0.9))
+    limit = min(int(request.args.get('limit', 20)), 100)
+    
+    query = {"user_id": user_id}
+    if language:
+        query["language"] = language
+    known_words = [doc["word"] for doc in mongo.db.user_vocabulary.find(query, {"word": 1})]
+    
+    matches = get_vocabulary_index().known_songs(
+        known_words, language=language, min_coverage=min_coverage, limit=limit
+    )
+    songs = fetch_by_ids(mongo.db.songs, [m["song_id"] for m in matches], {"title": 1, "artist": 1, "spotify_id": 1})
+    
+    results = []
+    for match in matches:
+        song = songs.get(match["song_id"], {})
+        results.append({
+            "song_id": match["song_id"],
+            "title": song.get("title"),
+            "artist": song.get("artist"),
+            "spotify_id": song.get("spotify_id"),
+            "coverage": match["coverage"],
+            "unknown_words": match["unknown_words"]
+        })
+    
+    return jsonify({"user_id": user_id, "known_words": len(known_words), "songs": results})
+
 @api_bp.route('/translate', methods=['POST'])
 def translate_text():
-    """Translate text between languages (placeholder)"""
-    data = request.json
+    """
+    Translate text between languages
+    
+    Accepts either ``segments`` (a list of lines, translated in one call and
+    returned as ``translations``) or a single ``text``, which is split into
+    lines so repeated lines hit the cache, and returned as ``translated_text``.
+    """
+    data = request.get_json(silent=True) or {}
     
-    if not data or not data.get('text'):
-        return jsonify({"error": "No text provided"}), 400
+    segments = data.get('segments')
+    text = data.get('text')
+    if segments is None:
+        if not text or not isinstance(text, str):
+            return jsonify({"error": "No text provided"}), 400
+        segments = text.split('\n')
+    elif not isinstance(segments, list) or not all(isinstance(segment, str) for segment in segments):
+        return jsonify({"error": "segments must be a list of strings"}), 400
+    
+    if len(segments) > MAX_SEGMENTS:
+        return jsonify({"error": f"At most {MAX_SEGMENTS} segments per request"}), 413
+    if any(len(segment) > MAX_SEGMENT_CHARS for segment in segments):
+        return jsonify({"error": f"Segments are limited to {MAX_SEGMENT_CHARS} characters"}), 413
     
     source_lang = data.get('source_lang', 'auto')
     target_lang = data.get('target_lang', 'en')
     
-    # In a real app, call translation API
-    # For demo purposes, return the original text
-    return jsonify({
-        "translated_text": f"[Translation of '{data['text']}' from {source_lang} to {target_lang}]",
-        "status": "success",
-        "message": "This endpoint would integrate with a translation API in production"
-    })
\ No newline at end of file
+    try:
+        translations = get_translation_service().translate(segments, target_lang, source_lang)
+    except TranslationError as e:
+        current_app.logger.warning("Translation failed: %s", e)
+        return jsonify({"error": "Translation service unavailable"}), 502
+    
+    if data.get('segments') is not None:
+        return jsonify({"translations": translations, "status": "success"})
+    return jsonify({"translated_text": "\n".join(translations), "status": "success"})
+
+@api_bp.route('/translate/stats', methods=['GET'])
+def get_translation_stats():
+    """Get translation cache hit rate and backend usage for this process"""
+    return jsonify(get_translation_service().stats())
\ No newline at end of file
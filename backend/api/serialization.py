@@ -0,0 +1,59 @@
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+from ..metrics import SERIALIZATION_SECONDS, request_endpoint
+
+try:
+    import orjson
+except ImportError:  # Optional fast encoder
+    orjson = None
+
+def encode_bson_value(o):
+    """Encode the BSON and numpy types found in our documents as plain JSON values"""
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, datetime):
+        # pymongo returns naive datetimes in UTC; UTC is written as 'Z' like orjson does
+        if o.tzinfo is None or o.utcoffset() == timedelta(0):
+            return o.replace(tzinfo=None).isoformat() + "Z"
+        return o.isoformat()
+    if isinstance(o, date):
+        return o.isoformat()
+    # numpy values from the analysis code, e.g. chord scores
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    return DefaultJSONProvider.default(o)
+
+class MongoJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that encodes Mongo documents in a single pass
+
+    ObjectIds become their hex strings, datetimes ISO 8601 strings and numpy
+    values plain numbers and lists, so routes can pass documents straight to
+    ``jsonify`` instead of round-tripping them through ``bson.json_util``.
+    Compact responses are encoded with orjson when it is installed; the
+    json module fallback produces the same values (and, like orjson, leaves
+    non-ASCII characters unescaped). Encoding time is recorded in the
+    ``serialization_duration_seconds`` metric.
+    """
+
+    default = staticmethod(encode_bson_value)
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            # Flask passes only ``separators`` for compact output and ``indent`` in debug
+            if orjson is not None and set(kwargs) <= {"separators"}:
+                option = orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+                if self.sort_keys:
+                    option |= orjson.OPT_SORT_KEYS
+                return orjson.dumps(obj, default=encode_bson_value, option=option).decode()
+            return super().dumps(obj, **kwargs)
+        finally:
+            SERIALIZATION_SECONDS.observe(time.perf_counter() - start, endpoint=request_endpoint())
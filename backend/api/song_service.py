@@ -0,0 +1,76 @@
+from pymongo import ReturnDocument
+from ..database.db import mongo
+from ..database.cache_versions import bump_versions, song_scope
+from ..models.language_classifier import detect_languages, spotify_track_text
+
+# Final analysis outcomes recorded on a song; get_song does not queue these again
+ANALYSIS_DONE = "done"
+ANALYSIS_FAILED = "failed"
+
+def get_or_create_song(spotify_api, spotify_id):
+    """
+    Return (song, bundle) for a track, creating the song document if needed
+
+    ``bundle`` holds the track, audio features and audio analysis fetched
+    from Spotify, or is None if the song was already in the database.
+    """
+    song = mongo.db.songs.find_one({"spotify_id": spotify_id})
+    if song:
+        return song, None
+
+    # Get track, audio features and audio analysis from Spotify API concurrently
+    bundle = spotify_api.fetch_track_bundle(spotify_id)
+    track = bundle["track"]
+    features = bundle["audio_features"]
+
+    # Create new song document
+    song = {
+        "title": track.get('name'),
+        "artist": track.get('artists', [{}])[0].get('name'),
+        "spotify_id": spotify_id,
+        "album": track.get('album', {}).get('name'),
+        "release_date": track.get('album', {}).get('release_date'),
+        "tempo": features.get('tempo'),
+        "key": features.get('key'),
+        "audio_features": features,
+        "language": detect_languages([spotify_track_text(track)])[0]
+    }
+
+    # Insert into database; a concurrent request may have inserted it first
+    song = mongo.db.songs.find_one_and_update(
+        {"spotify_id": spotify_id},
+        {"$setOnInsert": song},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return song, bundle
+
+def analyze_song(spotify_api, chord_analyzer, song, bundle=None):
+    """Analyze a song's chords and save the results; return the saved progressions"""
+    if bundle is None:
+        bundle = spotify_api.fetch_track_bundle(song["spotify_id"], include=("audio_features", "audio_analysis"))
+    analysis = chord_analyzer.analyze_track_from_spotify(
+        spotify_api, song["spotify_id"],
+        features=bundle["audio_features"],
+        analysis=bundle["audio_analysis"]
+    )
+    chord_analyzer.save_analysis_to_db(str(song['_id']), analysis, song=song)
+    return list(mongo.db.chord_progressions.find({"song_id": str(song['_id'])}))
+
+def record_analysis_status(spotify_id, status, attempts=None, error=None):
+    """
+    Record the final outcome of a song's analysis on the song document
+
+    A song analyzed to zero progressions is ``done`` like any other, and one
+    whose job ran out of attempts is ``failed``; neither is queued again.
+    """
+    fields = {"analysis_status": status}
+    if attempts is not None:
+        fields["analysis_attempts"] = attempts
+    if error is not None:
+        fields["analysis_error"] = error
+    update = {"$set": fields}
+    if error is None:
+        update["$unset"] = {"analysis_error": ""}
+    if mongo.db.songs.update_one({"spotify_id": spotify_id}, update).matched_count:
+        bump_versions([song_scope(spotify_id)])
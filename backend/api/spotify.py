@@ -1,23 +1,91 @@
 import requests
 import base64
-import json
+import random
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from flask import current_app
+from requests.adapters import HTTPAdapter
+from ..metrics import SPOTIFY_REQUEST_SECONDS
+
+# Endpoints fetched by ``fetch_track_bundle``, keyed by bundle field
+TRACK_BUNDLE_ENDPOINTS = ("track", "audio_features", "audio_analysis")
+
+# Maximum number of IDs Spotify accepts per multi-ID request
+MAX_TRACK_IDS = 50
+MAX_AUDIO_FEATURE_IDS = 100
+
+# Status codes worth retrying after a backoff
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Status codes Spotify answers for an invalid or unknown ID
+NOT_FOUND_STATUS_CODES = {400, 404}
+
+class SpotifyError(Exception):
+    """Raised when Spotify answers a request with an error status"""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"Spotify returned {status_code}: {message}")
+        self.status_code = status_code
+
+    @property
+    def not_found(self):
+        """Whether the requested ID is invalid or unknown, so retrying cannot help"""
+        return self.status_code in NOT_FOUND_STATUS_CODES
+
+    @classmethod
+    def from_response(cls, response):
+        """Build the error of a failed response, with Spotify's message if it sent one"""
+        try:
+            message = response.json()["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            message = response.reason
+        return cls(response.status_code, message)
 
 class SpotifyAPI:
     """Spotify API wrapper for fetching music data"""
     
-    def __init__(self, client_id=None, client_secret=None):
+    def __init__(self, client_id=None, client_secret=None, cache_ttl=3600, cache_size=2048,
+                 max_concurrency=8, pool_size=16, timeout=(3.05, 10), max_retries=3,
+                 backoff_factor=0.5, max_retry_after=60):
         self.client_id = client_id or current_app.config['SPOTIFY_CLIENT_ID']
         self.client_secret = client_secret or current_app.config['SPOTIFY_CLIENT_SECRET']
         self.token = None
         self.token_expiry = 0
         self.base_url = "https://api.spotify.com/v1"
+        self.token_url = "https://accounts.spotify.com/api/token"
+        
+        # TTL cache of successful GET responses, shared by all requests
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="spotify")
+        
+        # Keep-alive connection pool shared by all calls; retries are handled
+        # in _request so that Retry-After and token refresh are respected
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_retry_after = max_retry_after
+        self._token_lock = threading.Lock()
     
     def _get_auth_header(self):
         """Get authorization header for Spotify API requests"""
         if time.time() > self.token_expiry:
-            self._get_token()
+            # Single-flight refresh: threads that queued on the lock re-check
+            # the expiry and reuse the token fetched by the first one
+            with self._token_lock:
+                if time.time() > self.token_expiry:
+                    self._get_token()
         
         return {"Authorization": f"Bearer {self.token}"}
     
@@ -27,14 +95,15 @@ class SpotifyAPI:
         auth_bytes = auth_string.encode("utf-8")
         auth_base64 = base64.b64encode(auth_bytes).decode("utf-8")
         
-        url = "https://accounts.spotify.com/api/token"
+        url = self.token_url
         headers = {
             "Authorization": f"Basic {auth_base64}",
             "Content-Type": "application/x-www-form-urlencoded"
         }
         data = {"grant_type": "client_credentials"}
         
-        response = requests.post(url, headers=headers, data=data)
+        response = self._request("POST", url, headers=headers, data=data)
+        response.raise_for_status()
         json_result = response.json()
         
         self.token = json_result["access_token"]
@@ -42,9 +111,151 @@ class SpotifyAPI:
         
         return True
     
+    def _request(self, method, url, **kwargs):
+        """
+        Send a request on the pooled session, retrying transient failures
+        
+        429 responses wait for their Retry-After header (capped at
+        ``max_retry_after``); 5xx responses and connection errors back off
+        exponentially with jitter. The last response is returned once
+        retries are exhausted.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        endpoint = self._endpoint_label(url)
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                SPOTIFY_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, status="error")
+                if last_attempt:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            SPOTIFY_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint,
+                                            status=response.status_code)
+            
+            if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                return response
+            
+            retry_after = response.headers.get("Retry-After")
+            if response.status_code == 429 and retry_after and retry_after.isdigit():
+                delay = min(int(retry_after), self.max_retry_after)
+            else:
+                delay = self._backoff(attempt)
+            time.sleep(delay)
+    
+    def _endpoint_label(self, url):
+        """Metric label for a request URL: 'token' or the API resource, e.g. 'audio-features'"""
+        if url == self.token_url:
+            return "token"
+        path = url[len(self.base_url):] if url.startswith(self.base_url) else url
+        return path.strip("/").split("/", 1)[0] or "other"
+    
+    def _backoff(self, attempt):
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, self.backoff_factor * (2 ** attempt))
+    
+    def _cache_get(self, key):
+        """Return a cached response body, or None if missing or expired"""
+        if not self.cache_ttl:
+            return None
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry and entry[0] > time.time():
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return entry[1]
+            self.cache_misses += 1
+            return None
+    
+    def _cache_put(self, key, data):
+        """Store a response body in the TTL cache"""
+        if not self.cache_ttl:
+            return
+        with self._cache_lock:
+            self._cache[key] = (time.time() + self.cache_ttl, data)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+    
+    def _get(self, url, params=None, cache=True):
+        """
+        GET a Spotify endpoint and return the decoded JSON
+        
+        Successful responses are cached for ``cache_ttl`` seconds, keyed by
+        URL and query parameters. An expired token (401) is refreshed once;
+        any other error status (after retries) raises ``SpotifyError``.
+        """
+        key = (url, tuple(sorted((params or {}).items())))
+        if cache:
+            data = self._cache_get(key)
+            if data is not None:
+                return data
+        
+        response = self._request("GET", url, headers=self._get_auth_header(), params=params)
+        if response.status_code == 401:
+            self.token_expiry = 0
+            response = self._request("GET", url, headers=self._get_auth_header(), params=params)
+        if not response.ok:
+            raise SpotifyError.from_response(response)
+        data = response.json()
+        
+        if cache and response.status_code == 200:
+            self._cache_put(key, data)
+        
+        return data
+    
+    def _get_many(self, path, ids, batch_size, response_field):
+        """
+        Fetch many items from a multi-ID endpoint, e.g. /tracks?ids=...
+        
+        Items already in the cache (from single-item calls or earlier batches)
+        are not requested again, and each fetched item is cached under its
+        single-item URL. Returns items in the order of ``ids``, with None for
+        IDs Spotify does not know.
+        """
+        results = {}
+        missing = []
+        for item_id in dict.fromkeys(ids):
+            data = self._cache_get((f"{self.base_url}/{path}/{item_id}", ()))
+            if data is not None:
+                results[item_id] = data
+            else:
+                missing.append(item_id)
+        
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            data = self._get(f"{self.base_url}/{path}", params={"ids": ",".join(batch)}, cache=False)
+            for item_id, item in zip(batch, data.get(response_field) or []):
+                results[item_id] = item
+                if item is not None:
+                    self._cache_put((f"{self.base_url}/{path}/{item_id}", ()), item)
+        
+        return [results.get(item_id) for item_id in ids]
+    
+    def fetch_track_bundle(self, track_id, include=TRACK_BUNDLE_ENDPOINTS):
+        """
+        Fetch track details, audio features and audio analysis concurrently
+        
+        Each endpoint is requested at most once (and not at all on a cache
+        hit). Returns a dict keyed by the names in ``include``.
+        """
+        fetchers = {
+            "track": self.get_track,
+            "audio_features": self.get_audio_features,
+            "audio_analysis": self.get_audio_analysis
+        }
+        
+        # Refresh the token up front so the parallel calls don't each fetch one
+        self._get_auth_header()
+        
+        futures = {name: self._executor.submit(fetchers[name], track_id) for name in include}
+        return {name: future.result() for name, future in futures.items()}
+    
     def search_track(self, query, limit=10):
         """Search for tracks on Spotify"""
-        headers = self._get_auth_header()
         url = f"{self.base_url}/search"
         params = {
             "q": query,
@@ -52,57 +263,30 @@ class SpotifyAPI:
             "limit": limit
         }
         
-        response = requests.get(url, headers=headers, params=params)
-        return response.json()
+        return self._get(url, params=params)
     
     def get_track(self, track_id):
         """Get detailed track information"""
-        headers = self._get_auth_header()
         url = f"{self.base_url}/tracks/{track_id}"
         
-        response = requests.get(url, headers=headers)
-        return response.json()
+        return self._get(url)
+    
+    def get_tracks(self, track_ids):
+        """Get track information for many tracks, 50 IDs per request"""
+        return self._get_many("tracks", track_ids, MAX_TRACK_IDS, "tracks")
     
     def get_audio_features(self, track_id):
         """Get audio features for a track (tempo, key, mode, etc.)"""
-        headers = self._get_auth_header()
         url = f"{self.base_url}/audio-features/{track_id}"
         
-        response = requests.get(url, headers=headers)
-        return response.json()
+        return self._get(url)
+    
+    def get_audio_features_many(self, track_ids):
+        """Get audio features for many tracks, 100 IDs per request"""
+        return self._get_many("audio-features", track_ids, MAX_AUDIO_FEATURE_IDS, "audio_features")
     
     def get_audio_analysis(self, track_id):
         """Get detailed audio analysis for a track (sections, segments, etc.)"""
-        headers = self._get_auth_header()
         url = f"{self.base_url}/audio-analysis/{track_id}"
         
-        response = requests.get(url, headers=headers)
-        return response.json()
-    
-    def detect_language(self, track_id):
-        """Attempt to detect language of a track using available metadata"""
-        # This is a simplified approach - in a real app you might use
-        # the track's market, artist nationality, or integrate with a
-        # language detection service after analyzing lyrics
-        
-        headers = self._get_auth_header()
-        
-        # Get track details
-        track_url = f"{self.base_url}/tracks/{track_id}"
-        track_response = requests.get(track_url, headers=headers)
-        track_data = track_response.json()
-        
-        # Check available markets for language hints
-        markets = track_data.get("available_markets", [])
-        
-        # Very simplified language detection based on markets
-        # This would need to be much more sophisticated in a real application
-        if "ES" in markets or "MX" in markets or "AR" in markets:
-            return "Spanish"
-        elif "BR" in markets or "PT" in markets:
-            return "Portuguese"
-        elif "US" in markets or "GB" in markets:
-            return "English"
-        
-        # Default to unknown
-        return "Unknown"
\ No newline at end of file
+        return self._get(url)
@@ -0,0 +1,248 @@
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+import requests
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from ..database.db import mongo
+from ..metrics import TRANSLATION_SEGMENTS, TRANSLATION_BACKEND_SECONDS
+
+# Segments translated per backend call
+TRANSLATION_BATCH_SIZE = 50
+
+# Translations kept in each process's LRU
+TRANSLATION_CACHE_SIZE = 10000
+
+# Limits on one /api/translate request
+MAX_SEGMENTS = 500
+MAX_SEGMENT_CHARS = 2000
+
+_whitespace = re.compile(r"\s+")
+
+class TranslationError(Exception):
+    """Raised when the translation backend fails"""
+
+def normalize_segment(text):
+    """Normalize a segment for caching: NFC, trimmed, with runs of whitespace collapsed"""
+    return _whitespace.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+class TranslationBackend:
+    """
+    Interface of translation backends
+
+    Subclasses implement ``translate_batch`` and may lower ``max_batch_size``.
+    ``name`` is part of every cache key, so switching backends never serves
+    another backend's translations. Backends with ``persistent = False`` are
+    only cached in memory, never in the ``translations`` collection.
+    """
+
+    name = "base"
+    max_batch_size = TRANSLATION_BATCH_SIZE
+    persistent = True
+
+    def translate_batch(self, texts, source_lang, target_lang):
+        """Translate a list of normalized segments; return translations in the same order"""
+        raise NotImplementedError
+
+class StubBackend(TranslationBackend):
+    """Offline backend that tags each segment with the target language, for development and tests"""
+
+    name = "stub"
+    persistent = False
+
+    def translate_batch(self, texts, source_lang, target_lang):
+        return [f"[{target_lang}] {text}" for text in texts]
+
+class LibreTranslateBackend(TranslationBackend):
+    """Backend for a LibreTranslate server (``POST /translate`` with a list of texts)"""
+
+    name = "libretranslate"
+
+    def __init__(self, url, api_key=None, timeout=(3.05, 30)):
+        self.url = url.rstrip("/") + "/translate"
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def translate_batch(self, texts, source_lang, target_lang):
+        payload = {"q": list(texts), "source": source_lang, "target": target_lang, "format": "text"}
+        if self.api_key:
+            payload["api_key"] = self.api_key
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            translations = response.json()["translatedText"]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            raise TranslationError(f"LibreTranslate request failed: {e}") from e
+        if not isinstance(translations, list) or len(translations) != len(texts):
+            raise TranslationError("LibreTranslate returned an unexpected response")
+        return translations
+
+# Backends selectable with the TRANSLATION_BACKEND setting
+BACKENDS = {
+    "stub": StubBackend,
+    "libretranslate": LibreTranslateBackend,
+}
+
+def backend_options(config):
+    """
+    Return the backend name and options selected by an app config
+
+    Raises ValueError for an unknown ``TRANSLATION_BACKEND`` or a
+    'libretranslate' backend without ``TRANSLATION_API_URL``, so a
+    misconfigured server fails at startup rather than on the first request.
+    """
+    name = config.get('TRANSLATION_BACKEND') or 'stub'
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown translation backend: {name} (choose from {', '.join(BACKENDS)})")
+    if name == 'libretranslate':
+        if not config.get('TRANSLATION_API_URL'):
+            raise ValueError("TRANSLATION_API_URL must be set to use the libretranslate backend")
+        return name, {'url': config['TRANSLATION_API_URL'], 'api_key': config.get('TRANSLATION_API_KEY')}
+    return name, {}
+
+def create_backend(name, **options):
+    """Instantiate a backend from ``BACKENDS`` by name"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown translation backend: {name} (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[name](**options)
+
+class TranslationService:
+    """
+    Translates batches of segments through a two-tier cache
+
+    Segments are normalized and deduplicated, then looked up in an
+    in-process LRU and, for the rest, in the ``translations`` collection
+    with one ``$in`` query. Only the remaining misses are sent to the
+    backend, ``max_batch_size`` at a time, and their translations are
+    written back to both tiers, so repeated lines (choruses, popular songs)
+    are translated once across all users and processes.
+    """
+
+    def __init__(self, backend, cache_size=TRANSLATION_CACHE_SIZE, batch_size=None, persist=None):
+        self.backend = backend
+        self.cache_size = cache_size
+        self.batch_size = min(batch_size or backend.max_batch_size, backend.max_batch_size)
+        self.persist = backend.persistent if persist is None else persist
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ("segments", "memory_hits", "store_hits", "backend_segments", "backend_calls"), 0
+        )
+
+    def translate(self, segments, target_lang, source_lang="auto"):
+        """
+        Translate many segments at once
+
+        Parameters:
+        -----------
+        segments : list
+            Texts to translate, e.g. the lines of a song's lyrics
+        target_lang : str
+            Language code to translate to
+        source_lang : str
+            Language code of the segments, or 'auto'
+
+        Returns:
+        --------
+        list
+            One translation per segment, in order; blank segments map to ''
+        """
+        normalized = [normalize_segment(segment) for segment in segments]
+        keys = {
+            text: self._key(text, source_lang, target_lang)
+            for text in dict.fromkeys(normalized) if text
+        }
+
+        translations = {}
+        with self._lock:
+            for text, key in keys.items():
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    translations[text] = self._cache[key]
+        in_memory = set(translations)
+        memory_hits = len(in_memory)
+
+        missing = [text for text in keys if text not in translations]
+        if missing and self.persist:
+            for doc in mongo.db.translations.find(
+                {"_id": {"$in": [keys[text] for text in missing]}}, {"text": 1, "translation": 1}
+            ):
+                translations[doc["text"]] = doc["translation"]
+        store_hits = len(translations) - memory_hits
+
+        missing = [text for text in keys if text not in translations]
+        backend_calls = 0
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            began = time.perf_counter()
+            try:
+                results = self.backend.translate_batch(batch, source_lang, target_lang)
+            finally:
+                TRANSLATION_BACKEND_SECONDS.observe(time.perf_counter() - began, backend=self.backend.name)
+            backend_calls += 1
+            translations.update(zip(batch, results))
+            if self.persist:
+                self._store(batch, results, keys, source_lang, target_lang)
+
+        with self._lock:
+            for text in keys:
+                if text not in in_memory:
+                    self._cache[keys[text]] = translations[text]
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self._stats["segments"] += len(keys)
+            self._stats["memory_hits"] += memory_hits
+            self._stats["store_hits"] += store_hits
+            self._stats["backend_segments"] += len(missing)
+            self._stats["backend_calls"] += backend_calls
+
+        TRANSLATION_SEGMENTS.inc(memory_hits, source="memory")
+        TRANSLATION_SEGMENTS.inc(store_hits, source="store")
+        TRANSLATION_SEGMENTS.inc(len(missing), source="backend")
+
+        return [translations.get(text, "") for text in normalized]
+
+    def stats(self):
+        """Return cache hit counts, the hit rate and backend usage since startup"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached"] = len(self._cache)
+        hits = stats["memory_hits"] + stats["store_hits"]
+        stats["hit_rate"] = hits / stats["segments"] if stats["segments"] else 0.0
+        stats["backend"] = self.backend.name
+        return stats
+
+    def _key(self, text, source_lang, target_lang):
+        """Cache key of a normalized segment for this backend and language pair"""
+        raw = f"{self.backend.name}|{source_lang}|{target_lang}|{text}"
+        return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+    def _store(self, texts, results, keys, source_lang, target_lang):
+        """Persist new translations; concurrent writers of the same segment are harmless"""
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"_id": keys[text]},
+                {"$setOnInsert": {
+                    "text": text,
+                    "translation": translation,
+                    "source_lang": source_lang,
+                    "target_lang": target_lang,
+                    "backend": self.backend.name,
+                    "created_at": now
+                }},
+                upsert=True
+            )
+            for text, translation in zip(texts, results)
+        ]
+        try:
+            mongo.db.translations.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Another process inserted the same segment first
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
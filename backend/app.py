@@ -2,8 +2,14 @@ from flask import Flask, jsonify, request
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
-from database.db import init_db
-from api.routes import api_bp
+from .database.db import init_db, ensure_indexes
+from .metrics import init_metrics
+from .api.routes import api_bp, preload_recommender
+from .models.language_classifier import reclassify_songs
+from .models.language_processor import VocabularyIndex
+from .models.pattern_index import PatternIndex
+from .api.serialization import MongoJSONProvider
+from .api.translation import backend_options
 
 # Load environment variables
 load_dotenv()
@@ -19,13 +25,76 @@ def create_app():
     app.config['MONGO_URI'] = os.getenv('MONGO_URI', 'mongodb://localhost:27017/music_explorer')
     app.config['SPOTIFY_CLIENT_ID'] = os.getenv('SPOTIFY_CLIENT_ID')
     app.config['SPOTIFY_CLIENT_SECRET'] = os.getenv('SPOTIFY_CLIENT_SECRET')
+    app.config['RECOMMENDER_INDEX_PATH'] = os.getenv('RECOMMENDER_INDEX_PATH')
+    app.config['VOCABULARY_INDEX_PATH'] = os.getenv('VOCABULARY_INDEX_PATH')
+    app.config['VOCABULARY_REFRESH_SECONDS'] = int(os.getenv('VOCABULARY_REFRESH_SECONDS', 3600))
+    
+    # 'queue' hands analysis to the background workers (python -m backend.worker);
+    # 'sync' analyzes inside the request
+    app.config['ANALYSIS_MODE'] = os.getenv('ANALYSIS_MODE', 'queue')
+    
+    app.config['MONGO_CREATE_INDEXES'] = os.getenv('MONGO_CREATE_INDEXES', '').lower() in ('1', 'true', 'yes')
+    
+    # Load the recommender index in the background at startup rather than in
+    # the first similarity request; the analysis workers turn this off
+    app.config['RECOMMENDER_PRELOAD'] = os.getenv('RECOMMENDER_PRELOAD', '1').lower() in ('1', 'true', 'yes')
+    
+    # Optional token enabling the per-request profiler (X-Profile header)
+    app.config['PROFILE_TOKEN'] = os.getenv('PROFILE_TOKEN')
+    
+    # Translation backend ('stub' or 'libretranslate') and its server
+    app.config['TRANSLATION_BACKEND'] = os.getenv('TRANSLATION_BACKEND', 'stub')
+    app.config['TRANSLATION_API_URL'] = os.getenv('TRANSLATION_API_URL')
+    app.config['TRANSLATION_API_KEY'] = os.getenv('TRANSLATION_API_KEY')
+    backend_options(app.config)
     
     # Initialize database
     init_db(app)
     
+    # Encode ObjectId and datetime directly when building JSON responses; set
+    # after init_db because Flask-PyMongo installs its own json_util provider
+    app.json = MongoJSONProvider(app)
+    
+    # Request timing, /metrics and the profiler hook
+    init_metrics(app)
+    
+    # Index creation is an explicit migration step: flask --app backend.app create-indexes
+    @app.cli.command('create-indexes')
+    def create_indexes_command():
+        """Create MongoDB indexes"""
+        ensure_indexes()
+        print("Indexes created")
+    
+    # Prebuild the lyrics vocabulary index loaded by the API: flask --app backend.app build-vocabulary-index
+    @app.cli.command('build-vocabulary-index')
+    def build_vocabulary_index_command():
+        """Index the stored lyrics and save the index to VOCABULARY_INDEX_PATH"""
+        index_path = app.config.get('VOCABULARY_INDEX_PATH')
+        if not index_path:
+            raise SystemExit("VOCABULARY_INDEX_PATH is not set")
+        index = VocabularyIndex().build_from_db()
+        index.save(index_path)
+        print(f"Indexed {len(index)} songs ({len(index.terms)} words) into {index_path}")
+    
+    # Backfill the gram song counts that order pattern searches: flask --app backend.app count-pattern-grams
+    @app.cli.command('count-pattern-grams')
+    def count_pattern_grams_command():
+        """Recount the songs containing each chord gram of the pattern index"""
+        print(f"Counted {PatternIndex().rebuild_gram_counts()} grams")
+    
+    # Backfill song languages with the offline classifier: flask --app backend.app classify-languages
+    @app.cli.command('classify-languages')
+    def classify_languages_command():
+        """Classify the language of every stored song from its title, artist, album and lyrics"""
+        classified, changed = reclassify_songs()
+        print(f"Classified {classified} songs, {changed} changed")
+    
     # Register blueprints
     app.register_blueprint(api_bp, url_prefix='/api')
     
+    if app.config['RECOMMENDER_PRELOAD']:
+        preload_recommender(app)
+    
     # Root route
     @app.route('/')
     def index():
@@ -0,0 +1,327 @@
+"""
+Bulk chord analysis for a local audio library
+
+Usage (from the repository root):
+
+    python -m backend.batch_analyze /path/to/library --workers 8
+    python -m backend.batch_analyze manifest.csv --chunk-size 500
+
+The source is either a directory (searched recursively for audio files) or a
+CSV manifest with one ``path[,spotify_id[,title[,artist[,language]]]]`` row
+per line. Files without a spotify_id in the manifest are expected to be named
+``<spotify_id>.<ext>``. Title, artist and album not given in the manifest are
+read from the file's tags, and the language is classified from them unless
+the manifest sets it.
+
+Decoding, chroma extraction and chord detection run in a process pool; the
+parent process writes each finished chunk to MongoDB in bulk and records the
+analyzed paths in a checkpoint file so an interrupted run can be resumed.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from dotenv import load_dotenv
+from flask import Flask
+from pymongo import UpdateOne
+
+from .database.db import init_db, ensure_indexes, mongo
+from .database.chord_store import ChordStore
+from .models.chord_analyzer import ChordAnalyzer, encode_chords, beat_segments
+from .models.feature_cache import FeatureCache
+from .models.language_classifier import detect_languages, track_text
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.mp3', '.m4a', '.aiff')
+
+STAGES = ('decode', 'chroma', 'beats', 'detect')
+
+# Manifest columns after the path, in order
+MANIFEST_FIELDS = ('spotify_id', 'title', 'artist', 'language')
+
+# Song fields read from audio file tags
+TAG_FIELDS = ('title', 'artist', 'album')
+
+# Per-process analyzer, created once by the pool initializer
+_worker_analyzer = None
+_worker_keep_features = False
+
+def _init_worker(model_path, cache_dir, cache_max_bytes, keep_features=False):
+    """Create the chord analyzer (and its feature cache) once per worker process"""
+    global _worker_analyzer, _worker_keep_features
+    cache = FeatureCache(cache_dir, max_bytes=cache_max_bytes) if cache_dir else None
+    _worker_analyzer = ChordAnalyzer(model_path, cache=cache)
+    _worker_keep_features = keep_features
+
+def read_tags(path):
+    """
+    Return the title, artist and album tags of an audio file
+
+    Tags are read with libsndfile, so only wav, flac, ogg and aiff files
+    carry them; other formats (and untagged files) return an empty dict.
+    """
+    import soundfile
+
+    try:
+        with soundfile.SoundFile(path) as f:
+            tags = f.copy_metadata()
+    except RuntimeError:
+        return {}
+    return {field: tags[field].strip() for field in TAG_FIELDS if tags.get(field, '').strip()}
+
+def _analyze_file(task):
+    """
+    Analyze a single audio file inside a worker process
+
+    Returns a dict with the task's path and spotify_id, the analysis results
+    (or an error message), the file's tags and the time spent in each stage.
+    """
+    path, spotify_id, sr, beats_per_chord = task
+    timings = {}
+    try:
+        # Decode and CQT are skipped entirely on a feature cache hit
+        segments = None
+        if beats_per_chord:
+            chroma, beat_frames = _worker_analyzer.load_chroma(path, sr=sr, timings=timings, beats=True)
+            segments = beat_segments(beat_frames, chroma.shape[1], beats_per_chord)
+        else:
+            chroma = _worker_analyzer.load_chroma(path, sr=sr, timings=timings)
+
+        start = time.perf_counter()
+        chord_arrays = _worker_analyzer.detect_chord_arrays(chroma, sr=sr, segments=segments)
+        progressions = _worker_analyzer.identify_progressions(chord_arrays)
+        key = _worker_analyzer.detect_key(chroma)
+        timings['detect'] = time.perf_counter() - start
+    except Exception as e:
+        return {"path": path, "spotify_id": spotify_id, "error": str(e), "timings": timings}
+
+    result = {
+        "path": path,
+        "spotify_id": spotify_id,
+        "analysis": {"key": key, "progressions": progressions},
+        "tags": read_tags(path),
+        "timings": timings
+    }
+    if _worker_keep_features:
+        result["features"] = (
+            np.asarray(chroma),
+            encode_chords(chord_arrays["root"], chord_arrays["quality"]),
+            chord_arrays["time"]
+        )
+    return result
+
+def collect_tasks(source, extensions=AUDIO_EXTENSIONS):
+    """
+    Return a list of (path, spotify_id, metadata) tasks from a directory or manifest file
+
+    ``metadata`` holds the non-empty song fields given in the manifest
+    (title, artist, language); it is empty for directory sources.
+    """
+    tasks = []
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith(extensions):
+                    tasks.append((os.path.join(root, name), {}))
+    else:
+        with open(source, newline='') as manifest:
+            for row in csv.reader(manifest):
+                if not row or not row[0].strip() or row[0].startswith('#'):
+                    continue
+                values = dict(zip(MANIFEST_FIELDS, (value.strip() for value in row[1:])))
+                tasks.append((row[0].strip(), {field: value for field, value in values.items() if value}))
+
+    # Fall back to the file name for the Spotify ID
+    return [
+        (path, metadata.pop('spotify_id', None) or os.path.splitext(os.path.basename(path))[0], metadata)
+        for path, metadata in tasks
+    ]
+
+def load_checkpoint(checkpoint_path):
+    """Return the set of paths already analyzed by a previous run"""
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path) as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+def write_results(analyzer, results):
+    """
+    Write a chunk of successful results to MongoDB in bulk
+
+    Song documents are upserted by spotify_id in one bulk_write and their ids
+    fetched with a single $in query; progressions, pattern index entries and
+    statistics for the whole chunk are then written by
+    ``ChordAnalyzer.save_analyses_to_db``. Each result gets its song's
+    ``song_id``.
+
+    Manifest fields (``r["metadata"]``) are always written; tag fields and
+    the classified language only fill in songs created by this call, so
+    metadata already fetched from Spotify is kept.
+    """
+    if not results:
+        return 0
+
+    # Classify the language of songs the manifest gives none for, in one batch
+    unlabeled = [r for r in results if "language" not in r.get("metadata", {})]
+    texts = [
+        track_text(*({**r.get("tags", {}), **r.get("metadata", {})}.get(field) for field in TAG_FIELDS))
+        for r in unlabeled
+    ]
+    languages = dict(zip((r["spotify_id"] for r in unlabeled), detect_languages(texts) if texts else []))
+
+    operations = []
+    for r in results:
+        metadata = r.get("metadata", {})
+        defaults = {field: value for field, value in r.get("tags", {}).items() if field not in metadata}
+        if r["spotify_id"] in languages:
+            defaults["language"] = languages[r["spotify_id"]]
+        update = {"$setOnInsert": {"spotify_id": r["spotify_id"], "audio_path": r["path"], **defaults}}
+        if metadata:
+            update["$set"] = metadata
+        operations.append(UpdateOne({"spotify_id": r["spotify_id"]}, update, upsert=True))
+    mongo.db.songs.bulk_write(operations, ordered=False)
+
+    songs = {
+        song["spotify_id"]: song
+        for song in mongo.db.songs.find(
+            {"spotify_id": {"$in": [r["spotify_id"] for r in results]}},
+            {"spotify_id": 1, "title": 1, "artist": 1, "language": 1}
+        )
+    }
+
+    for r in results:
+        r["song_id"] = str(songs[r["spotify_id"]]["_id"])
+
+    analyzer.save_analyses_to_db([(r["song_id"], r["analysis"], songs[r["spotify_id"]]) for r in results])
+    return sum(len(r["analysis"]["progressions"]) for r in results)
+
+def run(tasks, workers=None, chunk_size=256, sr=22050, checkpoint_path=None, model_path=None,
+        cache_dir=None, cache_max_bytes=2 * 1024 ** 3, store_dir=None, beats_per_chord=None):
+    """
+    Analyze ``tasks`` in a process pool and write results chunk by chunk
+
+    If ``store_dir`` is set, each song's chroma and chord codes are also
+    appended to the columnar ``ChordStore`` there. With ``beats_per_chord``
+    set, chords are detected per group of tracked beats instead of fixed
+    windows (see ``ChordAnalyzer.analyze_audio``).
+
+    Returns a stats dict with track counts, elapsed time and total seconds
+    spent per stage across all workers.
+    """
+    analyzer = ChordAnalyzer(model_path)
+    store = ChordStore(store_dir) if store_dir else None
+    done = load_checkpoint(checkpoint_path)
+    pending = [task for task in tasks if task[0] not in done]
+    workers = workers or os.cpu_count() or 1
+
+    stats = {"total": len(tasks), "skipped": len(tasks) - len(pending), "analyzed": 0,
+             "failed": 0, "progressions": 0, "stages": dict.fromkeys(STAGES, 0.0)}
+    started = time.perf_counter()
+
+    checkpoint = open(checkpoint_path, 'a') if checkpoint_path else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model_path, cache_dir, cache_max_bytes, store is not None)) as executor:
+            for offset in range(0, len(pending), chunk_size):
+                tasks_chunk = pending[offset:offset + chunk_size]
+                chunk = [(path, spotify_id, sr, beats_per_chord) for path, spotify_id, _ in tasks_chunk]
+                map_chunksize = max(1, len(chunk) // (workers * 4))
+                results = list(executor.map(_analyze_file, chunk, chunksize=map_chunksize))
+
+                succeeded = []
+                for r, (_, _, metadata) in zip(results, tasks_chunk):
+                    r["metadata"] = metadata
+                    for stage, seconds in r["timings"].items():
+                        stats["stages"][stage] += seconds
+                    if "error" in r:
+                        stats["failed"] += 1
+                        print(f"Failed: {r['path']}: {r['error']}", file=sys.stderr)
+                    else:
+                        succeeded.append(r)
+
+                stats["progressions"] += write_results(analyzer, succeeded)
+                stats["analyzed"] += len(succeeded)
+                if store is not None:
+                    store.append_many(((r["song_id"],) + r["features"] for r in succeeded), sr=sr)
+
+                # Only checkpoint once the chunk is safely in the database
+                if checkpoint:
+                    checkpoint.writelines(f"{r['path']}\n" for r in succeeded)
+                    checkpoint.flush()
+
+                report_progress(stats, time.perf_counter() - started)
+    finally:
+        if checkpoint:
+            checkpoint.close()
+
+    stats["elapsed"] = time.perf_counter() - started
+    return stats
+
+def report_progress(stats, elapsed):
+    """Print throughput and per-stage timings"""
+    processed = stats["analyzed"] + stats["failed"]
+    rate = processed / elapsed if elapsed else 0.0
+    stage_report = ", ".join(
+        f"{stage} {seconds / processed * 1000:.0f} ms" if processed else f"{stage} -"
+        for stage, seconds in stats["stages"].items()
+    )
+    print(
+        f"[{processed}/{stats['total'] - stats['skipped']}] {rate:.2f} tracks/s, "
+        f"{stats['failed']} failed, {stats['progressions']} progressions | per track: {stage_report}"
+    )
+
+def create_cli_app(mongo_uri):
+    """Create a minimal Flask app so the database helpers can be used from the CLI"""
+    app = Flask(__name__)
+    app.config['MONGO_URI'] = mongo_uri
+    init_db(app)
+
+    # Bulk upserts rely on the unique indexes, so make sure they exist
+    with app.app_context():
+        ensure_indexes()
+    return app
+
+def main(argv=None):
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Bulk chord analysis for a local audio library")
+    parser.add_argument('source', help="Audio directory or CSV manifest (path[,spotify_id[,title[,artist[,language]]]] per line)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=256, help="Tracks analyzed and written per chunk")
+    parser.add_argument('--sr', type=int, default=22050, help="Sample rate used for analysis")
+    parser.add_argument('--beats-per-chord', type=int, default=None,
+                        help="Detect one chord per N tracked beats (e.g. 1 or 4) instead of fixed windows")
+    parser.add_argument('--checkpoint', default=None,
+                        help="File recording analyzed paths (default: <source>.done)")
+    parser.add_argument('--model-path', default=None, help="Optional pre-trained chord model")
+    parser.add_argument('--cache-dir', default=os.getenv('ANALYSIS_CACHE_DIR'),
+                        help="Directory for the chroma/chord feature cache (disabled if unset)")
+    parser.add_argument('--cache-max-gb', type=float, default=2.0, help="Feature cache size budget in GB")
+    parser.add_argument('--store-dir', default=os.getenv('CHORD_STORE_DIR'),
+                        help="Also append chroma and chord codes to the columnar store here")
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/music_explorer'))
+    args = parser.parse_args(argv)
+
+    checkpoint_path = args.checkpoint or os.path.normpath(args.source) + '.done'
+    tasks = collect_tasks(args.source)
+
+    with create_cli_app(args.mongo_uri).app_context():
+        stats = run(tasks, workers=args.workers, chunk_size=args.chunk_size, sr=args.sr,
+                    checkpoint_path=checkpoint_path, model_path=args.model_path,
+                    cache_dir=args.cache_dir, cache_max_bytes=int(args.cache_max_gb * 1024 ** 3),
+                    store_dir=args.store_dir, beats_per_chord=args.beats_per_chord)
+
+    processed = stats["analyzed"] + stats["failed"]
+    print(
+        f"Done: {stats['analyzed']} analyzed, {stats['failed']} failed, {stats['skipped']} skipped "
+        f"in {stats['elapsed']:.1f}s ({processed / stats['elapsed'] if stats['elapsed'] else 0:.2f} tracks/s)"
+    )
+    for stage, seconds in stats["stages"].items():
+        print(f"  {stage}: {seconds:.1f}s total")
+    return 0 if not stats["failed"] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
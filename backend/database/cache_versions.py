@@ -0,0 +1,63 @@
+"""
+Version counters for data served from response caches
+
+Each scope (the pattern statistics, one song's analysis, one user's
+preferences) has a ``{_id: scope, version}`` document in the
+``cache_versions`` collection. Writers bump the scopes they change, and
+caches compare the versions they built a response from with the current
+ones, so processes that share the database invalidate each other's
+entries. Callbacks registered with ``add_listener`` are also told about
+bumps made in this process, so local caches can drop entries at once.
+"""
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from .db import mongo
+
+# Scope of the materialized pattern statistics
+PATTERNS_SCOPE = "patterns"
+
+# Bumped whenever any song's analysis is saved, so in-memory indexes built
+# from chord_progressions know to pick up new songs
+ANALYSES_SCOPE = "analyses"
+
+_listeners = []
+
+def song_scope(spotify_id):
+    """Scope of a song and its chord progressions"""
+    return f"song:{spotify_id}"
+
+def preferences_scope(user_id):
+    """Scope of one user's saved preferences"""
+    return f"preferences:{user_id}"
+
+def add_listener(callback):
+    """Call ``callback(scopes)`` after every bump made in this process"""
+    _listeners.append(callback)
+
+def get_versions(scopes):
+    """Return the current version of each scope, in order (0 if never bumped)"""
+    scopes = list(scopes)
+    if not scopes:
+        return ()
+    found = {
+        doc["_id"]: doc["version"]
+        for doc in mongo.db.cache_versions.find({"_id": {"$in": scopes}})
+    }
+    return tuple(found.get(scope, 0) for scope in scopes)
+
+def bump_versions(scopes):
+    """Increment the version of each scope with one bulk write"""
+    scopes = sorted(set(scopes))
+    if not scopes:
+        return
+    operations = [UpdateOne({"_id": scope}, {"$inc": {"version": 1}}, upsert=True) for scope in scopes]
+    try:
+        mongo.db.cache_versions.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Concurrent first bumps of a scope race on its _id; the loser retries as an update
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != 11000 for error in errors):
+            raise
+        mongo.db.cache_versions.bulk_write([operations[error["index"]] for error in errors], ordered=False)
+    for callback in _listeners:
+        callback(scopes)
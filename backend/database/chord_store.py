@@ -0,0 +1,240 @@
+import os
+
+import numpy as np
+
+from ..models.chord_analyzer import chord_codes, decode_chords
+
+# One fixed-size record per stored song; offsets point into the data files
+INDEX_DTYPE = np.dtype([
+    ('song_id', 'S24'),
+    ('chroma_start', np.int64),
+    ('n_frames', np.int64),
+    ('chord_start', np.int64),
+    ('n_chords', np.int64),
+    ('hop_length', np.int32),
+    ('sr', np.int32),
+])
+
+CHROMA_FILE = 'chroma.f32'
+CODES_FILE = 'chords.i16'
+TIMES_FILE = 'chord_times.f32'
+INDEX_FILE = 'index.bin'
+
+class ChordStore:
+    """
+    Append-only columnar store for chroma matrices and chord sequences
+
+    All songs share three flat data files: frame-major float32 chroma
+    (n_frames x 12), int16 chord codes (see ``encode_chords``) and float32
+    chord times. A fixed-width index file records each song's offsets. Every
+    file is opened with ``np.memmap``, so per-song reads are zero-copy views
+    and corpus-wide queries run as vectorized operations over the whole
+    corpus without going through MongoDB.
+
+    The index record is written after the data it points to, so a crash
+    mid-append leaves the store readable; trailing bytes past the last
+    indexed song are discarded on the next append. A store supports one
+    writer process and any number of readers.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+        self.refresh()
+
+    def refresh(self):
+        """(Re)open the memory maps, picking up songs appended since the last call"""
+        n_songs = self._file_size(INDEX_FILE) // INDEX_DTYPE.itemsize
+        self.index = self._memmap(INDEX_FILE, INDEX_DTYPE, (n_songs,))
+
+        if n_songs:
+            last = self.index[-1]
+            n_frames = int(last['chroma_start'] + last['n_frames'])
+            n_chords = int(last['chord_start'] + last['n_chords'])
+        else:
+            n_frames = n_chords = 0
+
+        self.chroma = self._memmap(CHROMA_FILE, np.float32, (n_frames, 12))
+        self.codes = self._memmap(CODES_FILE, np.int16, (n_chords,))
+        self.times = self._memmap(TIMES_FILE, np.float32, (n_chords,))
+
+        # Later appends for the same song win
+        self._rows = {song_id.decode(): row for row, song_id in enumerate(self.index['song_id'])}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, song_id):
+        return song_id in self._rows
+
+    def append(self, song_id, chroma, codes, times, hop_length=512, sr=22050):
+        """Append one song; see ``append_many``"""
+        self.append_many([(song_id, chroma, codes, times)], hop_length, sr)
+
+    def append_many(self, songs, hop_length=512, sr=22050):
+        """
+        Append several songs in one write per file
+
+        Song ids longer than the index's 24-byte id field raise ValueError
+        before anything is written.
+
+        Parameters:
+        -----------
+        songs : iterable
+            (song_id, chroma, codes, times) tuples, with chroma shaped
+            (12, n_frames) and codes/times shaped (n_chords,)
+        hop_length : int
+            Hop length the chroma was computed with
+        sr : int
+            Sample rate the chroma was computed with
+        """
+        songs = list(songs)
+        if not songs:
+            return
+
+        song_ids = [str(song_id).encode() for song_id, _, _, _ in songs]
+        id_bytes = INDEX_DTYPE['song_id'].itemsize
+        for song_id in song_ids:
+            if len(song_id) > id_bytes:
+                raise ValueError(f"Song id {song_id.decode()!r} is longer than {id_bytes} bytes")
+
+        chroma_start = len(self.chroma)
+        chord_start = len(self.codes)
+        records = np.zeros(len(songs), dtype=INDEX_DTYPE)
+        for i, (song_id, (_, chroma, codes, _)) in enumerate(zip(song_ids, songs)):
+            records[i] = (song_id, chroma_start, chroma.shape[1],
+                          chord_start, len(codes), hop_length, sr)
+            chroma_start += chroma.shape[1]
+            chord_start += len(codes)
+
+        # Drop any bytes left behind by an interrupted append
+        self._truncate(CHROMA_FILE, self.chroma.nbytes)
+        self._truncate(CODES_FILE, self.codes.nbytes)
+        self._truncate(TIMES_FILE, self.times.nbytes)
+        self._truncate(INDEX_FILE, self.index.nbytes)
+
+        self._write(CHROMA_FILE, [np.asarray(chroma, dtype=np.float32).T for _, chroma, _, _ in songs])
+        self._write(CODES_FILE, [np.asarray(codes, dtype=np.int16) for _, _, codes, _ in songs])
+        self._write(TIMES_FILE, [np.asarray(times, dtype=np.float32) for _, _, _, times in songs])
+        self._write(INDEX_FILE, [records])
+
+        self.refresh()
+
+    def get(self, song_id):
+        """
+        Return zero-copy views of one song's data, or None if it is not stored
+
+        The dict holds ``chroma`` (12, n_frames), ``codes`` and ``times``.
+        """
+        row = self._rows.get(str(song_id))
+        if row is None:
+            return None
+        entry = self.index[row]
+        frames = slice(entry['chroma_start'], entry['chroma_start'] + entry['n_frames'])
+        chords = slice(entry['chord_start'], entry['chord_start'] + entry['n_chords'])
+        return {
+            "chroma": self.chroma[frames].T,
+            "codes": self.codes[chords],
+            "times": self.times[chords],
+            "hop_length": int(entry['hop_length']),
+            "sr": int(entry['sr'])
+        }
+
+    def find_progression(self, chords, transpose=True):
+        """
+        Find every occurrence of a chord progression across the corpus
+
+        Repeated chords are collapsed first, so the progression must appear as
+        consecutive chord changes within one song.
+
+        Parameters:
+        -----------
+        chords : list
+            Chord names, e.g. ['Dm7', 'G7', 'Cmaj7'] for a ii-V-I
+        transpose : bool
+            Match the progression in any key (same intervals and qualities)
+
+        Returns:
+        --------
+        list
+            ``{"song_id", "time"}`` for each match, in storage order
+        """
+        pattern_roots, pattern_qualities = decode_chords(chord_codes(chords))
+
+        positions, song_rows = self._chord_changes()
+        length = len(chords)
+        n_starts = len(positions) - length + 1
+        if length == 0 or n_starts <= 0:
+            return []
+
+        roots, qualities = decode_chords(self.codes[positions])
+
+        # Every chord of a match has to come from the same song, and songs
+        # that were appended again only count through their latest copy
+        current = np.zeros(len(self.index), dtype=bool)
+        current[list(self._rows.values())] = True
+        match = song_rows[:n_starts] == song_rows[length - 1:length - 1 + n_starts]
+        match &= current[song_rows[:n_starts]]
+        for j in range(length):
+            match &= qualities[j:j + n_starts] == pattern_qualities[j]
+            if transpose:
+                interval = (pattern_roots[j] - pattern_roots[0]) % 12
+                match &= (roots[j:j + n_starts] - roots[:n_starts]) % 12 == interval
+            else:
+                match &= roots[j:j + n_starts] == pattern_roots[j]
+
+        hits = np.flatnonzero(match)
+        song_ids = self.index['song_id'][song_rows[hits]]
+        times = self.times[positions[hits]]
+        return [
+            {"song_id": song_id.decode(), "time": round(float(time), 3)}
+            for song_id, time in zip(song_ids, times)
+        ]
+
+    def songs_with_progression(self, chords, transpose=True):
+        """Return the sorted ids of all songs containing a chord progression"""
+        return sorted({match["song_id"] for match in self.find_progression(chords, transpose)})
+
+    def _chord_changes(self):
+        """
+        Return the positions of chord changes and the index row of their song
+
+        A position counts as a change if its code differs from the previous
+        one or it is the first chord of a song.
+        """
+        n_chords = len(self.codes)
+        if not n_chords:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        change = np.ones(n_chords, dtype=bool)
+        change[1:] = self.codes[1:] != self.codes[:-1]
+        starts = self.index['chord_start']
+        change[starts[starts < n_chords]] = True
+
+        positions = np.flatnonzero(change)
+        song_rows = np.searchsorted(starts, positions, side='right') - 1
+        return positions, song_rows
+
+    def _path(self, name):
+        return os.path.join(self.store_dir, name)
+
+    def _file_size(self, name):
+        path = self._path(name)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _memmap(self, name, dtype, shape):
+        # np.memmap cannot map an empty file
+        if not shape[0]:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self._path(name), dtype=dtype, mode='r', shape=shape)
+
+    def _truncate(self, name, size):
+        if self._file_size(name) > size:
+            os.truncate(self._path(name), size)
+
+    def _write(self, name, arrays):
+        with open(self._path(name), 'ab') as f:
+            for array in arrays:
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
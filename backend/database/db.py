@@ -1,13 +1,101 @@
+import threading
+from contextlib import contextmanager
 from flask_pymongo import PyMongo
-from pymongo import IndexModel, ASCENDING
+from pymongo import IndexModel, ASCENDING, DESCENDING, monitoring
+from ..metrics import MONGO_COMMAND_SECONDS, MONGO_COMMAND_FAILURES
+
+class QueryCounter(monitoring.CommandListener):
+    """
+    Counts MongoDB round trips issued by the current thread
+    
+    Registered as a pymongo command listener in ``init_db``. Use
+    ``count_queries()`` to measure a block of code:
+    
+        with count_queries() as queries:
+            client.get('/api/preferences/u1')
+        assert queries.count == 3
+    
+    Every command's latency is also recorded in the
+    ``mongo_command_duration_seconds`` metric.
+    """
+    
+    def __init__(self):
+        self._local = threading.local()
+    
+    def _scopes(self):
+        if not hasattr(self._local, "scopes"):
+            self._local.scopes = []
+        return self._local.scopes
+    
+    def start_scope(self):
+        """Start counting this thread's commands; returns the new scope"""
+        scope = QueryScope()
+        self._scopes().append(scope)
+        return scope
+    
+    def end_scope(self, scope):
+        """Stop counting into ``scope``"""
+        self._scopes().remove(scope)
+    
+    def started(self, event):
+        for scope in self._scopes():
+            scope.count += 1
+            scope.commands.append(event.command_name)
+    
+    def succeeded(self, event):
+        self._record(event)
+    
+    def failed(self, event):
+        self._record(event)
+        MONGO_COMMAND_FAILURES.inc(command=event.command_name)
+    
+    def _record(self, event):
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMAND_SECONDS.observe(seconds, command=event.command_name)
+        for scope in self._scopes():
+            scope.seconds += seconds
+
+class QueryScope:
+    """Round trips recorded inside one ``count_queries()`` block"""
+    
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.commands = []
+
+# Command listener shared by every client created through init_db
+query_counter = QueryCounter()
+
+@contextmanager
+def count_queries():
+    """Count the MongoDB commands sent by this thread inside the block"""
+    scope = query_counter.start_scope()
+    try:
+        yield scope
+    finally:
+        query_counter.end_scope(scope)
 
 # MongoDB connection instance
 mongo = PyMongo()
 
 def init_db(app):
-    """Initialize database connection and set up indexes"""
-    mongo.init_app(app)
+    """
+    Initialize database connection
+    
+    Indexes are created by the ``create-indexes`` command (see
+    ``ensure_indexes``) rather than on every boot, unless the app sets
+    MONGO_CREATE_INDEXES.
+    """
+    mongo.init_app(app, event_listeners=[query_counter])
     
+    if app.config.get('MONGO_CREATE_INDEXES'):
+        with app.app_context():
+            ensure_indexes()
+    
+    return mongo
+
+def ensure_indexes():
+    """Create the indexes used by the application (idempotent)"""
     # Create indexes for efficient queries
     songs_collection = mongo.db.songs
     songs_collection.create_indexes([
@@ -20,7 +108,37 @@ def init_db(app):
     chord_progressions = mongo.db.chord_progressions
     chord_progressions.create_indexes([
         IndexModel([("song_id", ASCENDING)]),
-        IndexModel([("progression_pattern", ASCENDING)])
+        IndexModel([("progression_pattern", ASCENDING)]),
+        # Upsert key for idempotent saves; older documents lack section_index
+        IndexModel(
+            [("song_id", ASCENDING), ("section_index", ASCENDING), ("progression_pattern", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"section_index": {"$exists": True}}
+        ),
+        # Recently saved songs, read by the recommender's incremental sync
+        IndexModel([("saved_at", ASCENDING)])
+    ])
+    
+    pattern_index = mongo.db.pattern_index
+    pattern_index.create_indexes([
+        IndexModel([("gram", ASCENDING), ("song_id", ASCENDING)], unique=True),
+        IndexModel([("song_id", ASCENDING)])
+    ])
+    
+    pattern_stats = mongo.db.pattern_stats
+    pattern_stats.create_indexes([
+        IndexModel([("pattern", ASCENDING)], unique=True),
+        IndexModel([("count", DESCENDING)])
+    ])
+    
+    jobs = mongo.db.jobs
+    jobs.create_indexes([
+        # One queued or running job per (type, track); finished jobs drop the key
+        IndexModel([("active_key", ASCENDING)], unique=True, sparse=True),
+        IndexModel([("status", ASCENDING), ("priority", DESCENDING), ("created_at", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)]),
+        IndexModel([("type", ASCENDING), ("spotify_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0)
     ])
     
     user_preferences = mongo.db.user_preferences
@@ -29,4 +147,8 @@ def init_db(app):
         IndexModel([("song_id", ASCENDING)])
     ])
     
-    return mongo
\ No newline at end of file
+    # Known words (lemmas) of each language learner
+    user_vocabulary = mongo.db.user_vocabulary
+    user_vocabulary.create_indexes([
+        IndexModel([("user_id", ASCENDING), ("language", ASCENDING), ("word", ASCENDING)], unique=True)
+    ])
\ No newline at end of file
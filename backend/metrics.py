@@ -0,0 +1,276 @@
+"""
+In-process metrics in the Prometheus text format, and a per-request profiler
+
+Histograms and counters live in ``REGISTRY`` and are rendered by the
+``/metrics`` endpoint registered in ``create_app``. Each process (e.g. each
+gunicorn worker) keeps its own values, so scrape every worker or run one
+process per target.
+
+Recording a value is one dict lookup, a bisect and a lock, so the
+instrumentation is always on. The sampling profiler only runs for requests
+that carry the ``X-Profile`` header with the configured token.
+"""
+import bisect
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as StackCounter, deque
+from contextlib import contextmanager
+
+from flask import has_request_context, request
+
+# Default latency buckets in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Buckets for per-request MongoDB round trips
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _escape_help(text):
+    # HELP text escapes backslashes and newlines, but not quotes
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+class Histogram:
+    """Cumulative histogram with optional labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: [bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a block (or of each call, used as a decorator)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        for key, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {counts[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._metrics.setdefault(name, Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time spent handling API requests",
+    ("endpoint", "method", "status"))
+HTTP_REQUEST_MONGO_QUERIES = REGISTRY.histogram(
+    "http_request_mongo_queries", "MongoDB round trips per request",
+    ("endpoint",), QUERY_COUNT_BUCKETS)
+HTTP_REQUEST_MONGO_SECONDS = REGISTRY.histogram(
+    "http_request_mongo_seconds", "Time spent in MongoDB per request", ("endpoint",))
+MONGO_COMMAND_SECONDS = REGISTRY.histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ("command",))
+MONGO_COMMAND_FAILURES = REGISTRY.counter(
+    "mongo_command_failures_total", "Failed MongoDB commands", ("command",))
+SPOTIFY_REQUEST_SECONDS = REGISTRY.histogram(
+    "spotify_request_duration_seconds", "Spotify API HTTP latency per attempt", ("endpoint", "status"))
+ANALYSIS_STAGE_SECONDS = REGISTRY.histogram(
+    "analysis_stage_duration_seconds", "Chord analysis time per stage", ("stage",))
+SERIALIZATION_SECONDS = REGISTRY.histogram(
+    "serialization_duration_seconds", "Time spent encoding responses as JSON", ("endpoint",))
+RESPONSE_CACHE_REQUESTS = REGISTRY.counter(
+    "response_cache_requests_total", "Cached endpoint requests by outcome (hit, revalidated, not_modified, miss)",
+    ("endpoint", "result"))
+TRANSLATION_SEGMENTS = REGISTRY.counter(
+    "translation_segments_total", "Distinct translated segments by where they came from (memory, store, backend)",
+    ("source",))
+TRANSLATION_BACKEND_SECONDS = REGISTRY.histogram(
+    "translation_backend_duration_seconds", "Latency of one batched translation backend call", ("backend",))
+
+def request_endpoint():
+    """Metric label for the current request: its URL rule, or 'none' outside requests"""
+    if not has_request_context():
+        return "none"
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread at a fixed interval
+
+    Samples are aggregated as folded stacks ("outer;inner count" lines), the
+    input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = StackCounter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+# Folded stacks of the most recent profiled requests, by profile id
+_profiles = deque(maxlen=20)
+_profiles_lock = threading.Lock()
+
+def save_profile(profiler):
+    """Keep a finished profile and return its id"""
+    profile_id = uuid.uuid4().hex[:12]
+    with _profiles_lock:
+        _profiles.append((profile_id, profiler.folded()))
+    return profile_id
+
+def get_profile(profile_id):
+    with _profiles_lock:
+        for saved_id, folded in _profiles:
+            if saved_id == profile_id:
+                return folded
+    return None
+
+def init_metrics(app):
+    """
+    Time every request and register the ``/metrics`` endpoints
+
+    Per request, the handler time, MongoDB round trips and MongoDB time are
+    recorded under the matched URL rule. If PROFILE_TOKEN is set, a request
+    sent with ``X-Profile: <token>`` is sampled by ``SamplingProfiler``; the
+    response carries an ``X-Profile-Id`` header and the folded stacks can be
+    fetched from ``/metrics/profiles/<id>``.
+    """
+    from flask import g, Response
+    from .database.db import query_counter
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        g.query_scope = query_counter.start_scope()
+
+        token = app.config.get('PROFILE_TOKEN')
+        if token and request.headers.get('X-Profile') == token:
+            g.profiler = SamplingProfiler(threading.get_ident()).start()
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'metrics_start' not in g:
+            return response
+        endpoint = request_endpoint()
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.metrics_start, endpoint=endpoint,
+                                     method=request.method, status=response.status_code)
+        HTTP_REQUEST_MONGO_QUERIES.observe(g.query_scope.count, endpoint=endpoint)
+        HTTP_REQUEST_MONGO_SECONDS.observe(g.query_scope.seconds, endpoint=endpoint)
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            response.headers['X-Profile-Id'] = save_profile(profiler.stop())
+        return response
+
+    @app.teardown_request
+    def end_request_metrics(exc):
+        scope = g.pop('query_scope', None)
+        if scope is not None:
+            query_counter.end_scope(scope)
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.stop()
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/metrics/profiles/<profile_id>')
+    def profile(profile_id):
+        folded = get_profile(profile_id)
+        if folded is None:
+            return Response("Profile not found\n", status=404, mimetype='text/plain')
+        return Response(folded, mimetype='text/plain')
@@ -1,10 +1,19 @@
 import numpy as np
-from librosa.core import load, cqt
-from librosa.feature import chroma_cqt
-from librosa.chord import chord_detect
-import joblib
+import hashlib
 import os
+import time
 from ..database.db import mongo
+from .pattern_index import PatternIndex, sequence_from_analysis
+from .pattern_stats import COMMON_PROGRESSIONS, PatternStats
+from .key_estimator import KEY_PROFILE_ID, LOCAL_KEY_SECONDS, estimate_key, estimate_local_keys
+from bson import ObjectId
+from datetime import datetime, timedelta
+from pymongo import DeleteMany, UpdateOne
+from pymongo.errors import DuplicateKeyError
+import uuid
+from collections import Counter
+from ..database.cache_versions import ANALYSES_SCOPE, bump_versions, song_scope
+from ..metrics import ANALYSIS_STAGE_SECONDS
 
 # Map of note indices to chord names
 NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
@@ -22,173 +31,663 @@ CHORD_TYPES = {
     'min7': [0, 3, 7, 10],   # Minor seventh (e.g., Cm7)
 }
 
-# Map of numeric chord degrees to roman numerals
-ROMAN_NUMERALS = {
-    1: 'I', 2: 'II', 3: 'III', 4: 'IV', 5: 'V', 6: 'VI', 7: 'VII'
+# Suffix used when rendering each chord type as a chord name
+CHORD_SUFFIXES = {
+    'major': '',
+    'minor': 'm',
+    'dim': 'dim',
+    'aug': 'aug',
+    'sus4': 'sus4',
+    'sus2': 'sus2',
+    '7': '7',
+    'maj7': 'maj7',
+    'min7': 'm7',
 }
 
+# Chord types rendered with a lower-case roman numeral
+MINOR_QUALITIES = {'minor', 'dim', 'min7'}
+
+# Ordered list of chord types; a template's quality is an index into this list
+QUALITY_NAMES = list(CHORD_TYPES)
+
+# Seconds before an unreleased analysis claim can be taken over
+ANALYSIS_CLAIM_TTL = 300
+
+# Roman numeral of each interval above the tonic, spelled against the major
+# scale so borrowed chords read as in 'i-bVI-bIII-bVII'
+DEGREE_NUMERALS = ['I', 'bII', 'II', 'bIII', 'III', 'IV', 'bV', 'V', 'bVI', 'VI', 'bVII', 'VII']
+
+# Suffix appended to the roman numeral of each chord type
+ROMAN_SUFFIXES = {
+    'major': '',
+    'minor': '',
+    'dim': 'dim',
+    'aug': '+',
+    'sus4': 'sus4',
+    'sus2': 'sus2',
+    '7': '7',
+    'maj7': 'maj7',
+    'min7': '7',
+}
+
+# Chords per progression returned by ``identify_progressions``
+PROGRESSION_LENGTH = 4
+
+def _build_chord_templates():
+    """
+    Build unit-norm chroma templates for every root and chord type
+
+    Row ``quality * 12 + root`` holds the template for that chord, so the
+    whole vocabulary can be scored against many windows with one matmul.
+    """
+    n_types = len(QUALITY_NAMES)
+    templates = np.zeros((n_types * 12, 12), dtype=np.float32)
+    for q, name in enumerate(QUALITY_NAMES):
+        for root in range(12):
+            pitches = [(root + interval) % 12 for interval in CHORD_TYPES[name]]
+            templates[q * 12 + root, pitches] = 1.0
+    templates /= np.linalg.norm(templates, axis=1, keepdims=True)
+    
+    roots = np.tile(np.arange(12, dtype=np.int8), n_types)
+    qualities = np.repeat(np.arange(n_types, dtype=np.int8), 12)
+    return templates, roots, qualities
+
+CHORD_TEMPLATES, TEMPLATE_ROOTS, TEMPLATE_QUALITIES = _build_chord_templates()
+
+# Identifies the template vocabulary in cache keys, so editing CHORD_TYPES
+# invalidates cached chord results
+TEMPLATE_SET_ID = hashlib.blake2b(CHORD_TEMPLATES.tobytes(), digest_size=8).hexdigest()
+
+# Record layout used to store chord arrays in a single .npy file
+CHORD_ARRAY_DTYPE = np.dtype([
+    ('root', np.int8), ('quality', np.int8), ('time', np.float32), ('score', np.float32), ('key', np.int8)
+])
+
+def pack_chord_arrays(chords):
+    """Pack a dict of chord arrays into one structured array"""
+    packed = np.empty(len(chords["root"]), dtype=CHORD_ARRAY_DTYPE)
+    for field in CHORD_ARRAY_DTYPE.names:
+        packed[field] = chords[field]
+    return packed
+
+def unpack_chord_arrays(packed):
+    """Inverse of ``pack_chord_arrays``"""
+    return {field: packed[field] for field in CHORD_ARRAY_DTYPE.names}
+
+def encode_chords(root, quality):
+    """
+    Combine root and quality arrays into int16 chord codes
+
+    A chord's code is its row in ``CHORD_TEMPLATES`` (``quality * 12 + root``).
+    """
+    return np.asarray(quality, dtype=np.int16) * 12 + np.asarray(root, dtype=np.int16)
+
+def decode_chords(codes):
+    """Split chord codes back into (root, quality) arrays"""
+    codes = np.asarray(codes)
+    return codes % 12, codes // 12
+
+def chord_name(root, quality):
+    """Render a root index and quality index as a chord name (e.g. 'C#m7')"""
+    return NOTE_NAMES[int(root)] + CHORD_SUFFIXES[QUALITY_NAMES[int(quality)]]
+
+def parse_chord_name(chord):
+    """
+    Split a chord name into its root index and chord type
+
+    The longest matching suffix wins, so 'Cmaj7' is parsed as a major seventh
+    rather than a minor chord.
+    """
+    for name, suffix in sorted(CHORD_SUFFIXES.items(), key=lambda item: -len(item[1])):
+        root = chord[:len(chord) - len(suffix)] if suffix else chord
+        if chord.endswith(suffix) and root in NOTE_NAMES:
+            return NOTE_NAMES.index(root), name
+    raise ValueError(f"Unrecognized chord name: {chord}")
+
+def _build_name_tables():
+    """
+    Build the chord-code lookup tables
+
+    Returns the chord name of every code, and the roman numeral of every
+    key-relative code (see ``relative_codes``), both as string arrays indexed
+    by code.
+    """
+    names = []
+    numerals = []
+    for quality in QUALITY_NAMES:
+        for root in range(12):
+            names.append(NOTE_NAMES[root] + CHORD_SUFFIXES[quality])
+            numeral = DEGREE_NUMERALS[root]
+            if quality in MINOR_QUALITIES:
+                numeral = numeral.lower()
+            numerals.append(numeral + ROMAN_SUFFIXES[quality])
+    return np.array(names), np.array(numerals)
+
+CHORD_NAMES, ROMAN_NAMES = _build_name_tables()
+
+# Chord code of every chord name, for chords given by name at the API edge
+CHORD_CODES = {name: code for code, name in enumerate(CHORD_NAMES.tolist())}
+
+def chord_codes(chords):
+    """Encode a list of chord names (e.g. ['Am', 'F', 'C', 'G']) as chord codes"""
+    try:
+        return np.array([CHORD_CODES[chord] for chord in chords], dtype=np.int16)
+    except KeyError as e:
+        raise ValueError(f"Unrecognized chord name: {e.args[0]}") from None
+
+def parse_key(key):
+    """Return the tonic index of a key given by name ('A', 'F#m') or index"""
+    if isinstance(key, (int, np.integer)):
+        return int(key) % 12
+    root, _ = parse_chord_name(key)
+    return root
+
+def relative_codes(codes, tonic):
+    """
+    Transpose chord codes so the tonic becomes root 0
+
+    Key-relative codes use the same ``quality * 12 + interval`` layout as
+    chord codes, so progressions in any key compare as plain integers.
+    ``tonic`` may be an array broadcast against ``codes``, e.g. one local
+    key per chord.
+    """
+    roots, qualities = decode_chords(codes)
+    return encode_chords((roots - np.asarray(tonic)) % 12, qualities)
+
+def roman_numerals(codes, tonic):
+    """Return the roman numerals of chord codes in a key, as a string array"""
+    return ROMAN_NAMES[relative_codes(codes, tonic)]
+
+def beat_segments(beat_frames, n_frames, beats_per_segment=1):
+    """
+    Return the frame boundaries of segments starting on every ``beats_per_segment``-th beat
+
+    Segment ``i`` covers frames ``bounds[i]:bounds[i + 1]``. Frames before
+    the first beat form a segment of their own, and the last segment ends
+    at ``n_frames``. Returns None if no beat was tracked (e.g. ambient
+    audio), so chords fall back to fixed windows rather than one chord for
+    the whole track.
+    """
+    beats = np.asarray(beat_frames, dtype=np.int64)
+    if not len(beats):
+        return None
+    beats = beats[::beats_per_segment]
+    beats = beats[(beats > 0) & (beats < n_frames)]
+    return np.unique(np.concatenate([[0], beats, [n_frames]]))
+
+class _BlockDecoder:
+    """
+    Decode an audio file in one pass, serving forward-moving sample ranges
+    
+    Formats libsndfile can read (wav, flac, ogg) are read sequentially at
+    their native rate, keeping only the frames still needed by later
+    ranges; each range is then mixed down and resampled exactly as
+    ``librosa.load(offset=..., duration=...)`` would. Other formats (mp3,
+    m4a) fall back to audioread, which can only seek by decoding from the
+    start, so they are decoded once in full and sliced.
+    """
+    
+    def __init__(self, audio_file, sr):
+        import soundfile
+        
+        self.sr = sr
+        self.samples = None
+        try:
+            self.file = soundfile.SoundFile(audio_file)
+        except RuntimeError:
+            from librosa.core import load
+            
+            self.file = None
+            self.samples, _ = load(audio_file, sr=sr)
+            return
+        self.native_sr = self.file.samplerate
+        self.buffer = np.empty((0, self.file.channels), dtype=np.float32)
+        self.buffer_start = 0
+    
+    def read(self, start, n_samples):
+        """Return up to ``n_samples`` samples at ``sr`` starting at sample ``start``"""
+        if self.file is None:
+            return self.samples[start:start + n_samples]
+        
+        from librosa.core import resample, to_mono
+        
+        # Same frame arithmetic as librosa.load with offset and duration
+        lo = int(start / self.sr * self.native_sr)
+        hi = lo + int(n_samples / self.sr * self.native_sr)
+        if lo > self.buffer_start + len(self.buffer):
+            self.file.seek(lo)
+            self.buffer = self.buffer[:0]
+        else:
+            self.buffer = self.buffer[lo - self.buffer_start:]
+        self.buffer_start = lo
+        
+        missing = hi - lo - len(self.buffer)
+        if missing > 0:
+            frames = self.file.read(missing, dtype='float32', always_2d=True)
+            self.buffer = np.concatenate([self.buffer, frames])
+        
+        y = to_mono(self.buffer[:hi - lo].T)
+        if self.native_sr != self.sr:
+            y = resample(y, orig_sr=self.native_sr, target_sr=self.sr)
+        return y
+    
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
 class ChordAnalyzer:
     """Analyzes audio to detect chord progressions"""
     
-    def __init__(self, model_path=None):
-        """Initialize chord analyzer with optional pre-trained model"""
+    def __init__(self, model_path=None, cache=None, recommender=None):
+        """
+        Initialize chord analyzer with optional pre-trained model
+        
+        ``cache`` is an optional ``FeatureCache``; when set, chroma and chord
+        results are reused across calls for unchanged audio and parameters.
+        ``recommender`` is an optional ``ChordRecommender`` kept up to date
+        with every saved analysis.
+        """
         self.model = None
+        self.cache = cache
+        self.owner_id = uuid.uuid4().hex
+        self.recommender = recommender
+        self.pattern_index = PatternIndex()
+        self.pattern_stats = PatternStats(COMMON_PROGRESSIONS)
         if model_path and os.path.exists(model_path):
+            import joblib
             self.model = joblib.load(model_path)
     
-    def analyze_audio(self, audio_file, sr=22050):
+    def analyze_audio(self, audio_file, sr=22050, hop_length=512, window=10, beats_per_chord=None):
         """
         Analyze audio file to detect chords
         
+        By default one chord is detected per ``window`` frames. With
+        ``beats_per_chord`` set, beats are tracked and the chroma is averaged
+        per beat (1) or per bar (e.g. 4), so chords start on beats and far
+        fewer segments are scored.
+        
         Parameters:
         -----------
         audio_file : str
             Path to audio file
         sr : int
             Sample rate
+        hop_length : int
+            Chroma hop length in samples
+        window : int
+            Number of frames averaged per detected chord
+        beats_per_chord : int
+            Beats averaged per detected chord; None for fixed windows
             
         Returns:
         --------
         list
             List of detected chords with their timing
         """
-        # Load audio file
-        y, sr = load(audio_file, sr=sr)
+        result_key = None
+        if self.cache is not None:
+            result_key = self.cache.make_key(
+                self.cache.audio_hash(audio_file), 'chords',
+                sr=sr, hop_length=hop_length, window=window, templates=TEMPLATE_SET_ID,
+                keys=KEY_PROFILE_ID, beats_per_chord=beats_per_chord
+            )
+            cached = self.cache.get(result_key)
+            if cached is not None:
+                return self.chords_to_dicts(unpack_chord_arrays(cached))
         
-        # Extract chroma features
-        chroma = chroma_cqt(y=y, sr=sr)
+        # Extract chroma features (and beats)
+        segments = None
+        if beats_per_chord:
+            chroma, beat_frames = self.load_chroma(audio_file, sr=sr, hop_length=hop_length, beats=True)
+            segments = beat_segments(beat_frames, chroma.shape[1], beats_per_chord)
+        else:
+            chroma = self.load_chroma(audio_file, sr=sr, hop_length=hop_length)
         
         # Detect chords (simplified approach)
-        chords = self._detect_chords(chroma)
+        chords = self.detect_chord_arrays(chroma, window, hop_length, sr, segments)
+        
+        if result_key is not None:
+            self.cache.put(result_key, pack_chord_arrays(chords))
         
-        return chords
+        return self.chords_to_dicts(chords)
     
-    def _detect_chords(self, chroma):
+    def load_chroma(self, audio_file, sr=22050, hop_length=512, timings=None, beats=False):
         """
-        Detect chords from chroma features
+        Decode an audio file and compute its chroma, using the cache if set
+        
+        With ``beats=True``, beats are also tracked and (chroma, beat_frames)
+        is returned; beat frames index the chroma's columns. The audio is
+        decoded once for both, and each is cached separately.
         
-        Note: This is a simplified implementation. A real-world implementation
-        would use more sophisticated chord detection algorithms.
+        If ``timings`` is a dict, seconds spent decoding, computing the
+        chroma and tracking beats are added under ``decode``, ``chroma`` and
+        ``beats``.
         """
-        # For demo purposes, just find the strongest notes
-        # and map to major/minor chords
-        num_frames = chroma.shape[1]
-        detected = []
+        chroma_key = beats_key = None
+        chroma = beat_frames = None
+        if self.cache is not None:
+            audio_hash = self.cache.audio_hash(audio_file)
+            chroma_key = self.cache.make_key(audio_hash, 'chroma', sr=sr, hop_length=hop_length)
+            chroma = self.cache.get(chroma_key)
+            if beats:
+                beats_key = self.cache.make_key(audio_hash, 'beats', sr=sr, hop_length=hop_length)
+                beat_frames = self.cache.get(beats_key)
         
-        for i in range(0, num_frames, 10):  # Analyze every 10 frames
-            if i+10 > num_frames:
-                break
+        if chroma is None or (beats and beat_frames is None):
+            # librosa (with numba and scipy) is only imported once audio is analyzed
+            from librosa.core import load
+            
+            # Load audio file
+            start = time.perf_counter()
+            y, sr = load(audio_file, sr=sr)
+            self._record_stage('decode', time.perf_counter() - start, timings)
+            
+            if chroma is None:
+                from librosa.feature import chroma_cqt
                 
-            # Get average chroma over window
-            window = np.mean(chroma[:, i:i+10], axis=1)
+                start = time.perf_counter()
+                chroma = chroma_cqt(y=y, sr=sr, hop_length=hop_length).astype(np.float32)
+                self._record_stage('chroma', time.perf_counter() - start, timings)
+                if chroma_key is not None:
+                    self.cache.put(chroma_key, chroma)
             
-            # Find the strongest note
-            root = np.argmax(window)
-            root_name = NOTE_NAMES[root]
+            if beats and beat_frames is None:
+                from librosa.beat import beat_track
+                
+                start = time.perf_counter()
+                _, beat_frames = beat_track(y=y, sr=sr, hop_length=hop_length)
+                beat_frames = np.asarray(beat_frames, dtype=np.int32)
+                self._record_stage('beats', time.perf_counter() - start, timings)
+                if beats_key is not None:
+                    self.cache.put(beats_key, beat_frames)
+        
+        return (chroma, beat_frames) if beats else chroma
+    
+    def _record_stage(self, stage, seconds, timings=None):
+        ANALYSIS_STAGE_SECONDS.observe(seconds, stage=stage)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+    
+    def analyze_audio_stream(self, audio_file, sr=22050, hop_length=512, window=10,
+                             block_windows=200, context_frames=96):
+        """
+        Analyze an audio file block by block, yielding chords as they are found
+        
+        The file is analyzed in blocks of ``block_windows * window`` frames.
+        Each block is read with ``context_frames`` of extra audio on both
+        sides so the CQT filters see the same signal as in a full-file pass;
+        the context frames are discarded after chroma extraction. Formats
+        libsndfile can read are decoded in a single sequential pass and peak
+        memory is bounded by the block size, not the track length; other
+        formats are decoded once in full (see ``_BlockDecoder``).
+        
+        Chord times match ``analyze_audio`` exactly. Per-block resampling
+        perturbs the chroma slightly near block boundaries, so chord scores
+        agree with the full-file path to within 5e-3; a chord label can only
+        differ where two templates score within that margin of each other.
+        
+        Parameters:
+        -----------
+        audio_file : str
+            Path to audio file
+        sr : int
+            Sample rate
+        hop_length : int
+            Chroma hop length in samples
+        window : int
+            Number of frames averaged per detected chord
+        block_windows : int
+            Number of chord windows decoded per block
+        context_frames : int
+            Frames of overlap read on each side of a block
             
-            # Check if it's likely a major or minor chord
-            major_strength = window[root] + window[(root+4) % 12] + window[(root+7) % 12]
-            minor_strength = window[root] + window[(root+3) % 12] + window[(root+7) % 12]
+        Yields:
+        -------
+        dict
+            Detected chord with its timing, in the same format as ``analyze_audio``
+        """
+        from librosa.feature import chroma_cqt
+        
+        block_frames = block_windows * window
+        block = 0
+        decoder = _BlockDecoder(audio_file, sr)
+        
+        try:
+            while True:
+                first_frame = block * block_frames
+                lead = min(context_frames, first_frame)
+                n_samples = (lead + block_frames + context_frames) * hop_length
+                
+                y = decoder.read((first_frame - lead) * hop_length, n_samples)
+                if len(y) <= lead * hop_length:
+                    break
+                
+                chroma = chroma_cqt(y=y, sr=sr, hop_length=hop_length)
+                chords = self.detect_chord_arrays(
+                    chroma[:, lead:lead + block_frames], window, hop_length, sr
+                )
+                chords["time"] = chords["time"] + first_frame * hop_length / sr
+                
+                for chord in self.chords_to_dicts(chords):
+                    yield chord
+                
+                # A short read means we have reached the end of the file
+                if len(y) < n_samples:
+                    break
+                block += 1
+        finally:
+            decoder.close()
+    
+    def _detect_chords(self, chroma, window=10, hop_length=512, sr=22050):
+        """
+        Detect chords from chroma features
+        
+        Thin wrapper around ``detect_chord_arrays`` that converts the result
+        to the list-of-dicts format used by the API.
+        """
+        return self.chords_to_dicts(self.detect_chord_arrays(chroma, window, hop_length, sr))
+    
+    def detect_chord_arrays(self, chroma, window=10, hop_length=512, sr=22050, segments=None):
+        """
+        Detect chords from chroma features as compact arrays
+        
+        Parameters:
+        -----------
+        chroma : np.ndarray
+            Chroma matrix of shape (12, n_frames)
+        window : int
+            Number of frames averaged per detected chord
+        hop_length : int
+            Hop length (in samples) used to compute the chroma
+        sr : int
+            Sample rate used to compute the chroma
+        segments : np.ndarray
+            Frame boundaries of the segments to detect chords in (see
+            ``beat_segments``); None for fixed windows of ``window`` frames
             
-            if major_strength > minor_strength:
-                chord = root_name
+        Returns:
+        --------
+        dict
+            Arrays ``root``, ``quality`` (index into ``QUALITY_NAMES``),
+            ``time`` (seconds), ``score`` (template cosine similarity) and
+            ``key`` (local key, see ``estimate_local_keys``), one entry per
+            window or segment
+        """
+        return self.detect_chords_batch([chroma], window, hop_length, sr, [segments])[0]
+    
+    @ANALYSIS_STAGE_SECONDS.time(stage='detect')
+    def detect_chords_batch(self, chromas, window=10, hop_length=512, sr=22050, segments=None):
+        """
+        Detect chords for several chroma matrices in a single pass
+        
+        Every window of every track is scored against all chord templates with
+        one matrix multiply; trailing frames that do not fill a window are
+        dropped. ``segments`` optionally gives each chroma's segment
+        boundaries (e.g. beats, see ``beat_segments``) to average over
+        instead of fixed windows; chord times are then the segment starts.
+        The local key of each window is estimated from the same window means
+        over ``LOCAL_KEY_SECONDS`` of context.
+        
+        Returns:
+        --------
+        list
+            One dict of arrays per input chroma (see ``detect_chord_arrays``)
+        """
+        blocks = []
+        starts = []
+        spans = []
+        for i, chroma in enumerate(chromas):
+            bounds = segments[i] if segments is not None else None
+            if bounds is None:
+                n_windows = chroma.shape[1] // window
+                frames = np.asarray(chroma[:, :n_windows * window], dtype=np.float32)
+                # (12, n_windows, window) -> mean over each window -> (n_windows, 12)
+                blocks.append(frames.reshape(12, n_windows, window).mean(axis=2).T)
+                starts.append(np.arange(n_windows) * window)
+                spans.append(n_windows * window)
             else:
-                chord = f"{root_name}m"
-                
-            detected.append({
-                "time": i * 512 / 22050,  # Approximate time in seconds
-                "chord": chord
+                bounds = np.asarray(bounds, dtype=np.int64)
+                frames = np.asarray(chroma, dtype=np.float32)
+                if len(bounds) > 1:
+                    sums = np.add.reduceat(frames, bounds[:-1], axis=1)
+                    blocks.append((sums / np.diff(bounds)).T)
+                else:
+                    blocks.append(np.zeros((0, 12), dtype=np.float32))
+                starts.append(bounds[:-1])
+                spans.append(bounds[-1] - bounds[0])
+        
+        windows = np.concatenate(blocks) if blocks else np.zeros((0, 12), dtype=np.float32)
+        norms = np.linalg.norm(windows, axis=1, keepdims=True)
+        windows = windows / np.maximum(norms, 1e-8)
+        
+        scores = windows @ CHORD_TEMPLATES.T
+        best = np.argmax(scores, axis=1)
+        best_scores = scores[np.arange(len(best)), best]
+        
+        results = []
+        start = 0
+        frame_time = hop_length / sr
+        for block, window_starts, span in zip(blocks, starts, spans):
+            count = len(window_starts)
+            # Local key context in windows, from the mean window length
+            key_context = max(1, int(round(LOCAL_KEY_SECONDS * count / max(span * frame_time, 1e-8))))
+            
+            idx = best[start:start + count]
+            results.append({
+                "root": TEMPLATE_ROOTS[idx],
+                "quality": TEMPLATE_QUALITIES[idx],
+                "time": (window_starts * frame_time).astype(np.float32),
+                "score": best_scores[start:start + count],
+                "key": estimate_local_keys(block, key_context).astype(np.int8)
             })
+            start += count
         
-        return detected
+        return results
     
-    def identify_progressions(self, chords, key="C"):
+    def chords_to_dicts(self, chords):
+        """Convert chord arrays to a list of ``{"time", "chord", "score", "key"}`` dicts"""
+        names = CHORD_NAMES[encode_chords(chords["root"], chords["quality"])].tolist()
+        keys = CHORD_NAMES[chords["key"]].tolist()
+        return [
+            {
+                "time": round(time, 3),
+                "chord": name,
+                "score": round(score, 4),
+                "key": key
+            }
+            for name, time, score, key in zip(
+                names, np.asarray(chords["time"]).tolist(), np.asarray(chords["score"]).tolist(), keys
+            )
+        ]
+    
+    def detect_key(self, chroma):
+        """
+        Estimate the key of a track from its chroma matrix
+        
+        Returns the key name ('C', 'F#m'), or None for a silent track. This
+        costs one (n_frames, 12) sum and a 24-key correlation, a negligible
+        fraction of the CQT.
+        """
+        key, _ = estimate_key(np.asarray(chroma).T)
+        return None if key is None else str(CHORD_NAMES[key])
+    
+    @ANALYSIS_STAGE_SECONDS.time(stage='progressions')
+    def identify_progressions(self, chords, key=None):
         """
         Identify chord progressions and their patterns
         
+        Chords are handled as chord codes and converted to roman numerals
+        with one table lookup; consecutive runs of ``PROGRESSION_LENGTH``
+        chords form a progression. Without an explicit ``key``, each chord
+        is numbered against its detected local key, so modulations are
+        followed; chords without detected keys are read in C.
+        
         Parameters:
         -----------
-        chords : list
-            List of detected chords
-        key : str
-            Key of the song
+        chords : dict or list
+            Chord arrays from ``detect_chord_arrays``, or the list of chord
+            dicts returned by ``analyze_audio``
+        key : str or int
+            Key of the song, by name ('C', 'F#m') or tonic index; overrides
+            the detected local keys
             
         Returns:
         --------
         list
             List of chord progressions with roman numeral notation
         """
-        # Convert key to index (0 = C, 1 = C#, etc.)
-        key_idx = NOTE_NAMES.index(key.upper().replace('M', ''))
+        if isinstance(chords, dict):
+            codes = encode_chords(chords["root"], chords["quality"])
+            times = np.asarray(chords["time"])
+            local_keys = chords.get("key")
+        else:
+            codes = chord_codes([chord_info["chord"] for chord_info in chords])
+            times = np.array([chord_info["time"] for chord_info in chords], dtype=np.float64)
+            local_keys = None
+            if chords and all(chord_info.get("key") for chord_info in chords):
+                local_keys = chord_codes([chord_info["key"] for chord_info in chords])
         
-        # Group chords into potential progressions (simplified approach)
-        progressions = []
-        current_prog = []
+        # Key indices share the chord-code layout, so the tonic is the decoded root
+        if key is not None:
+            tonic = parse_key(key)
+        elif local_keys is not None:
+            tonic, _ = decode_chords(local_keys)
+        else:
+            tonic = 0
         
-        for i, chord_info in enumerate(chords):
-            chord = chord_info["chord"]
-            
-            # Extract root note and chord type
-            if 'm' in chord:
-                root = chord.replace('m', '')
-                chord_type = 'minor'
-            else:
-                root = chord
-                chord_type = 'major'
-                
-            # Get chord degree relative to key
-            root_idx = NOTE_NAMES.index(root)
-            degree = (root_idx - key_idx) % 12
-            
-            # Convert to scale degree (1-7)
-            # This is a simplification; real implementation would account for diatonic scale
-            scale_degree = degree % 7 + 1
-            
-            # Get roman numeral
-            roman = ROMAN_NUMERALS[scale_degree]
-            
-            # Adjust casing for minor chords
-            if chord_type == 'minor':
-                roman = roman.lower()
-                
-            current_prog.append(roman)
-            
-            # Check if we've found a complete progression (4 chords is common)
-            if len(current_prog) == 4 or i == len(chords) - 1:
-                if current_prog:
-                    progression_str = "-".join(current_prog)
-                    progressions.append({
-                        "chords": current_prog.copy(),
-                        "pattern": progression_str,
-                        "start_time": chords[i-len(current_prog)+1]["time"] if i-len(current_prog)+1 >= 0 else 0
-                    })
-                current_prog = []
+        numerals = roman_numerals(codes, tonic).tolist()
+        
+        progressions = []
+        for start in range(0, len(numerals), PROGRESSION_LENGTH):
+            block = numerals[start:start + PROGRESSION_LENGTH]
+            progressions.append({
+                "chords": block,
+                "pattern": "-".join(block),
+                "start_time": round(float(times[start]), 3)
+            })
         
         return progressions
     
     def get_common_progressions(self):
         """Get list of common chord progressions"""
-        return [
-            {"pattern": "I-V-vi-IV", "name": "Pop Progression", "examples": ["Let It Be", "Don't Stop Believin'"]},
-            {"pattern": "I-IV-V", "name": "Blues Progression", "examples": ["Sweet Home Alabama", "Twist and Shout"]},
-            {"pattern": "ii-V-I", "name": "Jazz Progression", "examples": ["Autumn Leaves", "Fly Me to the Moon"]},
-            {"pattern": "vi-IV-I-V", "name": "Axis of Awesome", "examples": ["Let It Be", "No Woman No Cry"]},
-            {"pattern": "I-vi-IV-V", "name": "50s Progression", "examples": ["Stand By Me", "Earth Angel"]},
-            {"pattern": "i-bVI-bIII-bVII", "name": "Andalusian Cadence", "examples": ["Hit the Road Jack", "Sultans of Swing"]}
-        ]
+        # Copies, as callers add fields to them
+        return [dict(p, examples=list(p["examples"])) for p in COMMON_PROGRESSIONS]
     
-    def analyze_track_from_spotify(self, spotify_api, track_id):
+    def analyze_track_from_spotify(self, spotify_api, track_id, features=None, analysis=None):
         """
         Analyze a track from Spotify API
         
         This is a simplified implementation since we can't directly access audio.
-        It uses the Spotify audio features and sections analysis.
+        It uses the Spotify audio features and sections analysis. Pass
+        ``features``/``analysis`` if they were already fetched.
         """
         # Get audio features
-        features = spotify_api.get_audio_features(track_id)
+        if features is None:
+            features = spotify_api.get_audio_features(track_id)
         
         # Get audio analysis for sections
-        analysis = spotify_api.get_audio_analysis(track_id)
+        if analysis is None:
+            analysis = spotify_api.get_audio_analysis(track_id)
         
         # Extract key and mode
         key_idx = features.get('key', 0)  # 0 = C, 1 = C#, etc.
@@ -226,23 +725,138 @@ class ChordAnalyzer:
             "progressions": progressions
         }
     
-    def save_analysis_to_db(self, song_id, analysis_results):
-        """Save chord analysis results to the database"""
-        # Extract progressions
-        progressions = analysis_results.get("progressions", [])
-        
-        # Save each progression
-        for prog in progressions:
-            chord_prog = {
+    def build_progression_documents(self, song_id, analysis_results):
+        """Build the chord_progressions documents for one song's analysis results"""
+        return [
+            {
                 "song_id": song_id,
+                "section_index": i,
                 "progression": prog["chords"],
                 "progression_pattern": prog["pattern"],
                 "section_type": "section",  # Could be more specific in a real app
                 "frequency": 1,
-                "confidence": prog.get("confidence", 0.8)
+                "confidence": prog.get("confidence", 0.8),
+                # Key the song was counted under in pattern_stats
+                "key": analysis_results.get("key")
             }
-            
-            # Insert into database
-            mongo.db.chord_progressions.insert_one(chord_prog)
+            for i, prog in enumerate(analysis_results.get("progressions", []))
+        ]
+    
+    def claim_analysis(self, song_id, ttl=ANALYSIS_CLAIM_TTL):
+        """
+        Claim the right to analyze a song
+        
+        Returns True if this analyzer now holds the claim, False if another
+        worker holds an unexpired claim for the same song. Claims expire
+        after ``ttl`` seconds so a crashed worker cannot block a song forever.
+        """
+        now = datetime.utcnow()
+        try:
+            # Matches only an expired claim; otherwise the upsert collides on _id
+            mongo.db.analysis_claims.update_one(
+                {"_id": song_id, "expires_at": {"$lt": now}},
+                {"$set": {"owner": self.owner_id, "expires_at": now + timedelta(seconds=ttl)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+    
+    def release_analysis(self, song_id):
+        """Release a claim taken with ``claim_analysis``"""
+        mongo.db.analysis_claims.delete_one({"_id": song_id, "owner": self.owner_id})
+    
+    def save_analysis_to_db(self, song_id, analysis_results, song=None):
+        """
+        Save chord analysis results to the database
+        
+        ``song`` is the song document, if the caller already has it; it is
+        used to update the per-language statistics in ``pattern_stats``.
+        """
+        return self.save_analyses_to_db([(song_id, analysis_results, song)])
+    
+    @ANALYSIS_STAGE_SECONDS.time(stage='save')
+    def save_analyses_to_db(self, entries):
+        """
+        Save analysis results for many songs with bulk writes
+        
+        Progressions are upserted on (song_id, section_index, pattern) and a
+        song's progressions missing from its new analysis are deleted in the
+        same ``bulk_write``, so each song ends up with exactly its latest
+        set. Pattern statistics are moved from the song's previous patterns
+        and key to the new ones, so re-saving never inflates them.
+        
+        Parameters:
+        -----------
+        entries : list
+            (song_id, analysis_results, song) tuples; ``song`` may be None
+        """
+        entries = list(entries)
+        if not entries:
+            return True
+        
+        # The progressions each song is currently saved (and counted) with
+        saved = {}
+        for doc in mongo.db.chord_progressions.find(
+            {"song_id": {"$in": [song_id for song_id, _, _ in entries]}},
+            {"song_id": 1, "section_index": 1, "progression_pattern": 1, "key": 1}
+        ):
+            saved.setdefault(doc["song_id"], []).append(doc)
+        
+        operations = []
+        saved_at = datetime.utcnow()
+        for song_id, analysis_results, _ in entries:
+            keys = set()
+            for doc in self.build_progression_documents(song_id, analysis_results):
+                # Lets other processes' indexes load just the recently saved songs
+                doc["saved_at"] = saved_at
+                key = {field: doc[field] for field in ("song_id", "section_index", "progression_pattern")}
+                operations.append(UpdateOne(key, {"$set": doc}, upsert=True))
+                keys.add((doc["section_index"], doc["progression_pattern"]))
+            stale = [
+                doc["_id"] for doc in saved.get(song_id, [])
+                if (doc.get("section_index"), doc["progression_pattern"]) not in keys
+            ]
+            if stale:
+                operations.append(DeleteMany({"_id": {"$in": stale}}))
+        
+        if operations:
+            mongo.db.chord_progressions.bulk_write(operations, ordered=False)
+        
+        # Keep the n-gram pattern index (and recommender, if any) in sync with the saved sequences
+        sequences = [
+            (song_id, sequence_from_analysis(analysis_results)) for song_id, analysis_results, _ in entries
+        ]
+        self.pattern_index.index_songs(sequences)
+        if self.recommender is not None:
+            self.recommender.add_songs(sequences)
+        
+        # Update the materialized pattern statistics, fetching missing songs in one query
+        missing = [song_id for song_id, _, song in entries if not (song and song.get("spotify_id"))]
+        songs = {
+            str(song["_id"]): song
+            for song in mongo.db.songs.find(
+                {"_id": {"$in": [ObjectId(i) for i in missing if ObjectId.is_valid(i)]}},
+                {"title": 1, "artist": 1, "language": 1, "spotify_id": 1}
+            )
+        } if missing else {}
+        stats_entries = []
+        for song_id, analysis_results, song in entries:
+            previous = None
+            if song_id in saved:
+                # Progressions saved before keys were stored count under the new key
+                previous = (
+                    saved[song_id][0].get("key", analysis_results.get("key")),
+                    Counter(doc["progression_pattern"] for doc in saved[song_id])
+                )
+            stats_entries.append((song or songs.get(song_id) or {"_id": song_id}, analysis_results, previous))
+        self.pattern_stats.update_songs(stats_entries)
+        
+        # Invalidate cached song responses everywhere, and tell other processes' indexes
+        spotify_ids = {
+            (song or {}).get("spotify_id") or songs.get(song_id, {}).get("spotify_id")
+            for song_id, _, song in entries
+        }
+        bump_versions([ANALYSES_SCOPE] + [song_scope(spotify_id) for spotify_id in spotify_ids if spotify_id])
             
         return True
\ No newline at end of file
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+class FeatureCache:
+    """
+    Content-addressed on-disk cache for chroma matrices and chord results
+
+    Entries are stored as ``.npy`` files named after a hash of the audio
+    content and the analysis parameters, so they survive restarts, can be
+    shared between worker processes and can be memory-mapped on read. The
+    directory is kept under ``max_bytes`` by evicting the least recently
+    used entries (tracked through file modification times).
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3, mmap=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.mmap_mode = 'r' if mmap else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._audio_hashes = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def audio_hash(self, audio_file):
+        """Hash the content of an audio file, memoized on its size and mtime"""
+        stat = os.stat(audio_file)
+        memo_key = (os.path.abspath(audio_file), stat.st_size, stat.st_mtime_ns)
+        digest = self._audio_hashes.get(memo_key)
+        if digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            with open(audio_file, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+            digest = h.hexdigest()
+            self._audio_hashes[memo_key] = digest
+        return digest
+
+    def make_key(self, audio_hash, kind, **params):
+        """Build a cache key from the audio hash, entry kind and analysis parameters"""
+        param_str = ",".join(f"{name}={params[name]}" for name in sorted(params))
+        return hashlib.blake2b(f"{audio_hash}|{kind}|{param_str}".encode(), digest_size=20).hexdigest()
+
+    def get(self, key):
+        """Return the cached array for ``key`` (memory-mapped by default), or None"""
+        path = self._path(key)
+        try:
+            array = np.load(path, mmap_mode=self.mmap_mode)
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+        # Touch the entry so eviction treats it as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return array
+
+    def put(self, key, array):
+        """Store ``array`` under ``key``, evicting old entries if over budget"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # An entry rewritten under the same key replaces the old file's bytes
+        try:
+            old_size = os.path.getsize(path)
+        except FileNotFoundError:
+            old_size = 0
+
+        # Write to a temp file and rename so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        self._size += os.path.getsize(path) - old_size
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def stats(self):
+        """Return hit/miss counters and the current cache size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes
+        }
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npy")
+
+    def _entries(self):
+        """Yield (path, size, mtime) for every entry in the cache directory"""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.npy'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # Evicted by another process
+                yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        """Delete least recently used entries until the cache is under 90% of its budget"""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum(entry[1] for entry in entries)
+        target = self.max_bytes * 0.9
+
+        for path, entry_size, _ in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+        self._size = size
@@ -0,0 +1,184 @@
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument, ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+from ..database.db import mongo
+
+# Job priorities; higher runs first
+PRIORITY_INTERACTIVE = 10
+PRIORITY_BACKGROUND = 0
+
+# Seconds a running job stays leased to its worker before another may take it
+# over; workers renew the lease while the job runs, so this only bounds how
+# long a dead worker's job waits
+JOB_LEASE_SECONDS = 600
+
+# Leases are renewed this many times per lease period
+LEASE_RENEWALS = 3
+
+# Attempts before a failing job is marked failed instead of requeued
+MAX_ATTEMPTS = 3
+
+# Finished jobs are removed by a TTL index after this long
+JOB_RETENTION = timedelta(days=7)
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+class JobQueue:
+    """
+    Persistent priority queue of background jobs in the ``jobs`` collection
+
+    Jobs are deduplicated on (type, spotify_id): while a job is queued or
+    running it carries an ``active_key`` covered by a unique sparse index,
+    so enqueueing the same track again returns the existing job (raising
+    its priority if needed). Workers claim the highest-priority, oldest job
+    with one atomic ``find_one_and_update`` and hold it under a lease that
+    they ``renew`` while the job runs; a job whose worker died is picked up
+    again once the lease expires.
+    """
+
+    def __init__(self, lease_seconds=JOB_LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def enqueue(self, spotify_id, job_type="analyze_song", priority=PRIORITY_BACKGROUND):
+        """Queue a job for a track, or return the job already queued or running for it"""
+        active_key = f"{job_type}:{spotify_id}"
+        now = datetime.utcnow()
+
+        # A concurrent enqueue can win the upsert race; the retry then finds its job
+        for _ in range(3):
+            try:
+                return mongo.db.jobs.find_one_and_update(
+                    {"active_key": active_key},
+                    {
+                        "$setOnInsert": {
+                            "type": job_type,
+                            "spotify_id": spotify_id,
+                            "status": "queued",
+                            "attempts": 0,
+                            "created_at": now
+                        },
+                        "$max": {"priority": priority}
+                    },
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                continue
+        raise RuntimeError(f"Could not enqueue {active_key}")
+
+    def get(self, job_id):
+        """Return a job by id, or None"""
+        if not ObjectId.is_valid(job_id):
+            return None
+        return mongo.db.jobs.find_one({"_id": ObjectId(job_id)})
+
+    def latest(self, spotify_id, job_type="analyze_song"):
+        """Return the most recently created job for a track, or None (finished jobs expire)"""
+        return mongo.db.jobs.find_one(
+            {"type": job_type, "spotify_id": spotify_id},
+            sort=[("created_at", DESCENDING)]
+        )
+
+    def claim(self, worker_id, job_types=None):
+        """
+        Atomically take the next job to run, or return None if there is none
+
+        Queued jobs and running jobs whose lease has expired are eligible,
+        highest priority first and oldest first within a priority.
+        """
+        now = datetime.utcnow()
+        query = {"$or": [
+            {"status": "queued"},
+            {"status": "running", "lease_expires_at": {"$lt": now}}
+        ]}
+        if job_types:
+            query["type"] = {"$in": list(job_types)}
+
+        return mongo.db.jobs.find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "status": "running",
+                    "worker": worker_id,
+                    "started_at": now,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds)
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("priority", DESCENDING), ("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def renew(self, job):
+        """
+        Extend the lease of a claimed job from now
+
+        Returns False if the worker no longer holds the job (it finished, or
+        its lease expired and another worker took it over).
+        """
+        result = mongo.db.jobs.update_one(
+            {"_id": job["_id"], "worker": job.get("worker"), "status": "running"},
+            {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}}
+        )
+        return result.matched_count == 1
+
+    def complete(self, job, result=None):
+        """Mark a claimed job as done"""
+        return self._finish(job, {"status": "done", "result": result or {}})
+
+    def fail(self, job, error, retry=True):
+        """
+        Record a failed attempt
+
+        The job is requeued until it has been attempted ``max_attempts``
+        times, after which it is marked failed; with ``retry=False`` (an
+        error no retry can fix) it is marked failed at once.
+        """
+        if retry and job.get("attempts", 0) < self.max_attempts:
+            result = mongo.db.jobs.update_one(
+                {"_id": job["_id"], "worker": job.get("worker"), "status": "running"},
+                {"$set": {"status": "queued", "error": error}, "$unset": {"lease_expires_at": ""}}
+            )
+            return result.modified_count == 1
+        return self._finish(job, {"status": "failed", "error": error})
+
+    def counts(self):
+        """Return the number of jobs in each status"""
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        for row in mongo.db.jobs.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        return counts
+
+    def _finish(self, job, fields):
+        """Move a job to a final status, freeing its track for new jobs"""
+        now = datetime.utcnow()
+        fields.update(finished_at=now, expires_at=now + JOB_RETENTION)
+        # Only the worker holding the job may finish it; a worker whose lease
+        # expired and was taken over must not overwrite the new attempt
+        result = mongo.db.jobs.update_one(
+            {"_id": job["_id"], "worker": job.get("worker"), "status": "running"},
+            {"$set": fields, "$unset": {"active_key": "", "lease_expires_at": ""}}
+        )
+        return result.modified_count == 1
+
+def job_status(job):
+    """Return the public, JSON-serializable view of a job"""
+    def timestamp(name):
+        value = job.get(name)
+        return value.isoformat() + "Z" if value else None
+
+    return {
+        "job_id": str(job["_id"]),
+        "type": job.get("type"),
+        "spotify_id": job.get("spotify_id"),
+        "status": job.get("status"),
+        "priority": job.get("priority"),
+        "attempts": job.get("attempts", 0),
+        "created_at": timestamp("created_at"),
+        "started_at": timestamp("started_at"),
+        "finished_at": timestamp("finished_at"),
+        "error": job.get("error"),
+        "result": job.get("result")
+    }
@@ -0,0 +1,127 @@
+import hashlib
+
+import numpy as np
+
+# Krumhansl-Kessler probe-tone profiles, starting from the tonic
+MAJOR_PROFILE = [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88]
+MINOR_PROFILE = [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17]
+
+# Seconds of audio around each chord used to estimate its local key
+LOCAL_KEY_SECONDS = 20
+
+# Correlation a local key must gain over the song's key before it is used,
+# so relative and parallel keys do not flicker in and out
+LOCAL_KEY_MARGIN = 0.05
+
+# Pitch-class profiles with a standard deviation below this carry no key
+MIN_PROFILE_STD = 1e-6
+
+def _build_key_profiles():
+    """
+    Build z-scored profiles for the 24 major and minor keys
+
+    Row ``mode * 12 + tonic`` (mode 0 major, 1 minor) holds the profile of
+    that key, the same layout as chord codes, so a key index is also the
+    chord code of its tonic triad (C major is 0, A minor is 21).
+    """
+    profiles = np.zeros((24, 12), dtype=np.float32)
+    for mode, profile in enumerate((MAJOR_PROFILE, MINOR_PROFILE)):
+        for tonic in range(12):
+            profiles[mode * 12 + tonic] = np.roll(profile, tonic)
+    profiles -= profiles.mean(axis=1, keepdims=True)
+    profiles /= profiles.std(axis=1, keepdims=True)
+    return profiles
+
+KEY_PROFILES = _build_key_profiles()
+
+# Identifies the key model in cache keys
+KEY_PROFILE_ID = hashlib.blake2b(
+    KEY_PROFILES.tobytes() + repr((LOCAL_KEY_SECONDS, LOCAL_KEY_MARGIN)).encode(), digest_size=8
+).hexdigest()
+
+def key_correlations(profiles):
+    """
+    Correlate pitch-class profiles with all 24 key profiles in one matmul
+
+    Parameters:
+    -----------
+    profiles : np.ndarray
+        Array of shape (n, 12), e.g. summed chroma per window
+
+    Returns:
+    --------
+    tuple
+        (correlations, has_key): Pearson correlations of shape (n, 24), and
+        a boolean array that is False for flat profiles (silence)
+    """
+    profiles = np.asarray(profiles, dtype=np.float32)
+    centered = profiles - profiles.mean(axis=1, keepdims=True)
+    std = centered.std(axis=1, keepdims=True)
+    correlations = (centered / np.maximum(std, MIN_PROFILE_STD)) @ KEY_PROFILES.T / 12
+    return correlations, std[:, 0] >= MIN_PROFILE_STD
+
+def estimate_key(frames):
+    """
+    Estimate the key of a whole recording
+
+    Parameters:
+    -----------
+    frames : np.ndarray
+        Frame-major chroma of shape (n_frames, 12)
+
+    Returns:
+    --------
+    tuple
+        (key, correlation); key is None if the recording has no pitch content
+    """
+    correlations, has_key = key_correlations(np.asarray(frames).sum(axis=0, keepdims=True))
+    if not has_key[0]:
+        return None, 0.0
+    key = int(np.argmax(correlations[0]))
+    return key, float(correlations[0, key])
+
+def estimate_local_keys(frames, context, key=None, margin=LOCAL_KEY_MARGIN):
+    """
+    Estimate the key around every frame, to follow modulations
+
+    Each frame is scored over the ``context`` frames centered on it, with
+    window sums taken from one cumulative sum, so the cost is linear in
+    the number of frames. A frame keeps the recording's key unless another
+    key correlates better by more than ``margin``.
+
+    Parameters:
+    -----------
+    frames : np.ndarray
+        Frame-major chroma of shape (n_frames, 12), at any resolution (e.g.
+        one row per chord window)
+    context : int
+        Number of frames per window
+    key : int
+        Key of the whole recording; estimated if None
+    margin : float
+        Correlation gain needed to leave the recording's key
+
+    Returns:
+    --------
+    np.ndarray
+        int16 key index per frame (see ``KEY_PROFILES``)
+    """
+    frames = np.asarray(frames, dtype=np.float32)
+    n_frames = len(frames)
+    if key is None:
+        key, _ = estimate_key(frames)
+        if key is None:
+            key = 0
+    if not n_frames:
+        return np.zeros(0, dtype=np.int16)
+
+    sums = np.cumsum(np.vstack([np.zeros((1, 12), dtype=np.float32), frames]), axis=0)
+    half = max(int(context), 1) // 2
+    centers = np.arange(n_frames)
+    starts = np.clip(centers - half, 0, n_frames)
+    ends = np.clip(centers + half + 1, 0, n_frames)
+    correlations, has_key = key_correlations(sums[ends] - sums[starts])
+
+    best = np.argmax(correlations, axis=1)
+    gain = correlations[centers, best] - correlations[:, key]
+    return np.where(has_key & (gain > margin), best, key).astype(np.int16)
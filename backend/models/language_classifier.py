@@ -0,0 +1,356 @@
+import re
+import unicodedata
+
+import numpy as np
+from pymongo import UpdateOne
+from ..database.db import mongo
+from ..database.cache_versions import bump_versions, song_scope
+from .pattern_stats import COMMON_PROGRESSIONS, PatternStats
+
+# Character n-gram orders used as features
+NGRAM_ORDERS = (1, 2, 3)
+
+# Hash buckets of the n-gram features
+FEATURE_BUCKETS = 1 << 14
+
+# Additive smoothing of the per-language n-gram probabilities
+SMOOTHING = 0.1
+
+# Texts with fewer letters than this carry too little evidence to classify
+MIN_LETTERS = 4
+
+# Mean log-likelihood lead per n-gram the best language needs over the runner-up
+MIN_MARGIN = 0.04
+
+# Label of texts that cannot be classified
+UNKNOWN_LANGUAGE = "Unknown"
+
+# Songs classified per batch by ``reclassify_songs``
+RECLASSIFY_BATCH_SIZE = 1000
+
+# Training text per language: everyday and song-lyric sentences, so the
+# frequent words and their spellings dominate each language's n-grams
+TRAINING_TEXT = {
+    "English": """
+        I love you baby and I always will. You are the one I need tonight, don't let me go.
+        When the night is over and the morning comes, we will be together again. I can't stop
+        thinking about the way you looked at me. Hold my hand, take my heart, it's all I have.
+        She said that nothing in this world could ever break us apart. We were young and wild
+        and free, running through the streets under the summer rain. Tell me why you had to
+        leave, tell me where you want to go. There is a light that never goes out. I don't know
+        what to say, but I know that I'm still waiting for you. The sun will shine again and the
+        stars will fall down from the sky. Give me one more chance, just one more dance with you.
+        Every time I close my eyes I see your face. My friends and my family live in a small town
+        by the river. Would you like something to drink? It was the best day of my life. Dreams
+        are made of the things we should have done. Come back home, the road is long and the
+        wind is cold. Nobody knows the trouble I've seen. Where have all the flowers gone?
+        Love hurts, but only because it is worth it. Happy birthday, my darling, with all my love.
+        the of and to in is you that it he was for on are as with his they at be this have from
+        or one had by word but not what all were we when your can said there use each which she do
+        how their if will up other about out many then them these so some her would make like him
+        into time has look two more write go see number no way could people my than first water
+        been call who its now find long down day did get come made may part over new sound
+        take only little work know place year live me back give most very after thing our just
+        name good man think say great where help through much before line right too mean
+        old any same tell boy follow came want show also around form three small set put end does
+        another well large must big even such because turn here why ask went men read need land
+        different home us move try kind hand picture again change off play air away animal
+        house point page letter mother answer found study still learn should world high every
+        near add food between own below country plant last school father keep tree never start
+        city earth eye light thought head under story saw left few while along might close
+        something seem next hard open example begin life always those both paper together got
+        group often run important until children side feet car mile night walk white sea began
+        grow took river four carry state once book hear stop without second later miss idea
+        """,
+    "Spanish": """
+        Te quiero con todo mi corazón y no puedo vivir sin ti. Bésame mucho, como si fuera esta
+        noche la última vez. Cuando la luna sale y las estrellas brillan, pienso en tus ojos.
+        Yo no sé qué hacer con este amor que me quema por dentro. La vida es un carnaval y las
+        penas se van cantando. Dime dónde estás, mi amor, que te estoy buscando por las calles de
+        la ciudad. Nunca te olvidaré, aunque pasen los años y cambie el mundo. Quiero bailar
+        contigo hasta que salga el sol. El corazón no se equivoca, siempre sabe lo que quiere.
+        Mis amigos y mi familia viven en un pueblo pequeño cerca del mar. ¿Quieres algo de beber?
+        Fue el mejor día de mi vida. Despacito, quiero respirar tu cuello despacito. Ella me dijo
+        que nada en este mundo podría separarnos. Éramos jóvenes y libres, corriendo bajo la
+        lluvia del verano. Vuelve a casa, el camino es largo y el viento está frío. Llorar por
+        ti no vale la pena, mañana será otro día. Gracias por la música y por las canciones que
+        nos hicieron soñar. Feliz cumpleaños, mi niña, con todo mi cariño. Soy tuyo para siempre.
+        de la que el en y a los se del las un por con no una su para es al lo como más o pero sus
+        le ha me si sin sobre este ya entre cuando todo esta ser son dos también fue había era muy
+        años hasta desde está mi porque qué sólo han yo hay vez puede todos así nos ni parte tiene
+        él uno donde bien tiempo mismo ese ahora cada e vida otro después te otros aunque esa eso
+        hace otra tan durante siempre día tanto ella tres sí dijo sido gran país
+        menos mundo año antes estado contra sino forma caso nada hacer estaba poco estos
+        mayor ante unos les algo hacia casa ellos ayer hecho primera mucho mientras
+        además quien momento esto hombre están pues hoy lugar
+        trabajo otras mejor nuevo decir algunos entonces todas días debe cómo casi toda
+        tal luego pasado primer medio va estas sea tenía nunca poder aquí ver veces
+        """,
+    "Portuguese": """
+        Eu te amo de todo o meu coração e não consigo viver sem você. Quando a noite chega e as
+        estrelas brilham, eu penso nos seus olhos. Não sei o que fazer com essa saudade que me
+        aperta o peito. A vida é uma festa e a tristeza não tem fim, a felicidade sim. Diga onde
+        você está, meu amor, estou te procurando pelas ruas da cidade. Nunca vou te esquecer,
+        mesmo que passem os anos e o mundo mude. Quero dançar com você até o sol nascer. O
+        coração não se engana, sempre sabe o que quer. Meus amigos e minha família moram numa
+        cidade pequena perto do mar. Você quer alguma coisa para beber? Foi o melhor dia da minha
+        vida. Ela me disse que nada neste mundo poderia nos separar. Éramos jovens e livres,
+        correndo debaixo da chuva de verão. Volta pra casa, o caminho é longo e o vento está
+        frio. Chorar por você não vale a pena, amanhã será outro dia. Obrigado pela música e
+        pelas canções que nos fizeram sonhar. Feliz aniversário, minha querida, com todo o meu
+        carinho. Garota de Ipanema, olha que coisa mais linda, mais cheia de graça. Sou seu
+        para sempre, minha paixão, nossa canção não acabou. Não há ninguém igual a você.
+        de a o que e do da em um para é com não uma os no se na por mais as dos como mas foi ao
+        ele das tem à seu sua ou ser quando muito há nos já está eu também só pelo pela até isso
+        ela entre era depois sem mesmo aos ter seus quem nas me esse eles estão você tinha foram
+        essa num nem suas meu às minha têm numa pelos elas havia seja qual será nós tenho lhe
+        deles essas esses pelas este fosse dele tu te vocês vos lhes meus minhas teu tua teus
+        tuas nosso nossa nossos nossas dela delas esta estes estas aquele aquela aqueles aquelas
+        isto aquilo estou está estamos estava estávamos estive esteve tivemos então coisa agora
+        ainda bem onde hoje nunca sempre aqui lá também porque pouco muito tudo nada gente
+        coração saudade obrigado obrigada beijo amanhã ontem noite cidade mãe pai irmão
+        """,
+    "French": """
+        Je t'aime de tout mon cœur et je ne peux pas vivre sans toi. Quand la nuit tombe et que
+        les étoiles brillent, je pense à tes yeux. Je ne sais pas quoi faire de cet amour qui me
+        brûle. La vie en rose, c'est lui pour moi, moi pour lui dans la vie. Dis-moi où tu es,
+        mon amour, je te cherche dans les rues de la ville. Je ne t'oublierai jamais, même si les
+        années passent et que le monde change. Je veux danser avec toi jusqu'au lever du soleil.
+        Mes amis et ma famille habitent dans un petit village près de la mer. Veux-tu quelque
+        chose à boire? C'était le plus beau jour de ma vie. Elle m'a dit que rien au monde ne
+        pourrait nous séparer. Nous étions jeunes et libres, courant sous la pluie de l'été.
+        Reviens à la maison, le chemin est long et le vent est froid. Pleurer pour toi n'en vaut
+        pas la peine, demain sera un autre jour. Merci pour la musique et pour les chansons qui
+        nous ont fait rêver. Joyeux anniversaire, ma chérie, avec tout mon amour. Non, je ne
+        regrette rien. Ne me quitte pas, il faut oublier, tout peut s'oublier.
+        de la le et les des en un du une que est pour qui dans par plus pas au sur ne se ce il sont
+        avec ou son mais comme on tout nous sa ses aussi leur bien peut ces y elle été faire fait
+        deux même entre sans encore cette dont très où avant après sous autres alors depuis
+        toujours notre votre vous je tu moi toi lui eux mon ton ma ta mes tes quand rien jamais
+        beaucoup maintenant ici aujourd'hui demain hier nuit jour coeur amour chanson monde
+        """,
+    "Italian": """
+        Ti amo con tutto il mio cuore e non posso vivere senza di te. Quando la notte arriva e le
+        stelle brillano, penso ai tuoi occhi. Non so cosa fare con questo amore che mi brucia
+        dentro. La vita è bella e il sole splende sul mare. Dimmi dove sei, amore mio, ti sto
+        cercando per le strade della città. Non ti dimenticherò mai, anche se passano gli anni e
+        il mondo cambia. Voglio ballare con te fino all'alba. I miei amici e la mia famiglia
+        vivono in un piccolo paese vicino al mare. Vuoi qualcosa da bere? È stato il giorno più
+        bello della mia vita. Lei mi ha detto che niente al mondo potrebbe separarci. Eravamo
+        giovani e liberi, correvamo sotto la pioggia d'estate. Torna a casa, la strada è lunga e
+        il vento è freddo. Piangere per te non ne vale la pena, domani sarà un altro giorno.
+        Grazie per la musica e per le canzoni che ci hanno fatto sognare. Buon compleanno, tesoro
+        mio, con tutto il mio affetto. Volare, oh oh, cantare, nel blu dipinto di blu.
+        di e il la che a per un in è non una sono del le si da i con ma come al della anche più
+        mi se ci io tu lui lei noi voi loro questo quella questo cosa tutto niente sempre mai
+        ancora adesso oggi domani ieri notte giorno cuore amore canzone mondo perché quando
+        dove chi molto poco bene male gli degli nella nelle sul sulla dei delle sei siamo siete
+        """,
+    "German": """
+        Ich liebe dich von ganzem Herzen und ich kann nicht ohne dich leben. Wenn die Nacht kommt
+        und die Sterne leuchten, denke ich an deine Augen. Ich weiß nicht, was ich mit dieser
+        Liebe machen soll. Das Leben ist schön und die Sonne scheint über dem Meer. Sag mir, wo
+        du bist, mein Schatz, ich suche dich in den Straßen der Stadt. Ich werde dich nie
+        vergessen, auch wenn die Jahre vergehen und sich die Welt verändert. Ich will mit dir
+        tanzen, bis die Sonne aufgeht. Meine Freunde und meine Familie wohnen in einem kleinen
+        Dorf am Fluss. Möchtest du etwas trinken? Es war der schönste Tag meines Lebens. Sie
+        sagte mir, dass nichts auf der Welt uns trennen könnte. Wir waren jung und frei und
+        rannten durch den Sommerregen. Komm nach Hause, der Weg ist lang und der Wind ist kalt.
+        Um dich zu weinen lohnt sich nicht, morgen ist ein neuer Tag. Danke für die Musik und für
+        die Lieder, die uns träumen ließen. Alles Gute zum Geburtstag, mein Liebling.
+        der die und in den von zu das mit sich des auf für ist im dem nicht ein eine als auch es
+        an werden aus er hat dass sie nach wird bei einer um am sind noch wie einem über einen so
+        zum war haben nur oder aber vor zur bis mehr durch man sein wurde sei ich du wir ihr mich
+        dich uns euch mein dein immer nie heute morgen gestern nacht herz liebe lied welt warum
+        """,
+}
+
+_non_letters = re.compile(r"[\W\d_]+")
+
+def _normalize(text):
+    """Case-fold a text and reduce it to space-separated runs of letters, padded with spaces"""
+    letters = _non_letters.sub(" ", unicodedata.normalize("NFC", text or "").casefold()).strip()
+    return f" {letters} " if letters else ""
+
+def ngram_features(texts):
+    """
+    Hash the character n-grams of many texts in one vectorized pass
+
+    The normalized texts are concatenated into a single array of code
+    points, separated by NUL, and the n-grams of every order are hashed
+    with array arithmetic; n-grams spanning a separator are dropped.
+
+    Parameters:
+    -----------
+    texts : list
+        Texts to featurize
+
+    Returns:
+    --------
+    tuple
+        (docs, buckets, letters): the text index and hash bucket of every
+        n-gram occurrence, and the number of letters of each text
+    """
+    normalized = [_normalize(text) for text in texts]
+    letters = np.array([len(text) - text.count(" ") for text in normalized], dtype=np.int64)
+    joined = "".join(text + "\0" for text in normalized)
+    codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    docs = np.repeat(np.arange(len(normalized)), [len(text) + 1 for text in normalized])
+
+    all_docs = []
+    all_buckets = []
+    for n in NGRAM_ORDERS:
+        count = len(codes) - n + 1
+        if count <= 0:
+            continue
+        valid = np.ones(count, dtype=bool)
+        hashes = np.full(count, n, dtype=np.uint64)
+        for offset in range(n):
+            window = codes[offset:offset + count]
+            valid &= window != 0
+            hashes = hashes * np.uint64(0x100000001B3) + window
+        # Mix the high bits into the low ones before taking the bucket
+        hashes ^= hashes >> np.uint64(29)
+        hashes *= np.uint64(0xBF58476D1CE4E5B9)
+        hashes ^= hashes >> np.uint64(32)
+        all_docs.append(docs[:count][valid])
+        all_buckets.append((hashes[valid] % np.uint64(FEATURE_BUCKETS)).astype(np.int64))
+
+    if not all_docs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), letters
+    return np.concatenate(all_docs), np.concatenate(all_buckets), letters
+
+class LanguageClassifier:
+    """
+    Multinomial naive Bayes over hashed character n-grams
+
+    Each language is a vector of smoothed log-probabilities over
+    ``FEATURE_BUCKETS`` n-gram buckets. A batch of texts is featurized in
+    one pass and scored with one gather and one ``np.bincount`` per
+    language, so thousands of tracks are classified without a Python loop
+    per n-gram and without any network call.
+    """
+
+    def __init__(self, training_text=None):
+        training_text = training_text or TRAINING_TEXT
+        self.languages = list(training_text)
+        docs, buckets, _ = ngram_features(list(training_text.values()))
+        counts = np.bincount(
+            docs * FEATURE_BUCKETS + buckets, minlength=len(self.languages) * FEATURE_BUCKETS
+        ).reshape(len(self.languages), FEATURE_BUCKETS).astype(np.float64)
+        probabilities = (counts + SMOOTHING) / (counts.sum(axis=1, keepdims=True) + SMOOTHING * FEATURE_BUCKETS)
+        self.log_probs = np.log(probabilities).astype(np.float32)
+
+    def scores(self, texts):
+        """
+        Return per-language scores of many texts
+
+        Returns:
+        --------
+        tuple
+            (log_likelihoods, n_grams, letters): array of shape
+            (n_texts, n_languages), and the n-gram and letter counts of
+            each text
+        """
+        texts = list(texts)
+        docs, buckets, letters = ngram_features(texts)
+        gathered = self.log_probs[:, buckets]
+        log_likelihoods = np.stack([
+            np.bincount(docs, weights=row, minlength=len(texts)) for row in gathered
+        ], axis=1) if len(self.languages) else np.zeros((len(texts), 0))
+        return log_likelihoods, np.bincount(docs, minlength=len(texts)), letters
+
+    def classify(self, texts, min_margin=MIN_MARGIN):
+        """
+        Classify many texts at once
+
+        Parameters:
+        -----------
+        texts : iterable
+            Texts to classify, e.g. from ``track_text``
+        min_margin : float
+            Mean log-likelihood lead per n-gram the best language needs
+            over the second best; closer calls are ``UNKNOWN_LANGUAGE``
+
+        Returns:
+        --------
+        list
+            One language name (or ``UNKNOWN_LANGUAGE``) per text
+        """
+        log_likelihoods, n_grams, letters = self.scores(texts)
+        if not len(letters):
+            return []
+        ranked = np.sort(log_likelihoods, axis=1)
+        margins = (ranked[:, -1] - ranked[:, -2]) / np.maximum(n_grams, 1)
+        best = np.argmax(log_likelihoods, axis=1)
+        confident = (letters >= MIN_LETTERS) & (margins >= min_margin)
+        return [
+            self.languages[language] if ok else UNKNOWN_LANGUAGE
+            for language, ok in zip(best, confident)
+        ]
+
+# Shared classifier trained on ``TRAINING_TEXT``
+CLASSIFIER = LanguageClassifier()
+
+def track_text(title=None, artist=None, album=None, lyrics=None):
+    """Join the text fields of a track for classification"""
+    return "\n".join(field for field in (title, artist, album, lyrics) if field)
+
+def spotify_track_text(track):
+    """Text of a Spotify track object (name, artists and album name)"""
+    return track_text(
+        track.get("name"),
+        " ".join(artist.get("name") or "" for artist in track.get("artists") or []),
+        (track.get("album") or {}).get("name")
+    )
+
+def detect_languages(texts):
+    """Classify many texts with the shared classifier"""
+    return CLASSIFIER.classify(texts)
+
+def reclassify_songs(batch_size=RECLASSIFY_BATCH_SIZE):
+    """
+    Classify the language of every stored song again, one batch at a time
+
+    Uses each song's title, artist, album and lyrics; only songs whose
+    language changes are written, and their cached responses invalidated.
+    If any language changed, the pattern statistics (which count songs per
+    language) are rebuilt afterwards.
+
+    Returns:
+    --------
+    tuple
+        (songs classified, songs changed)
+    """
+    cursor = mongo.db.songs.find(
+        {}, {"spotify_id": 1, "title": 1, "artist": 1, "album": 1, "lyrics": 1, "language": 1}
+    ).batch_size(batch_size)
+
+    classified = changed = 0
+    batch = []
+    for song in cursor:
+        batch.append(song)
+        if len(batch) == batch_size:
+            changed += _reclassify_batch(batch)
+            classified += len(batch)
+            batch = []
+    if batch:
+        changed += _reclassify_batch(batch)
+        classified += len(batch)
+    if changed:
+        PatternStats(COMMON_PROGRESSIONS).rebuild()
+    return classified, changed
+
+def _reclassify_batch(songs):
+    languages = detect_languages(
+        track_text(song.get("title"), song.get("artist"), song.get("album"), song.get("lyrics"))
+        for song in songs
+    )
+    updates = [(song, language) for song, language in zip(songs, languages) if song.get("language") != language]
+    if updates:
+        mongo.db.songs.bulk_write([
+            UpdateOne({"_id": song["_id"]}, {"$set": {"language": language}})
+            for song, language in updates
+        ], ordered=False)
+        bump_versions(song_scope(song["spotify_id"]) for song, _ in updates if song.get("spotify_id"))
+    return len(updates)
@@ -0,0 +1,506 @@
+import json
+import os
+import re
+import unicodedata
+
+import numpy as np
+from ..database.db import mongo
+
+# Languages with lemmatization rules, named as in the songs' ``language`` field
+LANGUAGES = ("English", "Spanish", "Portuguese")
+
+# Songs fetched per cursor batch when building the index from the database
+BUILD_BATCH_SIZE = 1000
+
+# Distinct unknown words reported for each song by ``known_songs``
+UNKNOWN_WORDS_SHOWN = 5
+
+# Runs of letters, with inner apostrophes (don't, d'água)
+_word = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)*")
+
+# English clitics split off before lemmatizing, and what they stand for
+ENGLISH_CLITICS = {"n't": "not", "'re": "be", "'m": "be", "'ll": "will", "'ve": "have", "'d": "would", "'s": None}
+ENGLISH_CONTRACTIONS = {"can't": ["can", "not"], "won't": ["will", "not"], "ain't": ["be", "not"]}
+
+def _forms(table):
+    """Invert {lemma: 'form form ...'} into {form: lemma}"""
+    return {form: lemma for lemma, forms in table.items() for form in forms.split()}
+
+# Irregular inflections, looked up before the suffix rules
+IRREGULAR_FORMS = {
+    "English": _forms({
+        "be": "am is are was were been being", "have": "has had having", "do": "does did done",
+        "go": "goes went gone", "say": "said", "make": "made", "know": "knew known", "see": "saw seen",
+        "come": "came", "take": "took taken", "get": "got gotten", "give": "gave given", "feel": "felt",
+        "think": "thought", "tell": "told", "leave": "left", "find": "found", "run": "ran", "fall": "fell fallen",
+        "hold": "held", "keep": "kept", "lose": "lost", "break": "broke broken", "win": "won", "hear": "heard",
+        "buy": "bought", "bring": "brought", "catch": "caught", "fight": "fought", "teach": "taught",
+        "sleep": "slept", "stand": "stood", "understand": "understood", "meet": "met", "sit": "sat",
+        "sing": "sang sung", "fly": "flew flown", "drive": "drove driven", "write": "wrote written",
+        "ride": "rode ridden", "rise": "rose risen", "shine": "shone", "begin": "began begun",
+        "man": "men", "woman": "women", "child": "children", "foot": "feet", "tooth": "teeth", "life": "lives",
+        "wife": "wives", "knife": "knives", "leaf": "leaves", "wolf": "wolves", "half": "halves",
+    }),
+    "Spanish": _forms({
+        "ser": "soy eres es somos sois son era eras éramos eran fui fuiste fue fuimos fueron sea seas seamos sean "
+               "será serás seré serán sido siendo",
+        "estar": "estoy estás está estamos estáis están estaba estabas estaban estuve estuvo esté estés estén",
+        "ir": "voy vas va vamos vais van iba ibas íbamos iban vaya vayas",
+        "tener": "tengo tienes tiene tenemos tienen tenía tenías tuve tuvo tenga",
+        "haber": "he has ha hemos han había habías hay haya",
+        "hacer": "hago haces hace hacemos hacen hice hizo haga hecho",
+        "poder": "puedo puedes puede podemos pueden pude pudo podía pueda",
+        "querer": "quiero quieres quiere queremos quieren quise quiso quería quisiera",
+        "decir": "digo dices dice decimos dicen dije dijo diga dicho",
+        "saber": "sé sabes sabe sabemos saben supe supo sabía sepa",
+        "ver": "veo ves ve vemos ven vi vio veía visto",
+        "dar": "doy das da damos dan di dio dé",
+        "venir": "vengo vienes viene venimos vienen vine vino venga",
+        "sentir": "siento sientes siente sentimos sienten sintió",
+    }),
+    "Portuguese": _forms({
+        "ser": "sou és é somos são era eras éramos eram fui foste foi fomos foram seja sejas sejam "
+               "será serei serão sido sendo",
+        "estar": "estou estás está estamos estão estava estavas estavam estive esteve esteja",
+        "ir": "vou vais vai vamos vão ia ias íamos iam vá",
+        "ter": "tenho tens tem temos têm tinha tinhas tinham tive teve tenha",
+        "haver": "há havia houve haja",
+        "fazer": "faço fazes faz fazemos fazem fiz fez faça feito",
+        "poder": "posso podes pode podemos podem pude pôde podia possa",
+        "querer": "quero queres quer queremos querem quis quisesse queria",
+        "dizer": "digo dizes diz dizemos dizem disse diga dito",
+        "saber": "sei sabes sabe sabemos sabem soube sabia saiba",
+        "ver": "vejo vês vê vemos veem vi viu via visto",
+        "dar": "dou dás dá damos dão deu dava dê",
+        "vir": "venho vens vem vimos vêm veio venha",
+    }),
+}
+
+# Words the suffix rules would mangle
+UNINFLECTED = {
+    "English": set(
+        "this always perhaps sometimes news unless towards nothing something everything anything "
+        "morning evening darling during wedding ceiling string spring bleed speed indeed hundred "
+        "naked wicked sacred".split()
+    ),
+    "Spanish": set(
+        "dios adiós después además atrás jamás quizás antes entonces nosotros vosotros lunes martes tres".split()
+    ),
+    "Portuguese": set("demais jamais".split()),
+}
+
+# Suffix rules per language, tried in order; the first match wins. They
+# cover the plural of nouns and adjectives (and English -ing/-ed, see
+# ``_english_verb_ending``), which is what vocabulary lists need, not a
+# full morphological analysis
+SUFFIX_RULES = {
+    "English": [
+        (r"^(.{2,})ies$", r"\1y"),
+        (r"^(.{2,}(?:ss|sh|ch|x|z))es$", r"\1"),
+        (r"^(.{2,}[^su])s$", r"\1"),
+        (r"^(.{2,})ied$", r"\1y"),
+    ],
+    "Spanish": [
+        (r"^(.+)ones$", r"\1ón"),
+        (r"^(.+[aeiouáéó])ces$", r"\1z"),
+        (r"^(.+[aeiouáéíóú][lnrdjy])es$", r"\1"),
+        (r"^(.{2,}[aeoáéíó])s$", r"\1"),
+    ],
+    "Portuguese": [
+        (r"^(.+)ões$", r"\1ão"),
+        (r"^(.{2,})ais$", r"\1al"),
+        (r"^(.{2,})éis$", r"\1el"),
+        (r"^(.{2,})óis$", r"\1ol"),
+        (r"^(.{2,})ns$", r"\1m"),
+        (r"^(.+[aeiou][rsz])es$", r"\1"),
+        (r"^(.{2,}[aeoáéêóô])s$", r"\1"),
+    ],
+}
+SUFFIX_RULES = {
+    language: [(re.compile(pattern), replacement) for pattern, replacement in rules]
+    for language, rules in SUFFIX_RULES.items()
+}
+
+_english_verb_ending = re.compile(r"^(.{3,})(?:ing|ed)$")
+
+def tokenize(text):
+    """
+    Yield the words of a text one at a time, case-folded and NFC-normalized
+
+    Digits and punctuation separate words; apostrophes inside a word are
+    kept (and typographic ones made straight), so clitics can be split by
+    ``lemmatize_tokens``.
+    """
+    yield from _word.findall(unicodedata.normalize("NFC", text).replace("’", "'").casefold())
+
+def lemmatize(word, language):
+    """
+    Return the dictionary form of a case-folded word
+
+    Irregular forms are looked up first, then the language's suffix rules
+    are applied. Words of other languages are returned unchanged.
+    """
+    irregular = IRREGULAR_FORMS.get(language)
+    if irregular is None or word in UNINFLECTED[language]:
+        return word
+    if word in irregular:
+        return irregular[word]
+    for pattern, replacement in SUFFIX_RULES[language]:
+        lemma, matched = pattern.subn(replacement, word)
+        if matched:
+            return lemma
+    if language == "English":
+        match = _english_verb_ending.match(word)
+        if match:
+            return _restore_english_stem(match.group(1))
+    return word
+
+def _restore_english_stem(stem):
+    """Undo the spelling changes of -ing and -ed (runn -> run, lov -> love, danc -> dance)"""
+    if len(stem) > 3 and stem[-1] == stem[-2] and stem[-1] not in "aeiouylsz":
+        return stem[:-1]
+    if stem[-1] in "cvu" or stem.endswith(("bl", "iz")):
+        return stem + "e"
+    # Stems of one consonant-vowel-consonant syllable take an e: hop -> hope, chas -> chase
+    shape = re.sub(r"(.)\1+", r"\1", "".join(
+        "v" if c in "aeiou" or (c == "y" and i > 0) else "c" for i, c in enumerate(stem)
+    ))
+    if shape.count("vc") == 1 and re.search(r"[^aeiou][aeiou][^aeiouwxy]$", stem):
+        return stem + "e"
+    return stem
+
+def lemmatize_tokens(tokens, language):
+    """Yield the lemmas of a stream of tokens, splitting English contractions"""
+    for token in tokens:
+        if language == "English" and "'" in token:
+            if token in ENGLISH_CONTRACTIONS:
+                yield from ENGLISH_CONTRACTIONS[token]
+                continue
+            for clitic, expansion in ENGLISH_CLITICS.items():
+                if token.endswith(clitic) and len(token) > len(clitic):
+                    yield lemmatize(token[:-len(clitic)], language)
+                    if expansion:
+                        yield expansion
+                    break
+            else:
+                yield lemmatize(token, language)
+        else:
+            yield lemmatize(token, language)
+
+def analyze_text(text, language):
+    """Yield the lemmas of a text in order"""
+    return lemmatize_tokens(tokenize(text), language)
+
+class VocabularyIndex:
+    """
+    Inverted index and frequency vectors over the lemmatized lyrics of every song
+
+    Each song's lyrics are tokenized and lemmatized in one streaming pass and
+    kept as an int32 array of term ids. On the first query after a change
+    the arrays are packed, with a single stable sort, into CSR-style integer
+    arrays:
+
+    * postings: for each term, the rows of the songs using it, with counts
+      and the token positions of every occurrence;
+    * frequency vectors: for each song, its distinct terms and their counts,
+      which also form a sparse song-by-term matrix.
+
+    Word lookups read one slice of the postings, frequency lists are one
+    ``np.bincount`` over the frequency vectors and known-vocabulary coverage
+    is one sparse matrix-vector product, so no query touches the lyrics.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        """Empty the index"""
+        self.terms = []
+        self.song_ids = []
+        self.languages = []
+        self._term_ids = {}
+        # Term ids of every token seen, per language; lyrics reuse few words
+        # so most tokens are resolved with one dict lookup
+        self._token_terms = {}
+        self._rows = {}
+        self._tokens = []
+        self._packed = None
+
+    def __len__(self):
+        return len(self.song_ids)
+
+    def __contains__(self, song_id):
+        return song_id in self._rows
+
+    def add_songs(self, songs):
+        """
+        Add or update songs in the index
+
+        Parameters:
+        -----------
+        songs : iterable
+            (song_id, lyrics, language) triples; language names are those of
+            ``LANGUAGES``, anything else is indexed without lemmatization
+        """
+        for song_id, lyrics, language in songs:
+            token_terms = self._token_terms.setdefault(language, {})
+            term_ids = []
+            for token in tokenize(lyrics or ""):
+                ids = token_terms.get(token)
+                if ids is None:
+                    ids = token_terms[token] = [self._term_id(lemma) for lemma in lemmatize_tokens([token], language)]
+                term_ids.extend(ids)
+            tokens = np.array(term_ids, dtype=np.int32)
+            row = self._rows.get(song_id)
+            if row is None:
+                self._rows[song_id] = len(self.song_ids)
+                self.song_ids.append(song_id)
+                self.languages.append(language)
+                self._tokens.append(tokens)
+            else:
+                self.languages[row] = language
+                self._tokens[row] = tokens
+            self._packed = None
+
+    def build_from_db(self):
+        """Rebuild the whole index from the lyrics stored on ``songs``"""
+        self._reset()
+        self.add_songs(iter_song_lyrics())
+        return self
+
+    def songs_with_word(self, word, language=None, limit=20):
+        """
+        Find songs using a word in any of its inflections
+
+        Parameters:
+        -----------
+        word : str
+            A single word, e.g. 'corazones' or 'running'
+        language : str
+            Lemmatize the word for, and only return songs in, this language;
+            if None the word is matched in every language
+        limit : int
+            Maximum number of songs returned
+
+        Returns:
+        --------
+        list
+            ``{"song_id", "count", "positions"}`` per song, most occurrences first
+        """
+        packed = self._pack()
+        term_ptr = packed["term_ptr"]
+        postings = np.concatenate([np.zeros(0, dtype=np.int64)] + [
+            np.arange(term_ptr[term_id], term_ptr[term_id + 1]) for term_id in self._lookup(word, language)
+        ])
+        rows = packed["posting_rows"][postings]
+        if language is not None:
+            in_language = packed["language_codes"][rows] == self._language_code(language)
+            postings, rows = postings[in_language], rows[in_language]
+
+        # Inflections indexed under several lemmas are merged per song
+        song_rows, song_of_posting = np.unique(rows, return_inverse=True)
+        counts = np.bincount(song_of_posting, weights=packed["posting_counts"][postings], minlength=len(song_rows))
+
+        results = []
+        for i in np.lexsort((song_rows, -counts))[:limit]:
+            position_ptr = packed["position_ptr"]
+            positions = np.concatenate([
+                packed["positions"][position_ptr[posting]:position_ptr[posting + 1]]
+                for posting in postings[song_of_posting == i]
+            ])
+            results.append({
+                "song_id": self.song_ids[song_rows[i]],
+                "count": int(counts[i]),
+                "positions": np.sort(positions).tolist()
+            })
+        return results
+
+    def top_words(self, language=None, limit=50, offset=0):
+        """
+        Return the most frequent words of a language's songs (or of all songs)
+
+        Returns:
+        --------
+        list
+            ``{"word", "count", "songs"}`` ordered by total occurrences
+        """
+        counts, song_counts, order = self._language_totals(language)
+        return [
+            {"word": self.terms[term_id], "count": int(counts[term_id]), "songs": int(song_counts[term_id])}
+            for term_id in order[offset:offset + limit]
+        ]
+
+    def known_songs(self, known_words, language=None, min_coverage=0.9, limit=20):
+        """
+        Find songs whose lyrics are mostly made of known words
+
+        Parameters:
+        -----------
+        known_words : iterable
+            Lemmas the user knows (as returned by ``lemmatize``)
+        language : str
+            Only consider songs in this language
+        min_coverage : float
+            Smallest share of a song's words that must be known
+        limit : int
+            Maximum number of songs returned
+
+        Returns:
+        --------
+        list
+            ``{"song_id", "coverage", "unknown_words"}`` per song, best
+            covered first; ``unknown_words`` lists the song's most frequent
+            unknown lemmas
+        """
+        packed = self._pack()
+        known = np.zeros(len(self.terms), dtype=bool)
+        known_ids = [self._term_ids[word] for word in known_words if word in self._term_ids]
+        known[known_ids] = True
+
+        song_terms = packed["song_terms"]
+        known_counts = packed["frequencies"] @ known.astype(np.int32)
+        lengths = packed["song_lengths"]
+        coverage = known_counts / np.maximum(lengths, 1)
+        eligible = (lengths > 0) & (coverage >= min_coverage)
+        if language is not None:
+            eligible &= packed["language_codes"] == self._language_code(language)
+
+        rows = np.flatnonzero(eligible)
+        rows = rows[np.lexsort((-lengths[rows], -coverage[rows]))][:limit]
+
+        results = []
+        for row in rows:
+            start, end = packed["song_ptr"][row], packed["song_ptr"][row + 1]
+            unknown = ~known[song_terms[start:end]]
+            terms = song_terms[start:end][unknown]
+            top = terms[np.argsort(-packed["song_counts"][start:end][unknown], kind="stable")[:UNKNOWN_WORDS_SHOWN]]
+            results.append({
+                "song_id": self.song_ids[row],
+                "coverage": round(float(coverage[row]), 4),
+                "unknown_words": [self.terms[term_id] for term_id in top]
+            })
+        return results
+
+    def save(self, path):
+        """Write the index to a directory"""
+        os.makedirs(path, exist_ok=True)
+        tokens = np.concatenate(self._tokens) if self._tokens else np.zeros(0, dtype=np.int32)
+        np.save(os.path.join(path, "tokens.npy"), tokens)
+        np.save(os.path.join(path, "lengths.npy"), np.array([len(t) for t in self._tokens], dtype=np.int64))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"terms": self.terms, "song_ids": self.song_ids, "languages": self.languages}, f)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by ``save``"""
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        index = cls()
+        index.terms = meta["terms"]
+        index.song_ids = meta["song_ids"]
+        index.languages = meta["languages"]
+        index._term_ids = {term: term_id for term_id, term in enumerate(index.terms)}
+        index._rows = {song_id: row for row, song_id in enumerate(index.song_ids)}
+        tokens = np.load(os.path.join(path, "tokens.npy"))
+        lengths = np.load(os.path.join(path, "lengths.npy"))
+        index._tokens = np.split(tokens, np.cumsum(lengths)[:-1]) if len(lengths) else []
+        return index
+
+    def _term_id(self, term):
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            term_id = self._term_ids[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def _lookup(self, word, language):
+        """Term ids a query word may be indexed under"""
+        tokens = list(tokenize(word))
+        if len(tokens) != 1:
+            raise ValueError("Query must be a single word")
+        languages = [language] if language is not None else LANGUAGES
+        candidates = {lemma for lang in languages for lemma in lemmatize_tokens(tokens, lang)}
+        if language is None:
+            candidates.add(tokens[0])
+        return sorted(self._term_ids[term] for term in candidates if term in self._term_ids)
+
+    def _language_code(self, language):
+        names = self._pack()["language_names"]
+        return names.index(language) if language in names else -1
+
+    def _language_totals(self, language):
+        """Occurrences, song counts and frequency order of every term, cached per language"""
+        packed = self._pack()
+        totals = packed["totals"].get(language)
+        if totals is None:
+            entries = slice(None)
+            if language is not None:
+                entries = packed["language_codes"][packed["song_rows"]] == self._language_code(language)
+            terms = packed["song_terms"][entries]
+            counts = np.bincount(terms, weights=packed["song_counts"][entries], minlength=len(self.terms))
+            song_counts = np.bincount(terms, minlength=len(self.terms))
+            order = np.lexsort((np.arange(len(self.terms)), -counts))
+            order = order[:np.count_nonzero(counts)]
+            totals = packed["totals"][language] = (counts.astype(np.int64), song_counts, order)
+        return totals
+
+    def _pack(self):
+        """Build the packed postings and frequency vectors if songs changed since the last query"""
+        if self._packed is not None:
+            return self._packed
+
+        n_songs = len(self.song_ids)
+        lengths = np.array([len(t) for t in self._tokens], dtype=np.int64)
+        tokens = np.concatenate(self._tokens).astype(np.int64) if n_songs else np.zeros(0, dtype=np.int64)
+        rows = np.repeat(np.arange(n_songs, dtype=np.int64), lengths)
+        starts = np.cumsum(lengths) - lengths
+        positions = (np.arange(len(tokens)) - np.repeat(starts, lengths)).astype(np.int32)
+
+        # Sort occurrences by (term, song); the stable sort keeps positions ascending
+        keys = tokens * max(n_songs, 1) + rows
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        boundaries = np.flatnonzero(np.diff(keys)) + 1 if len(keys) else np.zeros(0, dtype=np.int64)
+        posting_starts = np.concatenate([[0], boundaries]).astype(np.int64) if len(keys) else boundaries
+        posting_terms = keys[posting_starts] // max(n_songs, 1)
+        posting_rows = (keys[posting_starts] % max(n_songs, 1)).astype(np.int32)
+        posting_counts = np.diff(np.append(posting_starts, len(keys))).astype(np.int32)
+
+        # The same postings grouped by song are the frequency vectors
+        by_song = np.argsort(posting_rows, kind="stable")
+        song_rows = posting_rows[by_song]
+
+        # scipy (a librosa dependency) is only imported once the index is queried
+        from scipy.sparse import csr_matrix
+
+        song_ptr = np.searchsorted(song_rows, np.arange(n_songs + 1))
+        song_terms = posting_terms[by_song].astype(np.int32)
+        song_counts = posting_counts[by_song]
+
+        language_names = sorted(set(self.languages), key=str)
+        codes = {name: code for code, name in enumerate(language_names)}
+        self._packed = {
+            "term_ptr": np.searchsorted(posting_terms, np.arange(len(self.terms) + 1)),
+            "posting_rows": posting_rows,
+            "posting_counts": posting_counts,
+            "position_ptr": np.append(posting_starts, len(keys)),
+            "positions": positions[order],
+            "song_ptr": song_ptr,
+            "song_rows": song_rows,
+            "song_terms": song_terms,
+            "song_counts": song_counts,
+            "frequencies": csr_matrix((song_counts, song_terms, song_ptr), shape=(n_songs, len(self.terms))),
+            "song_lengths": lengths,
+            "language_names": language_names,
+            "language_codes": np.array([codes[language] for language in self.languages], dtype=np.int16),
+            "totals": {}
+        }
+        return self._packed
+
+def iter_song_lyrics(batch_size=BUILD_BATCH_SIZE):
+    """Yield (song_id, lyrics, language) for every song with stored lyrics"""
+    cursor = mongo.db.songs.find(
+        {"lyrics": {"$type": "string"}}, {"lyrics": 1, "language": 1}
+    ).batch_size(batch_size)
+    for song in cursor:
+        yield str(song["_id"]), song["lyrics"], song.get("language")
@@ -0,0 +1,263 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+from .chord_analyzer import CHORD_TEMPLATES, TEMPLATE_ROOTS, TEMPLATE_QUALITIES, chord_name
+
+# Analysis parameters at the base sample rate; other rates scale them so a
+# hop always covers the same duration
+LIVE_BASE_SR = 22050
+LIVE_N_FFT = 2048
+LIVE_HOP_LENGTH = 512
+
+# Chroma frames averaged per chord decision
+LIVE_WINDOW = 5
+
+# Consecutive hops a new chord must win before the change is reported
+LIVE_STABLE_HOPS = 2
+
+# Raw PCM sample formats accepted by ``feed``
+SAMPLE_FORMATS = {"f32": np.dtype("<f4"), "s16": np.dtype("<i2")}
+
+# Longest chunk of audio accepted in one ``feed`` call, in seconds
+MAX_CHUNK_SECONDS = 10
+
+# Session limits per process
+MAX_LIVE_SESSIONS = 500
+LIVE_SESSION_TIMEOUT = 60
+
+# Frames whose loudest chroma bin is below this are treated as silence
+SILENCE_THRESHOLD = 1e-6
+
+# Chroma filter banks shared by all sessions, keyed by (sr, n_fft)
+_filterbanks = {}
+
+def chroma_filterbank(sr, n_fft):
+    """Return the (12, 1 + n_fft // 2) STFT-to-chroma matrix for a sample rate"""
+    key = (sr, n_fft)
+    if key not in _filterbanks:
+        from librosa.filters import chroma
+        _filterbanks[key] = chroma(sr=sr, n_fft=n_fft).astype(np.float32)
+    return _filterbanks[key]
+
+class LiveChordDetector:
+    """
+    Incremental chord detection over a stream of raw audio
+
+    Audio arrives in chunks of any size. Each complete STFT frame is turned
+    into a chroma vector with a fixed filter bank, the last ``window`` frames
+    are averaged and scored against the analyzer's ``CHORD_TEMPLATES``, and a
+    chord change is reported once a new chord has won ``stable_hops``
+    consecutive hops. Only one FFT frame of audio and ``window - 1`` chroma
+    frames are kept between chunks, so memory and per-hop CPU are fixed
+    however long the stream runs.
+
+    A change is reported at most ``max_latency`` seconds after it starts in
+    the audio (about 0.19 s with the defaults), plus network time.
+    """
+
+    def __init__(self, sr=LIVE_BASE_SR, channels=1, sample_format="f32",
+                 window=LIVE_WINDOW, stable_hops=LIVE_STABLE_HOPS):
+        if not 8000 <= sr <= 96000:
+            raise ValueError("sr must be between 8000 and 96000")
+        if channels not in (1, 2):
+            raise ValueError("channels must be 1 or 2")
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(SAMPLE_FORMATS)}")
+
+        scale = sr / LIVE_BASE_SR
+        self.sr = sr
+        self.channels = channels
+        self.sample_format = sample_format
+        self.hop_length = int(round(LIVE_HOP_LENGTH * scale))
+        self.n_fft = 1 << int(round(np.log2(LIVE_N_FFT * scale)))
+        self.window = window
+        self.stable_hops = stable_hops
+        self.max_chunk_bytes = MAX_CHUNK_SECONDS * sr * channels * SAMPLE_FORMATS[sample_format].itemsize
+
+        n = np.arange(self.n_fft)
+        self._fft_window = (0.5 - 0.5 * np.cos(2 * np.pi * n / self.n_fft)).astype(np.float32)
+        self._filterbank = chroma_filterbank(sr, self.n_fft)
+
+        # Frames are centered on their hop, as in librosa, so the stream is
+        # padded with half a frame of silence
+        self._buffer = np.zeros(self.n_fft // 2, dtype=np.float32)
+        self._history = np.zeros((0, 12), dtype=np.float32)
+        self._history_silent = np.zeros(0, dtype=bool)
+        self._frames_seen = 0
+        self.samples_received = 0
+
+        self.current = None
+        self._candidate = None
+        self._candidate_time = 0.0
+        self._candidate_hops = 0
+        self.lock = threading.Lock()
+
+    @property
+    def position(self):
+        """Seconds of audio received so far"""
+        return self.samples_received / self.sr
+
+    @property
+    def current_chord(self):
+        """Name of the chord currently sounding, or None"""
+        if self.current is None:
+            return None
+        return chord_name(TEMPLATE_ROOTS[self.current], TEMPLATE_QUALITIES[self.current])
+
+    @property
+    def max_latency(self):
+        """Worst-case delay in seconds between a chord starting and being reported"""
+        return (self.n_fft // 2 + (self.window + self.stable_hops - 1) * self.hop_length) / self.sr
+
+    def feed(self, data):
+        """Process a chunk of raw interleaved PCM bytes; return the chord changes it completes"""
+        dtype = SAMPLE_FORMATS[self.sample_format]
+        frame_bytes = dtype.itemsize * self.channels
+        if len(data) % frame_bytes:
+            raise ValueError(f"Chunk length must be a multiple of {frame_bytes} bytes")
+        if len(data) > self.max_chunk_bytes:
+            raise ValueError(f"Chunks are limited to {MAX_CHUNK_SECONDS} seconds of audio")
+
+        samples = np.frombuffer(data, dtype=dtype).astype(np.float32)
+        if self.sample_format == "s16":
+            samples /= 32768.0
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        return self.process(samples)
+
+    def process(self, samples):
+        """
+        Process mono float samples; return the chord changes they complete
+
+        Returns:
+        --------
+        list
+            ``{"time", "chord", "score"}`` dicts, as in ``analyze_audio``,
+            with times in seconds from the start of the stream
+        """
+        with self.lock:
+            self.samples_received += len(samples)
+            buffer = np.concatenate([self._buffer, np.asarray(samples, dtype=np.float32)])
+            if len(buffer) < self.n_fft:
+                self._buffer = buffer
+                return []
+
+            # Every complete frame in the buffer, in one batched FFT
+            n_frames = 1 + (len(buffer) - self.n_fft) // self.hop_length
+            frames = np.lib.stride_tricks.sliding_window_view(buffer, self.n_fft)[::self.hop_length][:n_frames]
+            spectrum = np.abs(np.fft.rfft(frames * self._fft_window, axis=1)) ** 2
+            chroma = spectrum.astype(np.float32) @ self._filterbank.T
+            peak = chroma.max(axis=1, keepdims=True)
+            silent = peak[:, 0] < SILENCE_THRESHOLD
+            chroma /= np.maximum(peak, SILENCE_THRESHOLD)
+            self._buffer = buffer[n_frames * self.hop_length:]
+
+            return self._detect(chroma, silent)
+
+    def _detect(self, chroma, silent):
+        """Score each new window ending in ``chroma`` and track chord changes"""
+        frames = np.concatenate([self._history, chroma])
+        frames_silent = np.concatenate([self._history_silent, silent])
+        first_frame = self._frames_seen - len(self._history)
+        self._frames_seen += len(chroma)
+
+        keep = self.window - 1
+        self._history = frames[-keep:] if keep else frames[:0]
+        self._history_silent = frames_silent[-keep:] if keep else frames_silent[:0]
+        if len(frames) < self.window:
+            return []
+
+        # Window sums from cumulative sums; the scale does not matter after normalizing
+        sums = np.cumsum(np.vstack([np.zeros((1, 12), dtype=np.float32), frames]), axis=0)
+        windows = sums[self.window:] - sums[:-self.window]
+        windows /= np.maximum(np.linalg.norm(windows, axis=1, keepdims=True), 1e-8)
+        silent_counts = np.concatenate([[0], np.cumsum(frames_silent)])
+        all_silent = (silent_counts[self.window:] - silent_counts[:-self.window]) == self.window
+
+        scores = windows @ CHORD_TEMPLATES.T
+        best = np.argmax(scores, axis=1)
+        frame_time = self.hop_length / self.sr
+
+        changes = []
+        for i, idx in enumerate(best):
+            if all_silent[i] or idx == self.current:
+                self._candidate = None
+                continue
+            if idx != self._candidate:
+                self._candidate = idx
+                self._candidate_time = (first_frame + i) * frame_time
+                self._candidate_hops = 0
+            self._candidate_hops += 1
+            if self._candidate_hops >= self.stable_hops:
+                self.current = idx
+                self._candidate = None
+                changes.append({
+                    "time": round(self._candidate_time, 3),
+                    "chord": chord_name(TEMPLATE_ROOTS[idx], TEMPLATE_QUALITIES[idx]),
+                    "score": round(float(scores[i, idx]), 4)
+                })
+        return changes
+
+class LiveSessionStore:
+    """
+    In-process registry of live detection sessions
+
+    Sessions idle for longer than ``timeout`` seconds are dropped, and at
+    most ``max_sessions`` are kept, so the memory used by live detection in
+    one process is bounded. Sessions are not shared between processes; a
+    multi-process deployment needs sticky routing on the session id.
+    """
+
+    def __init__(self, max_sessions=MAX_LIVE_SESSIONS, timeout=LIVE_SESSION_TIMEOUT):
+        self.max_sessions = max_sessions
+        self.timeout = timeout
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def create(self, **params):
+        """
+        Start a session and return (session_id, detector)
+
+        Returns (None, None) if the store is full; invalid parameters raise
+        ValueError.
+        """
+        detector = LiveChordDetector(**params)
+        with self._lock:
+            self._expire()
+            if len(self._sessions) >= self.max_sessions:
+                return None, None
+            session_id = uuid.uuid4().hex
+            self._sessions[session_id] = [detector, time.monotonic()]
+        return session_id, detector
+
+    def get(self, session_id):
+        """Return a session's detector and mark it active, or None"""
+        with self._lock:
+            self._expire()
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            entry[1] = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def close(self, session_id):
+        """Remove a session; return its detector, or None if unknown"""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        return entry[0] if entry else None
+
+    def _expire(self):
+        # Sessions are kept in least recently used order
+        deadline = time.monotonic() - self.timeout
+        while self._sessions:
+            session_id, (_, last_used) = next(iter(self._sessions.items()))
+            if last_used >= deadline:
+                break
+            del self._sessions[session_id]
@@ -0,0 +1,222 @@
+from collections import Counter, defaultdict
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from ..database.db import mongo
+
+# Longest n-gram stored in the index; longer queries are answered by
+# intersecting the positions of several shorter grams
+MAX_GRAM = 4
+
+# Shortest and longest chord patterns accepted by ``search``
+MIN_QUERY_LENGTH = 2
+MAX_QUERY_LENGTH = 8
+
+# Query token matching any single chord
+WILDCARD = '*'
+
+# Most song ids sent in one ``$in`` filter while intersecting candidates,
+# keeping each query far below MongoDB's 16 MB document limit
+MAX_IN_IDS = 10000
+
+class PatternIndex:
+    """
+    Inverted n-gram index over each song's roman-numeral chord sequence
+
+    Every 1- to ``MAX_GRAM``-chord window of a song is stored in the
+    ``pattern_index`` collection as ``{gram, song_id, positions, song_length}``
+    with a compound index on (gram, song_id), and the number of songs
+    containing each gram is kept in ``pattern_grams``. A query is split into
+    its concrete (non-wildcard) runs; each run is looked up by gram, the
+    rarest first, and the start positions are intersected, so matches are
+    found without scanning songs or progressions and may cross the 4-chord
+    blocks stored in ``chord_progressions``.
+    """
+
+    def index_song(self, song_id, sequence):
+        """
+        (Re)index one song's full chord sequence
+
+        Parameters:
+        -----------
+        song_id : str
+            Id of the song document
+        sequence : list
+            Roman numerals in song order, e.g. ['I', 'V', 'vi', 'IV', ...]
+        """
+        self.index_songs([(song_id, sequence)])
+
+    def index_songs(self, songs):
+        """
+        (Re)index several songs in one bulk write
+
+        Each song's grams are replaced in place: changed grams are upserted on
+        (gram, song_id), grams the song no longer contains are deleted and
+        unchanged ones are left alone, so concurrent indexers never race a
+        delete against an insert on the unique index. Gram song counts are
+        adjusted by the grams each song gained or lost.
+        """
+        songs = dict(songs)
+        if not songs:
+            return
+
+        existing = defaultdict(dict)
+        for doc in mongo.db.pattern_index.find(
+            {"song_id": {"$in": list(songs)}},
+            {"_id": 0, "gram": 1, "song_id": 1, "positions": 1, "song_length": 1}
+        ):
+            existing[doc["song_id"]][doc["gram"]] = doc
+
+        operations = []
+        gram_deltas = Counter()
+        for song_id, sequence in songs.items():
+            positions = defaultdict(list)
+            for n in range(1, MAX_GRAM + 1):
+                for start in range(len(sequence) - n + 1):
+                    positions["-".join(sequence[start:start + n])].append(start)
+
+            old = existing[song_id]
+            for gram, starts in positions.items():
+                previous = old.get(gram)
+                if previous is None:
+                    gram_deltas[gram] += 1
+                elif previous["positions"] == starts and previous["song_length"] == len(sequence):
+                    continue
+                operations.append(ReplaceOne(
+                    {"gram": gram, "song_id": song_id},
+                    {
+                        "gram": gram,
+                        "length": gram.count("-") + 1,
+                        "song_id": song_id,
+                        "positions": starts,
+                        "song_length": len(sequence)
+                    },
+                    upsert=True
+                ))
+
+            stale = [gram for gram in old if gram not in positions]
+            if stale:
+                operations.append(DeleteMany({"song_id": song_id, "gram": {"$in": stale}}))
+                gram_deltas.subtract(stale)
+
+        if operations:
+            try:
+                mongo.db.pattern_index.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # A concurrent indexer upserted the same (gram, song_id) first
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+
+        gram_updates = [
+            UpdateOne({"_id": gram}, {"$inc": {"songs": delta}}, upsert=True)
+            for gram, delta in gram_deltas.items() if delta
+        ]
+        if gram_updates:
+            mongo.db.pattern_grams.bulk_write(gram_updates, ordered=False)
+
+    def rebuild_gram_counts(self):
+        """Recount the songs containing each gram from ``pattern_index``"""
+        counts = mongo.db.pattern_index.aggregate([{"$group": {"_id": "$gram", "songs": {"$sum": 1}}}])
+        mongo.db.pattern_grams.delete_many({})
+        operations = [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in counts]
+        if operations:
+            mongo.db.pattern_grams.bulk_write(operations, ordered=False)
+        return len(operations)
+
+    def search(self, pattern, limit=20):
+        """
+        Find songs containing a chord pattern
+
+        Parameters:
+        -----------
+        pattern : str
+            Roman numerals joined by '-', 2 to 8 chords long; '*' matches any
+            single chord (e.g. 'ii-*-I' or 'I-V-vi-IV-I-V')
+        limit : int
+            Maximum number of songs returned
+
+        Returns:
+        --------
+        list
+            ``{"song_id", "positions"}`` per matching song, most occurrences first
+        """
+        tokens = parse_pattern(pattern)
+        pieces = self._query_pieces(tokens)
+
+        candidates = None
+        for offset, gram in pieces:
+            if candidates is None:
+                queries = [{"gram": gram}]
+            else:
+                song_ids = list(candidates)
+                queries = [
+                    {"gram": gram, "song_id": {"$in": song_ids[start:start + MAX_IN_IDS]}}
+                    for start in range(0, len(song_ids), MAX_IN_IDS)
+                ]
+
+            found = {}
+            for query in queries:
+                for doc in mongo.db.pattern_index.find(query, {"song_id": 1, "positions": 1, "song_length": 1}):
+                    last_start = doc["song_length"] - len(tokens)
+                    starts = {p - offset for p in doc["positions"] if offset <= p <= last_start + offset}
+                    if candidates is not None:
+                        starts &= candidates[doc["song_id"]]
+                    if starts:
+                        found[doc["song_id"]] = starts
+
+            candidates = found
+            if not candidates:
+                return []
+
+        matches = [
+            {"song_id": song_id, "positions": sorted(starts)}
+            for song_id, starts in candidates.items()
+        ]
+        matches.sort(key=lambda match: (-len(match["positions"]), match["song_id"]))
+        return matches[:limit]
+
+    def _query_pieces(self, tokens):
+        """
+        Split a pattern into (offset, gram) lookups covering all concrete chords
+
+        Contiguous concrete runs are cut into grams of at most ``MAX_GRAM``
+        chords. Grams are ordered by the number of songs containing them
+        (from ``pattern_grams``), rarest first, so the candidate set starts
+        small; grams without a count come first, longer grams breaking ties.
+        """
+        pieces = []
+        run_start = None
+        for i, token in enumerate(tokens + [WILDCARD]):
+            if token != WILDCARD and run_start is None:
+                run_start = i
+            elif token == WILDCARD and run_start is not None:
+                for start in range(run_start, i, MAX_GRAM):
+                    end = min(start + MAX_GRAM, i)
+                    pieces.append((start, "-".join(tokens[start:end])))
+                run_start = None
+
+        frequencies = {
+            doc["_id"]: doc["songs"]
+            for doc in mongo.db.pattern_grams.find({"_id": {"$in": [gram for _, gram in pieces]}})
+        }
+        pieces.sort(key=lambda piece: (frequencies.get(piece[1], 0), -(piece[1].count("-") + 1)))
+        return pieces
+
+def parse_pattern(pattern):
+    """Split a '-'-joined pattern into tokens, validating its length"""
+    tokens = [token.strip() for token in pattern.split("-")]
+    if not MIN_QUERY_LENGTH <= len(tokens) <= MAX_QUERY_LENGTH:
+        raise ValueError(
+            f"Pattern must contain {MIN_QUERY_LENGTH} to {MAX_QUERY_LENGTH} chords"
+        )
+    if not all(tokens):
+        raise ValueError("Pattern contains an empty chord")
+    if all(token == WILDCARD for token in tokens):
+        raise ValueError("Pattern must contain at least one chord")
+    return tokens
+
+def sequence_from_analysis(analysis_results):
+    """Rebuild a song's full roman-numeral sequence from its progressions"""
+    sequence = []
+    for prog in analysis_results.get("progressions", []):
+        sequence.extend(prog["chords"])
+    return sequence
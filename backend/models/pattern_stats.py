@@ -0,0 +1,177 @@
+from collections import Counter
+from itertools import groupby
+from bson import ObjectId
+from pymongo import UpdateOne, DESCENDING
+from ..database.db import mongo
+from ..database.cache_versions import PATTERNS_SCOPE, bump_versions
+
+# Number of example songs kept per pattern
+MAX_EXAMPLES = 5
+
+# Well-known progressions, with the names and examples shown for them
+COMMON_PROGRESSIONS = [
+    {"pattern": "I-V-vi-IV", "name": "Pop Progression", "examples": ["Let It Be", "Don't Stop Believin'"]},
+    {"pattern": "I-IV-V", "name": "Blues Progression", "examples": ["Sweet Home Alabama", "Twist and Shout"]},
+    {"pattern": "ii-V-I", "name": "Jazz Progression", "examples": ["Autumn Leaves", "Fly Me to the Moon"]},
+    {"pattern": "vi-IV-I-V", "name": "Axis of Awesome", "examples": ["Let It Be", "No Woman No Cry"]},
+    {"pattern": "I-vi-IV-V", "name": "50s Progression", "examples": ["Stand By Me", "Earth Angel"]},
+    {"pattern": "i-bVI-bIII-bVII", "name": "Andalusian Cadence", "examples": ["Hit the Road Jack", "Sultans of Swing"]}
+]
+
+class PatternStats:
+    """
+    Materialized per-pattern statistics in the ``pattern_stats`` collection
+
+    Each document holds a pattern's total occurrence count, the number of
+    songs using it, per-language and per-key song counts and up to
+    ``MAX_EXAMPLES`` example songs. Documents are updated with ``$inc`` and
+    capped ``$push`` whenever a song's analysis is saved, so reading the
+    most common patterns is a single indexed query however large the corpus.
+    """
+
+    def __init__(self, known_patterns=None):
+        # Names and well-known examples for common patterns, keyed by pattern
+        self.known_patterns = {p["pattern"]: p for p in (known_patterns or [])}
+
+    def record_song(self, song, analysis_results):
+        """Add one analyzed song to the statistics"""
+        self.record_songs([(song, analysis_results)])
+
+    def record_songs(self, entries):
+        """
+        Add several analyzed songs to the statistics with one bulk write
+
+        Parameters:
+        -----------
+        entries : list
+            (song, analysis_results) pairs; ``song`` needs ``_id`` and may
+            carry ``title``, ``artist`` and ``language``
+        """
+        self.update_songs([(song, analysis_results, None) for song, analysis_results in entries])
+
+    def update_songs(self, entries):
+        """
+        Apply re-analyzed songs to the statistics as a diff, with one bulk write
+
+        Parameters:
+        -----------
+        entries : list
+            (song, analysis_results, previous) tuples, where ``previous`` is
+            the (key, pattern Counter) the song was last counted with, or None
+            for a song not yet counted. Only the difference is applied, and
+            patterns no song uses any more are deleted.
+        """
+        operations = []
+        for song, analysis_results, previous in entries:
+            patterns = Counter(prog["pattern"] for prog in analysis_results.get("progressions", []))
+            operations.extend(self._song_updates(song, analysis_results.get("key"), patterns, previous))
+
+        if operations:
+            mongo.db.pattern_stats.bulk_write(operations, ordered=False)
+            if any(previous for _, _, previous in entries):
+                mongo.db.pattern_stats.delete_many({"song_count": {"$lte": 0}})
+            bump_versions([PATTERNS_SCOPE])
+
+    def top_patterns(self, limit=20):
+        """Return the most frequent patterns, most common first"""
+        return list(
+            mongo.db.pattern_stats.find({}, {"_id": 0})
+            .sort("count", DESCENDING)
+            .limit(limit)
+        )
+
+    def rebuild(self, batch_size=1000):
+        """
+        Recompute all statistics from ``chord_progressions``
+
+        Used to backfill an existing corpus; progressions are streamed in
+        song order and songs are fetched ``batch_size`` at a time.
+        """
+        mongo.db.pattern_stats.delete_many({})
+        cursor = mongo.db.chord_progressions.find(
+            {}, {"song_id": 1, "progression_pattern": 1, "key": 1}
+        ).sort("song_id", 1)
+
+        def flush(batch):
+            ids = [ObjectId(song_id) for song_id in batch if ObjectId.is_valid(song_id)]
+            songs = {
+                str(song["_id"]): song
+                for song in mongo.db.songs.find(
+                    {"_id": {"$in": ids}},
+                    {"title": 1, "artist": 1, "language": 1, "key": 1, "audio_features.mode": 1}
+                )
+            }
+            operations = []
+            for song_id, (key, patterns) in batch.items():
+                song = songs.get(song_id, {"_id": song_id})
+                # Progressions saved before the analyzed key was stored fall back to Spotify's
+                operations.extend(self._song_updates(song, key or song_key_name(song), patterns))
+            if operations:
+                mongo.db.pattern_stats.bulk_write(operations, ordered=False)
+
+        batch = {}
+        for song_id, progressions in groupby(cursor, key=lambda prog: prog["song_id"]):
+            progressions = list(progressions)
+            batch[song_id] = (
+                progressions[0].get("key"),
+                Counter(prog["progression_pattern"] for prog in progressions)
+            )
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = {}
+        if batch:
+            flush(batch)
+        bump_versions([PATTERNS_SCOPE])
+
+    def _song_updates(self, song, key, patterns, previous=None):
+        """
+        Build the upserts moving one song's pattern counts to ``patterns``
+
+        ``previous`` is the (key, patterns) the song is currently counted
+        with, or None if it is not counted yet.
+        """
+        language = song.get("language") or "Unknown"
+        key = key or "Unknown"
+        old_key, old_patterns = previous or (None, Counter())
+        old_key = old_key or "Unknown"
+        song_id = str(song["_id"])
+        example = {
+            "song_id": song_id,
+            "title": song.get("title"),
+            "artist": song.get("artist")
+        }
+
+        operations = []
+        for pattern in patterns.keys() | old_patterns.keys():
+            has_new, has_old = int(pattern in patterns), int(pattern in old_patterns)
+            inc = Counter({
+                "count": patterns[pattern] - old_patterns[pattern],
+                "song_count": has_new - has_old,
+                f"by_language.{language}": has_new - has_old
+            })
+            inc[f"by_key.{old_key}"] -= has_old
+            inc[f"by_key.{key}"] += has_new
+            update = {"$inc": {field: delta for field, delta in inc.items() if delta}}
+            if has_new and not has_old:
+                known = self.known_patterns.get(pattern, {})
+                update["$setOnInsert"] = {
+                    "name": known.get("name", pattern),
+                    "examples": known.get("examples", [])
+                }
+                update["$push"] = {"db_examples": {"$each": [example], "$slice": MAX_EXAMPLES}}
+            elif has_old and not has_new:
+                update["$pull"] = {"db_examples": {"song_id": song_id}}
+            elif not update["$inc"]:
+                continue
+            operations.append(UpdateOne({"pattern": pattern}, update, upsert=bool(has_new)))
+        return operations
+
+def song_key_name(song):
+    """Return a song's key as a name like 'A' or 'F#m' from its stored Spotify fields"""
+    from .chord_analyzer import NOTE_NAMES
+
+    key = song.get("key")
+    if not isinstance(key, int) or not 0 <= key < 12:
+        return None
+    mode = song.get("audio_features", {}).get("mode", 1)
+    return NOTE_NAMES[key] + ("m" if mode == 0 else "")
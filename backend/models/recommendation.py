@@ -0,0 +1,362 @@
+import json
+import os
+import threading
+import zlib
+from datetime import datetime, timedelta
+from itertools import groupby
+
+import numpy as np
+from bson import ObjectId
+from ..database.db import mongo
+from ..database.cache_versions import ANALYSES_SCOPE, get_versions
+
+# Rows scored per matrix-vector product when searching the index
+SEARCH_BLOCK_ROWS = 65536
+
+# Songs saved up to this long before the last sync are read again by the
+# next one, covering bulk writes in flight and clock skew between hosts
+SYNC_OVERLAP = timedelta(seconds=60)
+
+class ChordRecommender:
+    """
+    Harmonic similarity search and recommendations over chord sequences
+
+    Each song's roman-numeral sequence (already relative to its key, so
+    transposition invariant) is turned into a fixed-length vector of hashed
+    n-gram TF-IDF weights and L2-normalized. Similarity is the dot product,
+    computed block by block over one float32 matrix, so a top-k query over a
+    million songs is a handful of BLAS calls.
+
+    Songs can be added or updated one batch at a time with ``add_songs``;
+    weights use the document frequencies known when a song is added, so a
+    periodic ``build_from_db`` keeps the IDF weighting fresh as the corpus
+    grows. Songs saved by other processes (e.g. the analysis workers) are
+    picked up with ``sync_from_db``.
+
+    Request threads add songs as their analyses are saved while a sync may
+    run in another thread, so every change to the index is made under one
+    lock; searches only take it to snapshot the matrix and song ids, and a
+    rebuild swaps in the new index at once.
+    """
+
+    def __init__(self, dim=256, ngram_range=(1, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self._buckets = {}
+        # Start of the last build or sync, and the analyses version it saw
+        self.synced_at = None
+        self.analyses_version = None
+        self._sync_lock = threading.Lock()
+        # Held while the index is changed
+        self._lock = threading.Lock()
+        self.doc_freq = np.zeros(self.dim, dtype=np.int64)
+        self.n_docs = 0
+        self.song_ids = []
+        self._rows = {}
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.song_ids)
+
+    def __contains__(self, song_id):
+        return song_id in self._rows
+
+    def term_frequencies(self, sequence):
+        """Return the sublinear, signed, hashed n-gram counts of one sequence"""
+        counts = np.zeros(self.dim, dtype=np.float32)
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for start in range(len(sequence) - n + 1):
+                bucket, sign = self._bucket("-".join(sequence[start:start + n]))
+                counts[bucket] += sign
+        nonzero = counts != 0
+        counts[nonzero] = np.sign(counts[nonzero]) * (1 + np.log(np.abs(counts[nonzero])))
+        return counts
+
+    def vectorize(self, sequence):
+        """Return the normalized TF-IDF vector of a sequence under the current corpus"""
+        return self._normalize(self.term_frequencies(sequence) * self._idf())
+
+    def add_songs(self, songs):
+        """
+        Add or update songs in the index
+
+        Parameters:
+        -----------
+        songs : iterable
+            (song_id, sequence) pairs, where sequence is a list of roman numerals
+        """
+        with self._lock:
+            self._add_songs(songs)
+
+    def _add_songs(self, songs):
+        """``add_songs`` for a caller holding ``_lock``"""
+        # A song listed twice is counted once, with its last sequence
+        songs = [(song_id, sequence) for song_id, sequence in dict(songs).items() if sequence]
+        if not songs:
+            return
+
+        tf = np.stack([self.term_frequencies(sequence) for _, sequence in songs])
+
+        # Replace the contribution of songs that are already indexed
+        for song_id, _ in songs:
+            row = self._rows.get(song_id)
+            if row is not None:
+                self.doc_freq -= self._vectors[row] != 0
+                self.n_docs -= 1
+        self.doc_freq += (tf != 0).sum(axis=0)
+        self.n_docs += len(songs)
+
+        vectors = self._normalize(tf * self._idf())
+        new_ids = [song_id for song_id, _ in songs if song_id not in self._rows]
+        self._reserve(len(self.song_ids) + len(new_ids))
+        for song_id, vector in zip((song_id for song_id, _ in songs), vectors):
+            row = self._rows.get(song_id)
+            if row is None:
+                row = len(self.song_ids)
+                self._rows[song_id] = row
+                self.song_ids.append(song_id)
+            self._vectors[row] = vector
+
+    def build_from_db(self, batch_size=1000):
+        """
+        Rebuild the whole index from ``chord_progressions``
+
+        Document frequencies are counted in a first pass so every song is
+        weighted with the final IDF.
+        """
+        synced_at = datetime.utcnow()
+        analyses_version, = get_versions([ANALYSES_SCOPE])
+        sequences = [(song_id, sequence) for song_id, sequence in iter_song_sequences() if sequence]
+
+        # Built aside and swapped in, so searches meanwhile use the old index
+        doc_freq = np.zeros(self.dim, dtype=np.int64)
+        for start in range(0, len(sequences), batch_size):
+            batch = sequences[start:start + batch_size]
+            tf = np.stack([self.term_frequencies(sequence) for _, sequence in batch])
+            doc_freq += (tf != 0).sum(axis=0)
+
+        idf = (np.log((1 + len(sequences)) / (1 + doc_freq)) + 1).astype(np.float32)
+        vectors = np.zeros((max(len(sequences), 1024), self.dim), dtype=np.float32)
+        for start in range(0, len(sequences), batch_size):
+            batch = sequences[start:start + batch_size]
+            tf = np.stack([self.term_frequencies(sequence) for _, sequence in batch])
+            vectors[start:start + len(batch)] = self._normalize(tf * idf)
+        song_ids = [song_id for song_id, _ in sequences]
+
+        with self._lock:
+            self.doc_freq = doc_freq
+            self.n_docs = len(sequences)
+            self.song_ids = song_ids
+            self._rows = {song_id: row for row, song_id in enumerate(song_ids)}
+            self._vectors = vectors
+            self.synced_at = synced_at
+            self.analyses_version = analyses_version
+        return self
+
+    def sync_from_db(self):
+        """
+        Add or update the songs saved since the last build or sync
+
+        Costs one ``cache_versions`` read when no analysis was saved since;
+        otherwise only songs whose progressions were saved after the last
+        sync (less ``SYNC_OVERLAP``) are read. A sync already running in
+        another thread is not waited for.
+
+        Returns the number of songs (re)indexed.
+        """
+        if not self._sync_lock.acquire(blocking=False):
+            return 0
+        try:
+            analyses_version, = get_versions([ANALYSES_SCOPE])
+            if analyses_version == self.analyses_version:
+                return 0
+
+            synced_at = datetime.utcnow()
+            if self.synced_at is None:
+                sequences = list(iter_song_sequences())
+            else:
+                song_ids = mongo.db.chord_progressions.distinct(
+                    "song_id", {"saved_at": {"$gte": self.synced_at - SYNC_OVERLAP}}
+                )
+                sequences = list(iter_song_sequences(song_ids)) if song_ids else []
+
+            with self._lock:
+                self._add_songs(sequences)
+                self.synced_at = synced_at
+                self.analyses_version = analyses_version
+            return len(sequences)
+        finally:
+            self._sync_lock.release()
+
+    def similar_songs(self, song_id, k=10):
+        """Return the ``k`` songs harmonically closest to ``song_id``"""
+        vector = self._vector(song_id)
+        if vector is None:
+            return []
+        return self.search(vector, k, exclude={song_id})
+
+    def recommend_for_user(self, user_id, k=10):
+        """
+        Recommend songs for a user from their saved preferences
+
+        The user profile is the rating-weighted sum of the vectors of their
+        saved songs and saved chord progressions; songs they already saved
+        are excluded.
+        """
+        preferences = list(mongo.db.user_preferences.find(
+            {"user_id": user_id}, {"song_id": 1, "chord_progression_id": 1, "rating": 1}
+        ))
+
+        progression_ids = [
+            ObjectId(pref["chord_progression_id"]) for pref in preferences
+            if ObjectId.is_valid(pref.get("chord_progression_id") or "")
+        ]
+        progressions = {
+            str(prog["_id"]): prog["progression"]
+            for prog in mongo.db.chord_progressions.find(
+                {"_id": {"$in": progression_ids}}, {"progression": 1}
+            )
+        } if progression_ids else {}
+
+        profile = np.zeros(self.dim, dtype=np.float32)
+        saved = set()
+        for pref in preferences:
+            rating = pref.get("rating")
+            weight = float(rating) if isinstance(rating, (int, float)) else 1.0
+            vector = self._vector(pref.get("song_id"))
+            if vector is not None:
+                profile += weight * vector
+                saved.add(pref["song_id"])
+            chords = progressions.get(pref.get("chord_progression_id"))
+            if chords:
+                profile += weight * self.vectorize(chords)
+
+        if not profile.any():
+            return []
+        return self.search(profile, k, exclude=saved)
+
+    def search(self, query, k=10, exclude=()):
+        """
+        Return the ``k`` indexed songs with the highest cosine similarity to ``query``
+
+        Scores are computed ``SEARCH_BLOCK_ROWS`` rows at a time; each block
+        keeps only its own top candidates, which are merged at the end.
+        """
+        query = self._normalize(np.asarray(query, dtype=np.float32)[None, :])[0]
+        # Rows below n_songs of this matrix are never moved, only rewritten,
+        # so the snapshot stays valid while songs are added
+        with self._lock:
+            vectors, song_ids, n_songs = self._vectors, self.song_ids, len(self.song_ids)
+        keep = k + len(exclude)
+
+        candidate_rows = []
+        candidate_scores = []
+        for start in range(0, n_songs, SEARCH_BLOCK_ROWS):
+            scores = vectors[start:min(start + SEARCH_BLOCK_ROWS, n_songs)] @ query
+            if len(scores) > keep:
+                top = np.argpartition(-scores, keep)[:keep]
+            else:
+                top = np.arange(len(scores))
+            candidate_rows.append(top + start)
+            candidate_scores.append(scores[top])
+
+        if not candidate_rows:
+            return []
+        rows = np.concatenate(candidate_rows)
+        scores = np.concatenate(candidate_scores)
+
+        results = []
+        for i in np.argsort(-scores):
+            song_id = song_ids[rows[i]]
+            if song_id in exclude:
+                continue
+            results.append({"song_id": song_id, "score": round(float(scores[i]), 4)})
+            if len(results) == k:
+                break
+        return results
+
+    def save(self, path):
+        """Write the index to a directory"""
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            vectors = self._vectors[:len(self.song_ids)].copy()
+            doc_freq = self.doc_freq.copy()
+            meta = {
+                "dim": self.dim,
+                "ngram_range": list(self.ngram_range),
+                "n_docs": self.n_docs,
+                "song_ids": list(self.song_ids),
+                "synced_at": self.synced_at.isoformat() if self.synced_at else None,
+                "analyses_version": self.analyses_version
+            }
+        np.save(os.path.join(path, "vectors.npy"), vectors)
+        np.save(os.path.join(path, "doc_freq.npy"), doc_freq)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by ``save``"""
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        recommender = cls(meta["dim"], tuple(meta["ngram_range"]))
+        recommender._vectors = np.load(os.path.join(path, "vectors.npy"))
+        recommender.doc_freq = np.load(os.path.join(path, "doc_freq.npy"))
+        recommender.n_docs = meta["n_docs"]
+        recommender.song_ids = meta["song_ids"]
+        recommender._rows = {song_id: row for row, song_id in enumerate(recommender.song_ids)}
+        # Indexes saved without a sync point are brought up to date by a full sync
+        if meta.get("synced_at"):
+            recommender.synced_at = datetime.fromisoformat(meta["synced_at"])
+            recommender.analyses_version = meta.get("analyses_version")
+        return recommender
+
+    def _bucket(self, gram):
+        """Map an n-gram to a (bucket, sign) pair with a stable hash"""
+        bucket = self._buckets.get(gram)
+        if bucket is None:
+            h = zlib.crc32(gram.encode("utf-8"))
+            bucket = self._buckets[gram] = (h % self.dim, 1.0 if (h >> 31) & 1 else -1.0)
+        return bucket
+
+    def _vector(self, song_id):
+        """Return a copy of an indexed song's vector, or None"""
+        with self._lock:
+            row = self._rows.get(song_id)
+            return None if row is None else self._vectors[row].copy()
+
+    def _idf(self):
+        return (np.log((1 + self.n_docs) / (1 + self.doc_freq)) + 1).astype(np.float32)
+
+    def _reserve(self, n_rows):
+        """Grow the vector matrix geometrically so appends are amortized O(1)"""
+        if n_rows <= len(self._vectors):
+            return
+        capacity = max(n_rows, 2 * len(self._vectors), 1024)
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:len(self.song_ids)] = self._vectors[:len(self.song_ids)]
+        self._vectors = vectors
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return (vectors / np.maximum(norms, 1e-8)).astype(np.float32)
+
+def iter_song_sequences(song_ids=None):
+    """
+    Yield (song_id, sequence) for every song with saved progressions
+
+    Progressions are streamed in song order; within a song they are ordered
+    by ``section_index`` when present. ``song_ids`` limits the songs read.
+    """
+    query = {"song_id": {"$in": list(song_ids)}} if song_ids is not None else {}
+    cursor = mongo.db.chord_progressions.find(
+        query, {"song_id": 1, "section_index": 1, "progression": 1}
+    ).sort([("song_id", 1), ("section_index", 1)])
+
+    for song_id, progressions in groupby(cursor, key=lambda prog: prog["song_id"]):
+        sequence = []
+        for prog in progressions:
+            sequence.extend(prog.get("progression") or [])
+        yield song_id, sequence
@@ -0,0 +1,158 @@
+"""
+Background analysis workers
+
+Usage (from the repository root):
+
+    python -m backend.worker --processes 4
+
+Each process claims jobs from the ``jobs`` collection (see ``JobQueue``),
+highest priority first, fetches the track from Spotify if it is not in the
+database yet, analyzes it and saves the results. Web workers only enqueue
+jobs, so analysis throughput scales with the number of worker processes
+independently of the web tier. SIGINT/SIGTERM stop the workers after their
+current job.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+from dotenv import load_dotenv
+
+from .database.db import mongo
+from .models.job_queue import JobQueue, JOB_LEASE_SECONDS, LEASE_RENEWALS, MAX_ATTEMPTS
+
+def run_job(job, spotify_api, chord_analyzer):
+    """Run one ``analyze_song`` job and return its result"""
+    from .api.song_service import ANALYSIS_DONE, get_or_create_song, analyze_song, record_analysis_status
+
+    song, bundle = get_or_create_song(spotify_api, job["spotify_id"])
+    song_id = str(song["_id"])
+
+    # Another path (e.g. a batch run) may have analyzed the song meanwhile
+    progressions = mongo.db.chord_progressions.count_documents({"song_id": song_id})
+    if not progressions:
+        progressions = len(analyze_song(spotify_api, chord_analyzer, song, bundle))
+    record_analysis_status(job["spotify_id"], ANALYSIS_DONE, attempts=job["attempts"])
+    return {"song_id": song_id, "progressions": progressions}
+
+def renew_lease(app, queue, job, stop):
+    """
+    Renew a running job's lease until ``stop`` is set, in a background thread
+
+    An analysis may outlast the lease (long tracks, slow Spotify responses),
+    so the lease is extended ``LEASE_RENEWALS`` times per lease period; it
+    stops early if the job was lost to another worker.
+    """
+    def heartbeat():
+        with app.app_context():
+            while not stop.wait(queue.lease_seconds / LEASE_RENEWALS):
+                if not queue.renew(job):
+                    print(f"[{job.get('worker')}] lost the lease on {job['spotify_id']}", file=sys.stderr)
+                    return
+
+    thread = threading.Thread(target=heartbeat, name='job-lease', daemon=True)
+    thread.start()
+    return thread
+
+def work(worker_id, poll_interval=1.0, lease_seconds=JOB_LEASE_SECONDS, max_attempts=MAX_ATTEMPTS,
+         stop=None, max_jobs=None):
+    """
+    Claim and run jobs until ``stop`` is set (or ``max_jobs`` have run)
+
+    Must be called inside an app context. Returns the number of jobs run.
+    """
+    from flask import current_app
+    from .api.routes import get_spotify_api, get_chord_analyzer
+    from .api.song_service import ANALYSIS_FAILED, record_analysis_status
+    from .api.spotify import SpotifyError
+
+    queue = JobQueue(lease_seconds=lease_seconds, max_attempts=max_attempts)
+    spotify_api = get_spotify_api()
+    chord_analyzer = get_chord_analyzer()
+
+    done = 0
+    while not (stop and stop.is_set()) and (max_jobs is None or done < max_jobs):
+        job = queue.claim(worker_id, job_types=("analyze_song",))
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        started = time.perf_counter()
+        job_done = threading.Event()
+        heartbeat = renew_lease(current_app._get_current_object(), queue, job, job_done)
+        try:
+            result = run_job(job, spotify_api, chord_analyzer)
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+            # An unknown track fails the same way every time
+            retry = not (isinstance(e, SpotifyError) and e.not_found)
+            queue.fail(job, error, retry=retry)
+            if not retry or job["attempts"] >= queue.max_attempts:
+                record_analysis_status(job["spotify_id"], ANALYSIS_FAILED, attempts=job["attempts"], error=error)
+            print(f"[{worker_id}] {job['spotify_id']} failed (attempt {job['attempts']})", file=sys.stderr)
+        else:
+            queue.complete(job, result)
+            print(f"[{worker_id}] {job['spotify_id']} done in {time.perf_counter() - started:.1f}s")
+        finally:
+            job_done.set()
+            heartbeat.join()
+        done += 1
+    return done
+
+def _worker_main(index, args, stop):
+    """Entry point of one worker process"""
+    from .app import create_app
+
+    # The parent handles SIGINT/SIGTERM and sets ``stop``; don't abort mid-job
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    # Workers only write analyses; the web processes' recommenders sync them
+    os.environ['RECOMMENDER_PRELOAD'] = '0'
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    with create_app().app_context():
+        work(worker_id, poll_interval=args.poll_interval, lease_seconds=args.lease_seconds,
+             max_attempts=args.max_attempts, stop=stop)
+
+def main(argv=None):
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Run background analysis workers")
+    parser.add_argument('--processes', type=int, default=int(os.getenv('ANALYSIS_WORKERS', 2)),
+                        help="Worker processes")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to wait when the queue is empty")
+    parser.add_argument('--lease-seconds', type=int, default=JOB_LEASE_SECONDS,
+                        help="Seconds before a job held by an unresponsive worker is retried")
+    parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS, help="Attempts before a job fails")
+    args = parser.parse_args(argv)
+
+    # Each process opens its own MongoDB connection after it starts
+    context = multiprocessing.get_context('spawn')
+    stop = context.Event()
+    processes = [
+        context.Process(target=_worker_main, args=(i, args, stop), name=f"analysis-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def request_stop(signum, frame):
+        print("Stopping workers after their current job...")
+        stop.set()
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    for process in processes:
+        process.join()
+    return 0 if all(process.exitcode == 0 for process in processes) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
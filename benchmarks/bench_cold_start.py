@@ -0,0 +1,91 @@
+"""
+Cold start of a web worker: time from process spawn to its first response
+
+    python -m benchmarks.bench_cold_start --runs 5
+
+Each run starts a fresh interpreter that imports ``backend.app``, calls
+``create_app`` and serves ``GET /`` and ``GET /api/lyrics/<id>`` through the
+test client, mimicking a gunicorn worker's first request on an endpoint that
+needs neither audio analysis nor Spotify. The child reports the time spent in
+each phase and whether librosa was imported; the parent measures total wall
+time including interpreter startup. For comparison, the cost of importing the
+audio stack that is now deferred is measured the same way.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+WORKER_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+from backend.app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+client = app.test_client()
+client.get('/')
+client.get('/api/lyrics/cold-start')
+responded = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - start,
+    "create_app_s": created - imported,
+    "first_response_s": responded - created,
+    "librosa_loaded": "librosa.core" in sys.modules
+}))
+"""
+
+AUDIO_STACK_SNIPPET = """
+import json, time
+start = time.perf_counter()
+from librosa.core import load
+from librosa.feature import chroma_cqt
+print(json.dumps({"import_s": time.perf_counter() - start}))
+"""
+
+def run_child(snippet, repo_root):
+    """Run a snippet in a fresh interpreter; return (wall seconds, reported JSON)"""
+    env = dict(os.environ, MONGO_CREATE_INDEXES="0", RECOMMENDER_PRELOAD="0")
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=repo_root, env=env,
+        check=True, capture_output=True, text=True
+    ).stdout
+    wall = time.perf_counter() - start
+    return wall, json.loads(output.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    worker_runs = [run_child(WORKER_SNIPPET, repo_root) for _ in range(args.runs)]
+    audio_runs = [run_child(AUDIO_STACK_SNIPPET, repo_root) for _ in range(args.runs)]
+
+    median = statistics.median
+    results = {
+        "time_to_first_response_s": median(wall for wall, _ in worker_runs),
+        "import_s": median(report["import_s"] for _, report in worker_runs),
+        "create_app_s": median(report["create_app_s"] for _, report in worker_runs),
+        "first_response_s": median(report["first_response_s"] for _, report in worker_runs),
+        "librosa_loaded": any(report["librosa_loaded"] for _, report in worker_runs),
+        "deferred_audio_import_s": median(report["import_s"] for _, report in audio_runs)
+    }
+
+    print(f"time to first response: {results['time_to_first_response_s'] * 1000:.0f} ms "
+          f"(median of {args.runs} workers)")
+    print(f"  import backend.app:   {results['import_s'] * 1000:.0f} ms")
+    print(f"  create_app:           {results['create_app_s'] * 1000:.0f} ms")
+    print(f"  first responses:      {results['first_response_s'] * 1000:.0f} ms")
+    print(f"  librosa imported:     {results['librosa_loaded']}")
+    print(f"deferred librosa import (paid on first analysis): "
+          f"{results['deferred_audio_import_s'] * 1000:.0f} ms")
+    return results
+
+if __name__ == "__main__":
+    main()
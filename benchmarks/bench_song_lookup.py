@@ -0,0 +1,156 @@
+"""
+Cold-miss latency of the Spotify fetch stage behind GET /api/songs/<spotify_id>
+
+Runs against a local stub of the Spotify API that adds a fixed latency to
+every response, so the numbers reflect round trips rather than network noise.
+
+    python -m benchmarks.bench_song_lookup --requests 200 --latency-ms 40
+
+"before" replays the original serial call sequence (track, audio-features,
+track again for language detection, audio-features again and audio-analysis);
+"after" uses ``fetch_track_bundle`` and classifies the language of the
+fetched track offline. Every request uses a new track id, so both runs are
+cache misses.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from backend.api.spotify import SpotifyAPI
+from backend.models.language_classifier import detect_languages, spotify_track_text
+
+class StubSpotifyHandler(BaseHTTPRequestHandler):
+    """Minimal Spotify API stand-in serving canned JSON after a fixed delay"""
+
+    latency = 0.04
+    request_count = 0
+    _count_lock = threading.Lock()
+
+    def _respond(self, payload, status=200):
+        time.sleep(self.latency)
+        with self._count_lock:
+            StubSpotifyHandler.request_count += 1
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._respond({"access_token": "stub-token", "expires_in": 3600})
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        ids = parse_qs(query).get("ids", [""])[0].split(",")
+        track_id = path.rstrip("/").rsplit("/", 1)[-1]
+        # Ids starting with 'missing' are unknown to Spotify
+        if track_id.startswith("missing"):
+            self._respond({"error": {"status": 404, "message": "Non existing id"}}, status=404)
+        elif path.endswith("/tracks"):
+            self._respond({"tracks": [self._track(i) for i in ids]})
+        elif path.endswith("/audio-features"):
+            self._respond({"audio_features": [self._features(i) for i in ids]})
+        elif "/tracks/" in path:
+            self._respond(self._track(track_id))
+        elif "/audio-features/" in path:
+            self._respond(self._features(track_id))
+        elif "/audio-analysis/" in path:
+            self._respond({"sections": [{"start": i * 30.0, "duration": 30.0} for i in range(8)]})
+        else:
+            self._respond({})
+
+    @staticmethod
+    def _track(track_id):
+        return {
+            "id": track_id, "name": f"Song {track_id}",
+            "artists": [{"name": "Stub Artist"}],
+            "album": {"name": "Stub Album", "release_date": "2020-01-01"},
+            "available_markets": ["US", "GB", "MX"]
+        }
+
+    @staticmethod
+    def _features(track_id):
+        return {"id": track_id, "key": 0, "mode": 1, "tempo": 120.0, "time_signature": 4}
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server(latency):
+    """Start the stub Spotify server on a free local port and return it"""
+    StubSpotifyHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubSpotifyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def make_client(server, **kwargs):
+    """Create a SpotifyAPI client pointed at the stub server"""
+    host, port = server.server_address
+    api = SpotifyAPI(client_id="stub", client_secret="stub", **kwargs)
+    api.base_url = f"http://{host}:{port}/v1"
+    api.token_url = f"http://{host}:{port}/api/token"
+    return api
+
+def serial_lookup(api, track_id):
+    """The original get_song miss path: five serial requests"""
+    api.get_track(track_id)
+    api.get_audio_features(track_id)
+    # The market-based language guess fetched the track again
+    api.get_track(track_id)
+    api.get_audio_features(track_id)
+    api.get_audio_analysis(track_id)
+
+def concurrent_lookup(api, track_id):
+    """The current get_song miss path: one concurrent fetch stage"""
+    bundle = api.fetch_track_bundle(track_id)
+    detect_languages([spotify_track_text(bundle["track"])])
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+def measure(lookup, api, n_requests, prefix):
+    latencies = []
+    start_count = StubSpotifyHandler.request_count
+    for i in range(n_requests):
+        start = time.perf_counter()
+        lookup(api, f"{prefix}{i}")
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "http_requests_per_lookup": (StubSpotifyHandler.request_count - start_count) / n_requests
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    args = parser.parse_args(argv)
+
+    server = start_stub_server(args.latency_ms / 1000)
+    try:
+        # Fetch the token outside the timed region for both clients
+        before_api = make_client(server, cache_ttl=0)
+        before_api._get_auth_header()
+        after_api = make_client(server)
+        after_api._get_auth_header()
+
+        results = {
+            "before": measure(serial_lookup, before_api, args.requests, "before"),
+            "after": measure(concurrent_lookup, after_api, args.requests, "after")
+        }
+    finally:
+        server.shutdown()
+
+    for name, result in results.items():
+        print(f"{name:>6}: p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, "
+              f"{result['http_requests_per_lookup']:.1f} HTTP requests per lookup")
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Synthetic audio and database fixtures shared by the benchmarks
+
+Audio fixtures are chord-tone sine mixtures (root, third and fifth with a
+few harmonics, plus a little noise) cycling through a fixed progression, so
+the analyzer has real harmonic content to detect. They are generated once
+per duration and kept as WAV files in the fixture directory.
+"""
+import os
+import random
+
+import numpy as np
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".fixtures")
+
+# Named fixture durations in seconds
+AUDIO_DURATIONS = {"30s": 30, "3min": 180, "30min": 1800}
+
+# Progression used for the synthetic audio, as (root pitch class, intervals)
+PROGRESSION = [(0, (0, 4, 7)), (9, (0, 3, 7)), (5, (0, 4, 7)), (7, (0, 4, 7))]
+
+ROMAN_PATTERNS = ["I-V-vi-IV", "I-IV-V", "ii-V-I", "vi-IV-I-V", "I-vi-IV-V", "i-bVI-bIII-bVII"]
+
+def synth_chord_audio(duration, sr=22050, chord_seconds=2.0, seed=0):
+    """Return ``duration`` seconds of mono float32 audio cycling through ``PROGRESSION``"""
+    rng = np.random.default_rng(seed)
+    chord_samples = int(chord_seconds * sr)
+    t = np.arange(chord_samples) / sr
+
+    # Render each chord of the progression once and tile it
+    fade = np.minimum(1.0, np.minimum(t, t[::-1]) / 0.02)
+    cycle = []
+    for root, intervals in PROGRESSION:
+        y = np.zeros(chord_samples)
+        for interval in intervals:
+            freq = 261.63 * 2 ** ((root + interval) / 12)
+            for harmonic, gain in ((1, 1.0), (2, 0.4), (3, 0.2)):
+                y += gain * np.sin(2 * np.pi * freq * harmonic * t)
+        cycle.append(y * fade)
+    cycle = np.concatenate(cycle)
+
+    n_samples = int(duration * sr)
+    y = np.tile(cycle, n_samples // len(cycle) + 1)[:n_samples]
+    y += 0.01 * rng.standard_normal(n_samples)
+    return (0.2 * y / np.abs(y).max()).astype(np.float32)
+
+def audio_fixture(name, sr=22050, fixture_dir=FIXTURE_DIR):
+    """Return the path of the named audio fixture, generating it on first use"""
+    import soundfile
+
+    path = os.path.join(fixture_dir, f"chords_{name}_{sr}.wav")
+    if not os.path.exists(path):
+        os.makedirs(fixture_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        soundfile.write(tmp_path, synth_chord_audio(AUDIO_DURATIONS[name], sr=sr), sr, format="WAV")
+        os.replace(tmp_path, path)
+    return path
+
+def synthetic_analysis(rng, n_progressions=8):
+    """Return analysis results shaped like ``analyze_track_from_spotify`` output"""
+    patterns = [rng.choice(ROMAN_PATTERNS) for _ in range(n_progressions)]
+    return {
+        "key": rng.choice(["C", "G", "D", "Am", "Em"]),
+        "progressions": [{"pattern": p, "chords": p.split("-"), "confidence": 0.8} for p in patterns]
+    }
+
+def seed_database(db, analyzer, n_songs=1000, n_preferences=200, user_id="bench-user", seed=0):
+    """
+    Fill a database with songs, analyses and one user's preferences
+
+    Progression documents are built with ``ChordAnalyzer`` and statistics
+    recorded through its ``PatternStats`` as the application does, but
+    written with plain inserts (and without the pattern index) so seeding
+    stays fast on mongomock, which checks unique indexes and upserts by
+    scanning.
+    """
+    rng = random.Random(seed)
+    songs = [
+        {
+            "title": f"Song {i}",
+            "artist": f"Artist {i % 97}",
+            "spotify_id": f"seed{i}",
+            "language": rng.choice(["English", "Spanish", "French", "Portuguese"]),
+            "key": rng.randrange(12),
+            "audio_features": {"mode": rng.randrange(2), "tempo": 120.0}
+        }
+        for i in range(n_songs)
+    ]
+    db.songs.insert_many(songs)
+
+    analyses = [synthetic_analysis(rng) for _ in songs]
+    db.chord_progressions.insert_many([
+        doc
+        for song, analysis in zip(songs, analyses)
+        for doc in analyzer.build_progression_documents(str(song["_id"]), analysis)
+    ])
+    analyzer.pattern_stats.record_songs(list(zip(songs, analyses)))
+
+    progression_ids = [str(p["_id"]) for p in db.chord_progressions.find({}, {"_id": 1}).limit(n_preferences)]
+    preferences = []
+    for i in range(n_preferences):
+        if i % 2:
+            preferences.append({"user_id": user_id, "chord_progression_id": progression_ids[i % len(progression_ids)],
+                                "rating": rng.randint(1, 5), "tags": [], "notes": None})
+        else:
+            preferences.append({"user_id": user_id, "song_id": str(songs[i % n_songs]["_id"]),
+                                "rating": rng.randint(1, 5), "tags": [], "notes": None})
+    if preferences:
+        db.user_preferences.insert_many(preferences)
+    return songs
+
+def large_song(db, spotify_id, n_progressions=200, seed=0):
+    """Insert one song with full Spotify audio features and many progressions"""
+    rng = random.Random(seed)
+    features = {
+        "danceability": 0.7, "energy": 0.8, "key": 5, "loudness": -5.2, "mode": 1,
+        "speechiness": 0.04, "acousticness": 0.1, "instrumentalness": 0.0, "liveness": 0.1,
+        "valence": 0.6, "tempo": 118.0, "type": "audio_features", "id": spotify_id,
+        "uri": f"spotify:track:{spotify_id}", "track_href": f"https://api.spotify.com/v1/tracks/{spotify_id}",
+        "analysis_url": f"https://api.spotify.com/v1/audio-analysis/{spotify_id}",
+        "duration_ms": 215000, "time_signature": 4
+    }
+    song = {"title": "Large Song", "artist": "Bench Artist", "spotify_id": spotify_id, "album": "Bench Album",
+            "release_date": "2020-01-01", "tempo": 118.0, "key": 5, "language": "English",
+            "audio_features": features}
+    db.songs.insert_one(song)
+    db.chord_progressions.insert_many([
+        {
+            "song_id": str(song["_id"]),
+            "section_index": i,
+            "progression": pattern.split("-"),
+            "progression_pattern": pattern,
+            "section_type": "section",
+            "frequency": 1,
+            "confidence": 0.8
+        }
+        for i, pattern in enumerate(rng.choice(ROMAN_PATTERNS) for _ in range(n_progressions))
+    ])
+    return song
@@ -0,0 +1,359 @@
+"""
+Benchmark suite for the analysis and API hot paths
+
+    python -m benchmarks.suite                          # run every default case
+    python -m benchmarks.suite -k get_song -k patterns  # cases matching a substring
+    python -m benchmarks.suite --long                   # include the 30 min audio case
+    python -m benchmarks.suite --save-baseline main     # store results
+    python -m benchmarks.suite --compare main           # flag regressions against them
+
+Each case runs in a fresh interpreter so its peak RSS is its own, and
+reports latency percentiles over its repetitions and throughput in the
+case's unit (seconds of audio, chords or requests per second). Endpoint
+cases run through the Flask test client against mongomock (or the database
+given with --mongo-uri, which is wiped first) with the Spotify API served
+by the local stub from ``bench_song_lookup``.
+
+Baselines are JSON files in ``benchmarks/baselines/`` recording the commit
+they were taken at. ``--compare`` exits with status 1 if any case's p50
+latency or peak RSS grew by more than ``--threshold``.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# Registered cases: name -> (function, runs by default)
+CASES = {}
+
+def case(name, default=True):
+    """
+    Register a benchmark case
+
+    The function returns (latencies, units per run, unit) and optionally a
+    dict of extra values to report, such as ``response_bytes``.
+    """
+    def register(func):
+        CASES[name] = (func, default)
+        return func
+    return register
+
+def timed(func, repeat, warmup=1):
+    """Call ``func`` ``warmup + repeat`` times; return the timed durations in seconds"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+# Analysis cases
+
+def _analyze_audio_case(name, repeat, **params):
+    from .fixtures import audio_fixture, AUDIO_DURATIONS
+    from backend.models.chord_analyzer import ChordAnalyzer
+
+    path = audio_fixture(name)
+    analyzer = ChordAnalyzer()
+    # The first call pays for librosa's imports and JIT compilation
+    warmup = 0 if AUDIO_DURATIONS[name] > 600 else 1
+    return timed(lambda: analyzer.analyze_audio(path, **params), repeat, warmup), AUDIO_DURATIONS[name], "audio s"
+
+@case("analyze_audio[30s]")
+def bench_analyze_audio_30s(options):
+    return _analyze_audio_case("30s", 5)
+
+@case("analyze_audio[3min]")
+def bench_analyze_audio_3min(options):
+    return _analyze_audio_case("3min", 3)
+
+@case("analyze_audio[30min]", default=False)
+def bench_analyze_audio_30min(options):
+    return _analyze_audio_case("30min", 1)
+
+@case("analyze_audio[3min-beats]")
+def bench_analyze_audio_3min_beats(options):
+    return _analyze_audio_case("3min", 3, beats_per_chord=1)
+
+def _chroma(seconds, sr=22050, hop_length=512, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.random((12, int(seconds * sr / hop_length)), dtype=np.float32)
+
+@case("detect_chords[3min]")
+def bench_detect_chords(options):
+    from backend.models.chord_analyzer import ChordAnalyzer
+
+    analyzer = ChordAnalyzer()
+    chroma = _chroma(180)
+    n_chords = chroma.shape[1] // 10
+    return timed(lambda: analyzer._detect_chords(chroma), 50), n_chords, "chords"
+
+@case("identify_progressions[30min]")
+def bench_identify_progressions(options):
+    from backend.models.chord_analyzer import ChordAnalyzer
+
+    analyzer = ChordAnalyzer()
+    chords = analyzer._detect_chords(_chroma(1800))
+    return timed(lambda: analyzer.identify_progressions(chords), 20), len(chords), "chords"
+
+@case("classify_languages[1000 tracks]")
+def bench_classify_languages(options):
+    from backend.models.language_classifier import CLASSIFIER, TRAINING_TEXT
+
+    # Title-to-lyric-line sized snippets of every training language
+    sentences = [s.strip() for text in TRAINING_TEXT.values() for s in text.split(".") if s.strip()]
+    rng = np.random.default_rng(0)
+    texts = [" ".join(rng.choice(sentences, rng.integers(1, 4))) for _ in range(1000)]
+    return timed(lambda: CLASSIFIER.classify(texts), 20), len(texts), "tracks"
+
+# Endpoint cases
+
+def make_bench_app(mongo_uri=None, spotify_latency=0.0, seed=True):
+    """
+    Create the app against mongomock (or ``mongo_uri``) and a stub Spotify server
+
+    Returns (app, routes module, stub server); the database is seeded with
+    ``fixtures.seed_database`` unless ``seed`` is False.
+    """
+    os.environ["MONGO_URI"] = mongo_uri or "mongodb://localhost:27017/music_explorer_bench"
+    os.environ["MONGO_CREATE_INDEXES"] = "0"
+    os.environ["RECOMMENDER_PRELOAD"] = "0"
+    os.environ.setdefault("SPOTIFY_CLIENT_ID", "stub")
+    os.environ.setdefault("SPOTIFY_CLIENT_SECRET", "stub")
+
+    from backend.app import create_app
+    from backend.api import routes
+    from backend.database.db import mongo, ensure_indexes
+    from .bench_song_lookup import start_stub_server, make_client
+    from .fixtures import seed_database
+
+    app = create_app()
+    if mongo_uri:
+        mongo.cx.drop_database(mongo.db.name)
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("Endpoint benchmarks need mongomock (pip install mongomock) or --mongo-uri")
+        mongo.db = mongomock.MongoClient().db
+
+    server = start_stub_server(spotify_latency)
+    with app.app_context():
+        routes._services["spotify_api"] = make_client(server)
+        # Seed before indexing: mongomock checks unique indexes on every insert
+        if seed:
+            seed_database(mongo.db, routes.chord_analyzer)
+        ensure_indexes()
+    return app, routes, server
+
+def _endpoint_case(options, requests, repeat, configure=None):
+    """Time ``requests(client, i)`` for ``repeat`` iterations inside an app context"""
+    app, routes, server = make_bench_app(options.get("mongo_uri"))
+    try:
+        if configure:
+            configure(app)
+        client = app.test_client()
+        counter = iter(range(10 ** 9))
+        sizes = []
+
+        def request():
+            response = requests(client, next(counter))
+            if response.status_code >= 400:
+                raise RuntimeError(f"{response.status_code}: {response.get_data(as_text=True)[:200]}")
+            sizes.append(len(response.get_data()))
+
+        with app.app_context():
+            latencies = timed(request, repeat, warmup=5)
+        return latencies, 1, "requests", {"response_bytes": statistics.mean(sizes)}
+    finally:
+        server.shutdown()
+
+@case("get_song[hit]")
+def bench_get_song_hit(options):
+    return _endpoint_case(options, lambda client, i: client.get(f"/api/songs/seed{i % 1000}"), 500)
+
+@case("get_song[hit-large]")
+def bench_get_song_hit_large(options):
+    def configure(app):
+        from backend.database.db import mongo
+        from .fixtures import large_song
+
+        with app.app_context():
+            large_song(mongo.db, "large0")
+    return _endpoint_case(options, lambda client, i: client.get("/api/songs/large0"), 300, configure)
+
+@case("get_song[miss]")
+def bench_get_song_miss(options):
+    return _endpoint_case(options, lambda client, i: client.get(f"/api/songs/new{i}"), 500)
+
+@case("get_song[miss-sync]")
+def bench_get_song_miss_sync(options):
+    def configure(app):
+        app.config["ANALYSIS_MODE"] = "sync"
+    return _endpoint_case(options, lambda client, i: client.get(f"/api/songs/new{i}"), 50, configure)
+
+@case("get_chord_patterns")
+def bench_get_chord_patterns(options):
+    return _endpoint_case(options, lambda client, i: client.get("/api/patterns"), 500)
+
+@case("get_preferences")
+def bench_get_preferences(options):
+    return _endpoint_case(options, lambda client, i: client.get("/api/preferences/bench-user"), 100)
+
+# Running and reporting
+
+def percentile(samples, q):
+    return float(np.percentile(samples, q))
+
+def summarize(latencies, units, unit, extra=None):
+    """Turn raw durations into the reported statistics"""
+    mean = statistics.mean(latencies)
+    return dict(extra or {}, **{
+        "runs": len(latencies),
+        "mean_ms": mean * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "throughput": units / mean if mean else 0.0,
+        "unit": unit
+    })
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    return peak / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+def run_case_in_process(name, options):
+    """Run one case in this process and return its summary (or None if skipped)"""
+    func, _ = CASES[name]
+    outcome = func(options)
+    if outcome is None:
+        return None
+    result = summarize(*outcome)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+def run_case(name, options):
+    """Run one case in a fresh interpreter"""
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable, "-m", "benchmarks.suite", "--run-case", name, "--options", json.dumps(options)]
+    completed = subprocess.run(command, cwd=repo_root, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def baseline_path(name):
+    return name if name.endswith(".json") else os.path.join(BASELINE_DIR, f"{name}.json")
+
+def save_baseline(name, results):
+    path = baseline_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({
+            "commit": git_commit(),
+            "created": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results
+        }, f, indent=2, sort_keys=True)
+    return path
+
+def compare(baseline, results, threshold):
+    """Return (case, metric, old, new) for every metric worse than the baseline by ``threshold``"""
+    regressions = []
+    for name, result in results.items():
+        old = baseline["results"].get(name)
+        if not old or "error" in old or "error" in result:
+            continue
+        for metric in ("p50_ms", "peak_rss_mb"):
+            if result[metric] > old[metric] * (1 + threshold):
+                regressions.append((name, metric, old[metric], result[metric]))
+    return regressions
+
+def print_results(results, baseline=None):
+    print(f"{'case':<30} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'throughput':>20} {'peak RSS':>10}")
+    for name, result in results.items():
+        if "error" in result:
+            print(f"{name:<30} error: {result['error']}")
+            continue
+        line = (f"{name:<30} {result['p50_ms']:>10.2f} {result['p95_ms']:>10.2f} {result['p99_ms']:>10.2f} "
+                f"{result['throughput']:>12.1f} {result['unit'] + '/s':<7} {result['peak_rss_mb']:>7.0f} MB")
+        if "response_bytes" in result:
+            line += f" {result['response_bytes'] / 1024:>8.1f} KB"
+        old = (baseline or {}).get("results", {}).get(name)
+        if old and "error" not in old:
+            line += f"  (p50 {(result['p50_ms'] / old['p50_ms'] - 1) * 100:+.0f}%)"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-k", dest="patterns", action="append", default=[],
+                        help="Only run cases whose name contains this substring (repeatable)")
+    parser.add_argument("--long", action="store_true", help="Include the 30 min audio case")
+    parser.add_argument("--mongo-uri", default=None, help="Use this MongoDB database (it is dropped) instead of mongomock")
+    parser.add_argument("--save-baseline", metavar="NAME", help="Save results as a baseline")
+    parser.add_argument("--compare", metavar="NAME", help="Compare results with a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown before flagging a regression")
+    parser.add_argument("--json", metavar="PATH", help="Also write the results to this file")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--options", default="{}", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        print(json.dumps(run_case_in_process(args.run_case, json.loads(args.options))))
+        return 0
+
+    options = {"long": args.long, "mongo_uri": args.mongo_uri}
+    names = [
+        name for name, (_, default) in CASES.items()
+        if (default or args.long) and (not args.patterns or any(p in name for p in args.patterns))
+    ]
+
+    results = {}
+    for name in names:
+        result = run_case(name, options)
+        if result is not None:
+            results[name] = result
+
+    baseline = None
+    if args.compare:
+        with open(baseline_path(args.compare)) as f:
+            baseline = json.load(f)
+        print(f"Comparing with baseline '{args.compare}' (commit {baseline.get('commit')})")
+    print_results(results, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        print(f"Baseline saved to {save_baseline(args.save_baseline, results)}")
+
+    if baseline:
+        regressions = compare(baseline, results, args.threshold)
+        for name, metric, old, new in regressions:
+            print(f"REGRESSION {name} {metric}: {old:.2f} -> {new:.2f}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -136,8 +136,18 @@ async function loadSongDetails(spotifyId) {
         songDetailSection.innerHTML = '<div class="text-center"><div class="spinner-border" role="status"></div></div>';
         showSection(songDetailSection);
         
-        const response = await fetch(`${API_BASE_URL}/songs/${spotifyId}`);
+        let response = await fetch(`${API_BASE_URL}/songs/${spotifyId}`);
+        
+        // Song is queued for analysis: wait for the job, then fetch it again
+        if (response.status === 202) {
+            const job = await response.json();
+            await waitForJob(job.job_id);
+            response = await fetch(`${API_BASE_URL}/songs/${spotifyId}`);
+        }
         const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || `Request failed with status ${response.status}`);
+        }
         
         // Store current song
         currentSong = data.song;
@@ -161,6 +171,10 @@ async function loadSongDetails(spotifyId) {
         
         // Display chord progressions
         displayChordProgressions(data.chord_progressions);
+        if (data.analysis_status === 'failed') {
+            document.getElementById('chord-progressions-list').innerHTML =
+                '<div class="alert alert-warning">The chords of this song could not be analyzed.</div>';
+        }
         
         // Show chord visualization
         if (data.chord_progressions && data.chord_progressions.length > 0) {
@@ -174,6 +188,24 @@ async function loadSongDetails(spotifyId) {
     }
 }
 
+async function waitForJob(jobId, interval = 1000, timeout = 120000) {
+    const deadline = Date.now() + timeout;
+    while (Date.now() < deadline) {
+        await new Promise(resolve => setTimeout(resolve, interval));
+        
+        const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`);
+        const job = await response.json();
+        
+        if (job.status === 'done') {
+            return job;
+        }
+        if (job.status === 'failed' || response.status === 404) {
+            throw new Error(`Analysis job ${jobId} failed: ${job.error || job.status}`);
+        }
+    }
+    throw new Error(`Timed out waiting for analysis job ${jobId}`);
+}
+
 function displayChordProgressions(progressions) {
     const progressionsList = document.getElementById('chord-progressions-list');
     progressionsList.innerHTML = '';
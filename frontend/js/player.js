@@ -106,5 +106,135 @@ class AudioPlayer {
     }
 }
 
+/**
+ * Streams the audio of a playing element to the live chord detection API
+ */
+class LiveChordStream {
+    /**
+     * @param {String} apiBaseUrl - Base URL of the backend API
+     * @param {Function} onChord - Called with each detected chord change
+     * @param {Number} chunkSeconds - Audio sent per request
+     */
+    constructor(apiBaseUrl, onChord, chunkSeconds = 0.1) {
+        this.apiBaseUrl = apiBaseUrl;
+        this.onChord = onChord;
+        this.chunkSeconds = chunkSeconds;
+        this.context = null;
+        this.processor = null;
+        this.session = null;
+        this.pending = [];
+        this.pendingLength = 0;
+        this.sending = Promise.resolve();
+    }
+    
+    /**
+     * Start detecting chords in an audio element
+     * @param {HTMLMediaElement} audio - Element to analyze; needs crossOrigin set for remote sources
+     * @param {Number} retries - Retries while the server has no free live session (503)
+     * @returns {Promise} - Resolves once the session is open; rejects if it cannot be opened
+     */
+    async start(audio, retries = 3) {
+        this.context = new AudioContext();
+        
+        try {
+            this.session = await this.createSession(retries);
+        } catch (error) {
+            await this.context.close();
+            this.context = null;
+            throw error;
+        }
+        
+        const source = this.context.createMediaElementSource(audio);
+        this.processor = this.context.createScriptProcessor(4096, 1, 1);
+        this.processor.onaudioprocess = event => this.collect(event.inputBuffer.getChannelData(0));
+        
+        source.connect(this.processor);
+        source.connect(this.context.destination);
+        this.processor.connect(this.context.destination);
+    }
+    
+    /**
+     * Open a live session, waiting and retrying while the server is at capacity
+     * @param {Number} retries - Retries after a 503 response
+     * @returns {Promise<Object>} - The created session
+     */
+    async createSession(retries) {
+        for (let attempt = 0; ; attempt++) {
+            const response = await fetch(`${this.apiBaseUrl}/live/sessions`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ sr: this.context.sampleRate, format: 'f32' })
+            });
+            const data = await response.json().catch(() => ({}));
+            if (response.ok) {
+                return data;
+            }
+            if (response.status !== 503 || attempt >= retries) {
+                throw new Error(data.error || `Could not start live chord detection (status ${response.status})`);
+            }
+            
+            // Wait as long as the server asks, or back off exponentially
+            const delay = Number(response.headers.get('Retry-After')) || 2 ** attempt;
+            await new Promise(resolve => setTimeout(resolve, delay * 1000));
+        }
+    }
+    
+    /**
+     * Buffer samples and send them once a chunk is complete
+     * @param {Float32Array} samples - Mono samples from the audio graph
+     */
+    collect(samples) {
+        this.pending.push(new Float32Array(samples));
+        this.pendingLength += samples.length;
+        
+        if (this.pendingLength >= this.chunkSeconds * this.context.sampleRate) {
+            const chunk = new Float32Array(this.pendingLength);
+            let offset = 0;
+            this.pending.forEach(part => {
+                chunk.set(part, offset);
+                offset += part.length;
+            });
+            this.pending = [];
+            this.pendingLength = 0;
+            
+            // Chunks are sent one at a time so they arrive in order
+            this.sending = this.sending.then(() => this.send(chunk));
+        }
+    }
+    
+    async send(chunk) {
+        try {
+            const response = await fetch(`${this.apiBaseUrl}/live/sessions/${this.session.session_id}/audio`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: chunk.buffer
+            });
+            const data = await response.json();
+            (data.changes || []).forEach(change => this.onChord(change));
+        } catch (error) {
+            console.error('Error sending live audio:', error);
+        }
+    }
+    
+    /**
+     * Stop streaming and close the session
+     */
+    async stop() {
+        if (this.processor) {
+            this.processor.disconnect();
+            this.processor = null;
+        }
+        if (this.context) {
+            await this.context.close();
+            this.context = null;
+        }
+        if (this.session) {
+            await this.sending;
+            await fetch(`${this.apiBaseUrl}/live/sessions/${this.session.session_id}`, { method: 'DELETE' });
+            this.session = null;
+        }
+    }
+}
+
 // Create a global instance of the audio player
 const audioPlayer = new AudioPlayer();
\ No newline at end of file
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+def _bench_app(mongo_uri=None):
+    from benchmarks.suite import make_bench_app
+    from backend.api import routes
+
+    app, routes, server = make_bench_app(mongo_uri, seed=False)
+    try:
+        with app.app_context():
+            yield app
+    finally:
+        server.shutdown()
+        routes._services.clear()
+        routes.response_cache.clear()
+
+@pytest.fixture
+def app():
+    """The app against an empty mongomock database and a stub Spotify server, inside an app context"""
+    yield from _bench_app()
+
+@pytest.fixture
+def live_app():
+    """
+    Like ``app``, but against the MongoDB database at MONGO_TEST_URI (which is dropped)
+
+    mongomock does not emit pymongo command events, so tests counting round
+    trips need a real server; they are skipped when MONGO_TEST_URI is unset.
+    """
+    mongo_uri = os.getenv("MONGO_TEST_URI")
+    if not mongo_uri:
+        pytest.skip("MONGO_TEST_URI is not set")
+    yield from _bench_app(mongo_uri)
+
+@pytest.fixture
+def db(app):
+    from backend.database.db import mongo
+
+    return mongo.db
@@ -0,0 +1,57 @@
+from bson import ObjectId
+
+from backend import worker
+from backend.api import song_service
+from backend.models.job_queue import JobQueue
+
+def get_song(app, spotify_id):
+    return app.test_client().get(f"/api/songs/{spotify_id}")
+
+def test_song_analyzed_to_no_progressions_is_not_queued_again(app, db):
+    db.songs.insert_one({"_id": ObjectId(), "spotify_id": "empty", "title": "Silence", "analysis_status": "done"})
+    response = get_song(app, "empty")
+    assert response.status_code == 200
+    assert response.get_json()["analysis_status"] == "done"
+    assert response.get_json()["chord_progressions"] == []
+    assert db.jobs.count_documents({}) == 0
+
+def test_song_whose_job_failed_for_good_is_not_queued_again(app, db, monkeypatch):
+    db.songs.insert_one({"_id": ObjectId(), "spotify_id": "broken", "title": "Broken"})
+    assert get_song(app, "broken").status_code == 202
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("decoder crashed")
+
+    monkeypatch.setattr(song_service, "analyze_song", fail)
+    assert worker.work("test-worker", poll_interval=0, max_attempts=2, max_jobs=2) == 2
+
+    song = db.songs.find_one({"spotify_id": "broken"})
+    assert (song["analysis_status"], song["analysis_attempts"]) == ("failed", 2)
+    assert song["analysis_error"] == "RuntimeError: decoder crashed"
+
+    response = get_song(app, "broken")
+    assert response.status_code == 200
+    assert response.get_json()["analysis_status"] == "failed"
+    assert db.jobs.count_documents({}) == 1
+
+def test_unknown_track_whose_job_failed_is_reported(app, db):
+    assert get_song(app, "missing1").status_code == 202
+    # Spotify's 404 fails the job at once instead of retrying it
+    assert worker.work("test-worker", poll_interval=0, max_attempts=3, max_jobs=1) == 1
+    assert db.songs.count_documents({}) == 0
+
+    job = JobQueue().latest("missing1")
+    assert (job["status"], job["attempts"]) == ("failed", 1)
+    assert job["error"] == "SpotifyError: Spotify returned 404: Non existing id"
+
+    response = get_song(app, "missing1")
+    assert response.status_code == 404
+    assert response.get_json()["analysis_status"] == "failed"
+    assert db.jobs.count_documents({}) == 1
+
+def test_unknown_track_is_not_found_in_sync_mode(app, db):
+    app.config["ANALYSIS_MODE"] = "sync"
+    response = get_song(app, "missing2")
+    assert response.status_code == 404
+    assert response.get_json()["error"] == "Song not found"
+    assert db.songs.count_documents({}) == 0
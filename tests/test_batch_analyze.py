@@ -0,0 +1,46 @@
+from backend import batch_analyze
+from backend.models.chord_analyzer import ChordAnalyzer
+
+def result(spotify_id, tags=None, metadata=None):
+    return {
+        "path": f"/music/{spotify_id}.mp3",
+        "spotify_id": spotify_id,
+        "analysis": {"key": "C", "progressions": [
+            {"pattern": "I-V-vi-IV", "chords": ["C", "G", "Am", "F"], "confidence": 0.8}
+        ]},
+        "tags": tags or {},
+        "metadata": metadata or {},
+        "timings": {}
+    }
+
+def test_collect_tasks_reads_manifest_metadata(tmp_path):
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text(
+        "# path,spotify_id,title,artist,language\n"
+        "/music/a.mp3\n"
+        '/music/b.mp3,id-b,"Hello, World",Someone,English\n'
+        "/music/c.mp3,,Título\n"
+    )
+    assert batch_analyze.collect_tasks(str(manifest)) == [
+        ("/music/a.mp3", "a", {}),
+        ("/music/b.mp3", "id-b", {"title": "Hello, World", "artist": "Someone", "language": "English"}),
+        ("/music/c.mp3", "c", {"title": "Título"}),
+    ]
+
+def test_write_results_populates_song_metadata(db):
+    db.songs.insert_one({"spotify_id": "known", "title": "From Spotify", "artist": "A", "language": "English"})
+    batch_analyze.write_results(ChordAnalyzer(), [
+        result("tagged", tags={"title": "Despacito", "artist": "Luis Fonsi", "album": "Vida"}),
+        result("listed", tags={"title": "Ignored"}, metadata={"title": "Listed", "artist": "B", "language": "French"}),
+        result("known", tags={"title": "Tag title"}),
+    ])
+
+    songs = {song["spotify_id"]: song for song in db.songs.find()}
+    assert songs["tagged"]["title"] == "Despacito"
+    assert songs["tagged"]["artist"] == "Luis Fonsi"
+    assert songs["tagged"]["album"] == "Vida"
+    assert songs["tagged"]["language"] == "Spanish"
+    assert songs["tagged"]["audio_path"] == "/music/tagged.mp3"
+    assert (songs["listed"]["title"], songs["listed"]["language"]) == ("Listed", "French")
+    # Existing songs keep the metadata fetched from Spotify
+    assert (songs["known"]["title"], songs["known"]["language"]) == ("From Spotify", "English")
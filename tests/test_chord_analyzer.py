@@ -0,0 +1,193 @@
+import numpy as np
+import pytest
+
+from backend.models import chord_analyzer
+from backend.models.chord_analyzer import ChordAnalyzer
+from benchmarks.fixtures import synth_chord_audio
+
+@pytest.fixture(scope="module")
+def stereo_wav(tmp_path_factory):
+    import soundfile
+
+    # 44.1 kHz stereo, so the streamed path mixes down and resamples per block
+    y = synth_chord_audio(40, sr=44100)
+    path = tmp_path_factory.mktemp("audio") / "chords.wav"
+    soundfile.write(str(path), np.stack([y, 0.5 * y], axis=1), 44100)
+    return str(path)
+
+def assert_matches_full_file(streamed, full):
+    assert [c["time"] for c in streamed] == [c["time"] for c in full]
+    scores = np.array([[s["score"], f["score"]] for s, f in zip(streamed, full)])
+    assert np.abs(scores[:, 0] - scores[:, 1]).max() <= 5e-3
+    # Labels only differ where two templates are within the score margin
+    same = np.mean([s["chord"] == f["chord"] for s, f in zip(streamed, full)])
+    assert same >= 0.95
+
+def test_stream_matches_full_file(stereo_wav):
+    analyzer = ChordAnalyzer()
+    full = analyzer.analyze_audio(stereo_wav)
+    streamed = list(analyzer.analyze_audio_stream(stereo_wav, block_windows=50))
+    assert_matches_full_file(streamed, full)
+
+def test_stream_decodes_unseekable_formats_once(stereo_wav, monkeypatch):
+    import librosa.core
+    import soundfile
+
+    class Unsupported(soundfile.SoundFile):
+        def __init__(self, *args, **kwargs):
+            raise soundfile.LibsndfileError(0, "Format not recognised")
+
+    loads = []
+    real_load = librosa.core.load
+
+    def counting_load(*args, **kwargs):
+        loads.append(kwargs)
+        return real_load(*args, **kwargs)
+
+    monkeypatch.setattr(soundfile, "SoundFile", Unsupported)
+    monkeypatch.setattr(librosa.core, "load", counting_load)
+
+    analyzer = ChordAnalyzer()
+    streamed = list(analyzer.analyze_audio_stream(stereo_wav, block_windows=50))
+    assert len(loads) == 1
+    monkeypatch.undo()
+    assert_matches_full_file(streamed, analyzer.analyze_audio(stereo_wav))
+
+def test_every_chord_code_decodes_to_its_name():
+    codes = np.arange(len(chord_analyzer.CHORD_TEMPLATES))
+    assert len(set(chord_analyzer.CHORD_NAMES.tolist())) == len(codes) == 12 * len(chord_analyzer.QUALITY_NAMES)
+    roots, qualities = chord_analyzer.decode_chords(codes)
+    assert np.array_equal(chord_analyzer.encode_chords(roots, qualities), codes)
+    for code, root, quality in zip(codes, roots, qualities):
+        name = chord_analyzer.chord_name(root, quality)
+        assert chord_analyzer.CHORD_NAMES[code] == name
+        assert chord_analyzer.parse_chord_name(name) == (root, chord_analyzer.QUALITY_NAMES[quality])
+        assert chord_analyzer.chord_codes([name]).tolist() == [code]
+
+def test_parse_chord_name_prefers_the_longest_suffix():
+    parse = chord_analyzer.parse_chord_name
+    assert parse("Cmaj7") == (0, "maj7")
+    assert parse("C#m7") == (1, "min7")
+    assert parse("G7") == (7, "7")
+    assert parse("Am") == (9, "minor")
+    assert parse("D#dim") == (3, "dim")
+    assert parse("F") == (5, "major")
+    for name in ("H", "Cm9", "Bb", ""):
+        with pytest.raises(ValueError):
+            parse(name)
+    with pytest.raises(ValueError):
+        chord_analyzer.chord_codes(["C", "Bb"])
+
+def test_roman_numerals_in_major_and_minor_keys():
+    def numerals(chords, key):
+        codes = chord_analyzer.chord_codes(chords)
+        return chord_analyzer.roman_numerals(codes, chord_analyzer.parse_key(key)).tolist()
+
+    assert numerals(["C", "G", "Am", "F", "Dm7", "Em", "Bdim", "G7", "Dsus2"], "C") == [
+        "I", "V", "vi", "IV", "ii7", "iii", "viidim", "V7", "IIsus2"
+    ]
+    # Borrowed chords are flat degrees of the major scale
+    assert numerals(["A#", "D#", "G#", "Fm"], "C") == ["bVII", "bIII", "bVI", "iv"]
+    assert numerals(["G", "D", "Em", "C", "F", "F#dim"], 7) == ["I", "V", "vi", "IV", "bVII", "viidim"]
+    # Minor keys are numbered from their own tonic, as in the Andalusian cadence
+    assert numerals(["Am", "G", "F", "E7"], "Am") == ["i", "bVII", "bVI", "V7"]
+    assert numerals(["C", "Cmaj7", "Caug", "Dm", "Bdim", "Esus4"], "Am") == [
+        "bIII", "bIIImaj7", "bIII+", "iv", "iidim", "Vsus4"
+    ]
+    # One local key per chord
+    codes = chord_analyzer.chord_codes(["C", "G", "D", "A"])
+    assert chord_analyzer.roman_numerals(codes, np.array([0, 0, 7, 7])).tolist() == ["I", "V", "V", "II"]
+
+def test_beat_segments():
+    beat_segments = chord_analyzer.beat_segments
+    assert beat_segments([10, 20, 30, 40], 50).tolist() == [0, 10, 20, 30, 40, 50]
+    assert beat_segments([10, 20, 30, 40], 50, beats_per_segment=2).tolist() == [0, 10, 30, 50]
+    # Beats at frame 0 or past the end add no empty segments
+    assert beat_segments([0, 25, 50, 60], 50).tolist() == [0, 25, 50]
+    assert beat_segments([], 50) is None
+
+def chord_chroma(chords, frames_per_chord):
+    chroma = np.zeros((12, len(chords) * frames_per_chord), dtype=np.float32)
+    for i, chord in enumerate(chords):
+        root, quality = chord_analyzer.parse_chord_name(chord)
+        notes = (root + np.array(chord_analyzer.CHORD_TYPES[quality])) % 12
+        chroma[notes, i * frames_per_chord:(i + 1) * frames_per_chord] = 1
+    return chroma
+
+def test_analyze_audio_on_a_beat_grid(monkeypatch):
+    analyzer = ChordAnalyzer()
+    # A chord every 40 frames and a beat every 20 frames, starting on the first frame
+    chroma = chord_chroma(["C", "G", "Am", "F", "C", "G"], 40)
+    beat_frames = np.arange(0, chroma.shape[1], 20, dtype=np.int32)
+    monkeypatch.setattr(analyzer, "load_chroma", lambda *args, beats=False, **kwargs: (chroma, beat_frames))
+    frame_time = 512 / 22050
+
+    chords = analyzer.analyze_audio("song.wav", beats_per_chord=2)
+    assert [c["chord"] for c in chords] == ["C", "G", "Am", "F", "C", "G"]
+    assert [c["time"] for c in chords] == [round(i * 40 * frame_time, 3) for i in range(6)]
+    assert all(c["score"] > 0.99 for c in chords)
+
+    # One chord per beat: each chord spans two segments
+    chords = analyzer.analyze_audio("song.wav", beats_per_chord=1)
+    assert [c["chord"] for c in chords] == [name for name in ["C", "G", "Am", "F", "C", "G"] for _ in range(2)]
+    assert [c["time"] for c in chords] == [round(i * 20 * frame_time, 3) for i in range(12)]
+
+    # A beat grid that starts late gets a leading segment before the first beat
+    beat_frames = np.array([30, 70, 110], dtype=np.int32)
+    chords = analyzer.analyze_audio("song.wav", beats_per_chord=1)
+    assert [c["time"] for c in chords] == [round(f * frame_time, 3) for f in (0, 30, 70, 110)]
+    assert [c["chord"] for c in chords[:2]] == ["C", "G"]
+
+def test_analyze_audio_without_beats_uses_fixed_windows(monkeypatch):
+    analyzer = ChordAnalyzer()
+    chroma = chord_chroma(["C", "G", "Am", "F"], 40)
+    monkeypatch.setattr(analyzer, "load_chroma", lambda *args, beats=False, **kwargs: (chroma, np.zeros(0, dtype=np.int32)))
+
+    chords = analyzer.analyze_audio("song.wav", window=10, beats_per_chord=4)
+    assert len(chords) == 16
+    assert [c["chord"] for c in chords[::4]] == ["C", "G", "Am", "F"]
+    assert [c["time"] for c in chords[:2]] == [0.0, round(10 * 512 / 22050, 3)]
+
+def detect_chords_per_window(chroma, window=10, hop_length=512, sr=22050):
+    """Reference detector: score each window against every template in a Python loop"""
+    chords = []
+    templates = chord_analyzer.CHORD_TEMPLATES.astype(np.float64)
+    for start in range(0, chroma.shape[1] - window + 1, window):
+        mean = chroma[:, start:start + window].astype(np.float64).mean(axis=1)
+        mean /= max(np.linalg.norm(mean), 1e-8)
+        scores = [float(template @ mean) for template in templates]
+        # Ties go to the first template, i.e. the lowest chord code
+        code = max(range(len(scores)), key=lambda i: (scores[i], -i))
+        root, quality = chord_analyzer.decode_chords(code)
+        chords.append((chord_analyzer.chord_name(root, quality), start * hop_length / sr, scores[code]))
+    return chords
+
+def test_batch_detection_matches_per_window_loop():
+    rng = np.random.default_rng(0)
+    noisy = rng.random((12, 253)).astype(np.float32)
+    # Silent windows, and C-G fifths that tie C, Cm, Csus4 and Csus2
+    ties = np.zeros((12, 60), dtype=np.float32)
+    ties[[0, 7], 20:40] = 1
+    ties[[2, 9], 40:60] = 0.5
+    chromas = [noisy, ties, chord_chroma(["C", "G7", "Am", "Fmaj7", "Ddim", "Esus4"], 10)]
+
+    analyzer = ChordAnalyzer()
+    batch = analyzer.detect_chords_batch(chromas)
+    for chroma, arrays in zip(chromas, batch):
+        single = analyzer.detect_chord_arrays(chroma)
+        for field in ("root", "quality", "time", "score", "key"):
+            assert np.array_equal(arrays[field], single[field])
+
+        expected = detect_chords_per_window(chroma)
+        detected = analyzer.chords_to_dicts(arrays)
+        # Trailing frames that do not fill a window are dropped
+        assert len(detected) == len(expected) == chroma.shape[1] // 10
+        assert [c["chord"] for c in detected] == [name for name, _, _ in expected]
+        assert np.allclose(arrays["time"], [time for _, time, _ in expected])
+        assert np.allclose(arrays["score"], [score for _, _, score in expected], atol=1e-5)
+
+    silent_and_tied = analyzer.chords_to_dicts(batch[1])
+    assert [(c["chord"], c["score"]) for c in silent_and_tied[:2]] == [("C", 0.0), ("C", 0.0)]
+    assert silent_and_tied[2]["chord"] == silent_and_tied[3]["chord"] == "C"
+    assert silent_and_tied[4]["chord"] == "D"
+    assert [c["chord"] for c in analyzer.chords_to_dicts(batch[2])] == ["C", "G7", "Am", "Fmaj7", "Ddim", "Esus4"]
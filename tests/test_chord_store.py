@@ -0,0 +1,30 @@
+import os
+
+import numpy as np
+import pytest
+
+from backend.database.chord_store import INDEX_FILE, ChordStore
+
+def song(n_frames=20, n_chords=4):
+    chroma = np.random.default_rng(n_frames).random((12, n_frames), dtype=np.float32)
+    return chroma, np.arange(n_chords, dtype=np.int16), np.arange(n_chords, dtype=np.float32)
+
+def test_append_recovers_from_partial_index_record(tmp_path):
+    store = ChordStore(str(tmp_path))
+    store.append("a", *song())
+
+    # A crash while writing the index leaves a partial record behind
+    with open(tmp_path / INDEX_FILE, "ab") as f:
+        f.write(b"\x01" * 10)
+
+    store = ChordStore(str(tmp_path))
+    store.append("b", *song(30, 6))
+    assert len(ChordStore(str(tmp_path))) == 2
+    assert ChordStore(str(tmp_path)).get("b")["chroma"].shape == (12, 30)
+
+def test_append_rejects_ids_longer_than_the_index_field(tmp_path):
+    store = ChordStore(str(tmp_path))
+    with pytest.raises(ValueError):
+        store.append_many([("a", *song()), ("x" * 25, *song())])
+    assert len(store) == 0
+    assert not os.path.exists(tmp_path / INDEX_FILE)
@@ -0,0 +1,26 @@
+import os
+
+import numpy as np
+import pytest
+
+from backend.models.feature_cache import FeatureCache
+
+def test_put_same_key_replaces_size(tmp_path):
+    cache = FeatureCache(str(tmp_path))
+    cache.put("ab" * 20, np.zeros(1000, dtype=np.float32))
+    size = cache.stats()["size_bytes"]
+    cache.put("ab" * 20, np.zeros(1000, dtype=np.float32))
+    assert cache.stats()["size_bytes"] == size
+    assert FeatureCache(str(tmp_path)).stats()["size_bytes"] == size
+
+def test_failed_put_leaves_no_temp_file(tmp_path, monkeypatch):
+    cache = FeatureCache(str(tmp_path))
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(np, "save", fail)
+    with pytest.raises(OSError):
+        cache.put("cd" * 20, np.zeros(10))
+    assert [name for _, _, files in os.walk(tmp_path) for name in files] == []
+    assert cache.stats()["size_bytes"] == 0
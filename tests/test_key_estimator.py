@@ -0,0 +1,56 @@
+import numpy as np
+
+from backend.models.key_estimator import (
+    MAJOR_PROFILE, MINOR_PROFILE, estimate_key, estimate_local_keys, key_correlations
+)
+
+def triads(chords, frames_per_chord=10):
+    """Chroma frames of (root, minor) triads, each held for ``frames_per_chord`` frames"""
+    rows = []
+    for root, minor in chords:
+        row = np.zeros(12, dtype=np.float32)
+        row[[root % 12, (root + (3 if minor else 4)) % 12, (root + 7) % 12]] = 1
+        rows += [row] * frames_per_chord
+    return np.array(rows)
+
+# I-IV-V-I-vi-ii-V-I in C major and E major, and i-iv-V-i-bVI-bIII-V-i in A minor
+C_MAJOR = triads([(0, 0), (5, 0), (7, 0), (0, 0), (9, 1), (2, 1), (7, 0), (0, 0)])
+E_MAJOR = triads([(4, 0), (9, 0), (11, 0), (4, 0), (1, 1), (6, 1), (11, 0), (4, 0)])
+A_MINOR = triads([(9, 1), (2, 1), (4, 0), (9, 1), (5, 0), (0, 0), (4, 0), (9, 1)])
+
+def test_every_key_profile_is_its_own_key():
+    for mode, profile in enumerate((MAJOR_PROFILE, MINOR_PROFILE)):
+        for tonic in range(12):
+            key, correlation = estimate_key(np.tile(np.roll(profile, tonic), (4, 1)))
+            assert key == mode * 12 + tonic
+            assert correlation > 0.99
+
+def test_global_key_of_chord_progressions():
+    assert estimate_key(C_MAJOR)[0] == 0
+    assert estimate_key(E_MAJOR)[0] == 4
+    assert estimate_key(A_MINOR)[0] == 21
+    # Transposing the chroma transposes the key
+    assert estimate_key(np.roll(C_MAJOR, 2, axis=1))[0] == 2
+
+def test_local_keys_follow_a_modulation():
+    frames = np.vstack([C_MAJOR] * 3 + [E_MAJOR] * 3)
+    local = estimate_local_keys(frames, context=len(C_MAJOR), key=0)
+    assert local.dtype == np.int16 and len(local) == len(frames)
+    assert (local[:200] == 0).all()
+    assert (local[250:450] == 4).all()
+
+    # Without a large enough gain every frame keeps the song's key
+    assert (estimate_local_keys(frames, context=len(C_MAJOR), key=0, margin=2.0) == 0).all()
+
+def test_silence_has_no_key():
+    silence = np.zeros((50, 12), dtype=np.float32)
+    assert estimate_key(silence) == (None, 0.0)
+    _, has_key = key_correlations(silence[:1])
+    assert not has_key[0]
+    assert (estimate_local_keys(silence, context=10) == 0).all()
+    assert len(estimate_local_keys(np.zeros((0, 12)), context=10)) == 0
+
+    # A silent break keeps the song's key instead of an arbitrary one
+    frames = np.vstack([A_MINOR, silence, A_MINOR])
+    local = estimate_local_keys(frames, context=20)
+    assert (local[90:120] == 21).all()
@@ -0,0 +1,49 @@
+from bson import ObjectId
+
+from backend.database.cache_versions import PATTERNS_SCOPE, get_versions
+from backend.models.chord_analyzer import ChordAnalyzer
+from backend.models.language_classifier import (
+    CLASSIFIER, MIN_MARGIN, UNKNOWN_LANGUAGE, reclassify_songs
+)
+
+def test_classify_languages_and_unknown():
+    texts = [
+        "I will always love you, tonight and forever, don't let me go",
+        "Te quiero mucho, mi corazón es tuyo para siempre",
+        "Je t'aime toujours, mon amour, reste avec moi ce soir",
+        "Ich liebe dich, bleib bei mir heute Nacht",
+        "ok",
+        "",
+    ]
+    assert CLASSIFIER.classify(texts) == ["English", "Spanish", "French", "German", UNKNOWN_LANGUAGE, UNKNOWN_LANGUAGE]
+    assert CLASSIFIER.classify([]) == []
+
+    # A confident text becomes Unknown once the margin it needs is out of reach
+    log_likelihoods, n_grams, _ = CLASSIFIER.scores(texts[:1])
+    ranked = sorted(log_likelihoods[0])
+    margin = (ranked[-1] - ranked[-2]) / n_grams[0]
+    assert margin >= MIN_MARGIN
+    assert CLASSIFIER.classify(texts[:1], min_margin=margin * 1.01) == [UNKNOWN_LANGUAGE]
+
+def test_reclassifying_rebuilds_pattern_stats(app, db):
+    song = {"_id": ObjectId(), "spotify_id": "a", "title": "Te quiero mucho, mi corazón es tuyo para siempre",
+            "language": "English"}
+    db.songs.insert_one(song)
+    ChordAnalyzer().save_analysis_to_db(str(song["_id"]), {"key": "C", "progressions": [
+        {"pattern": "I-V-vi-IV", "chords": ["I", "V", "vi", "IV"], "confidence": 0.8}
+    ]}, song=song)
+    assert db.pattern_stats.find_one()["by_language"] == {"English": 1}
+    version = get_versions([PATTERNS_SCOPE])
+
+    assert reclassify_songs() == (1, 1)
+    assert db.songs.find_one()["language"] == "Spanish"
+    stats = db.pattern_stats.find_one()
+    assert stats["by_language"] == {"Spanish": 1}
+    assert stats["name"] == "Pop Progression"
+    assert stats["examples"] == ["Let It Be", "Don't Stop Believin'"]
+    assert get_versions([PATTERNS_SCOPE]) != version
+
+    # Nothing changed, so the statistics are left alone
+    version = get_versions([PATTERNS_SCOPE])
+    assert reclassify_songs() == (1, 0)
+    assert get_versions([PATTERNS_SCOPE]) == version
@@ -0,0 +1,46 @@
+import io
+
+import numpy as np
+
+from backend.api import routes
+
+def create_session(client):
+    response = client.post("/api/live/sessions", json={"sr": 22050, "format": "f32"})
+    assert response.status_code == 201
+    return response.get_json()
+
+def test_oversized_chunk_is_rejected_from_its_content_length(app):
+    client = app.test_client()
+    session = create_session(client)
+    limit = routes.live_sessions.get(session["session_id"]).max_chunk_bytes
+
+    class Unread(io.BytesIO):
+        def read(self, *args):
+            raise AssertionError("body read despite Content-Length over the limit")
+
+    response = client.post(session["audio_url"], input_stream=Unread(),
+                           environ_overrides={"CONTENT_LENGTH": str(limit + 4)})
+    assert response.status_code == 413
+
+def test_oversized_chunked_upload_is_rejected(app):
+    client = app.test_client()
+    session = create_session(client)
+    limit = routes.live_sessions.get(session["session_id"]).max_chunk_bytes
+
+    response = client.post(session["audio_url"], input_stream=io.BytesIO(b"\0" * (limit + 4)),
+                           headers={"Transfer-Encoding": "chunked"},
+                           environ_overrides={"wsgi.input_terminated": True})
+    assert response.status_code == 413
+
+    chunk = np.zeros(2205, dtype="<f4").tobytes()
+    response = client.post(session["audio_url"], input_stream=io.BytesIO(chunk),
+                           headers={"Transfer-Encoding": "chunked"},
+                           environ_overrides={"wsgi.input_terminated": True})
+    assert response.status_code == 200
+    assert response.get_json()["position"] == 0.1
+
+def test_full_session_store_asks_clients_to_retry(app, monkeypatch):
+    monkeypatch.setattr(routes.live_sessions, "max_sessions", 0)
+    response = app.test_client().post("/api/live/sessions", json={})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(routes.LIVE_SESSION_RETRY_SECONDS)
@@ -0,0 +1,137 @@
+import re
+import threading
+import time
+
+from backend.metrics import Registry, SamplingProfiler
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"(,|$)')
+
+def parse_labels(text):
+    """Parse '{a="x",b="y"}' into a dict, undoing the escapes"""
+    labels = {}
+    body = text[1:-1] if text else ""
+    while body:
+        match = LABEL.match(body)
+        assert match, f"bad labels: {text}"
+        value = re.sub(r'\\(.)', lambda m: "\n" if m.group(1) == "n" else m.group(1), match.group(2))
+        labels[match.group(1)] = value
+        body = body[match.end():]
+    return labels
+
+def parse_metrics(text):
+    """
+    Parse the Prometheus text format into {family: {"help", "type", "samples"}}
+
+    Checks that every sample follows the HELP and TYPE lines of its family.
+    """
+    assert text.endswith("\n")
+    families = {}
+    current = None
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name, _, doc = line[len("# HELP "):].partition(" ")
+            assert name not in families, f"{name} is rendered twice"
+            families[name] = {"help": doc, "type": None, "samples": []}
+            current = name
+        elif line.startswith("# TYPE "):
+            name, _, kind = line[len("# TYPE "):].partition(" ")
+            assert name == current, f"TYPE of {name} does not follow its HELP"
+            families[name]["type"] = kind
+        else:
+            match = SAMPLE.match(line)
+            assert match, f"bad sample line: {line!r}"
+            name, labels, value = match.groups()
+            assert current and families[current]["type"], f"{name} has no HELP/TYPE"
+            family = re.sub(r"_(bucket|sum|count)$", "", name) if families[current]["type"] == "histogram" else name
+            assert family == current, f"{name} is outside its family"
+            families[family]["samples"].append((name, parse_labels(labels), float(value)))
+    return families
+
+def histogram_series(family, **labels):
+    """Return (buckets as [(le, count)], sum, count) of one labelled histogram series"""
+    def matches(sample_labels):
+        return all(sample_labels.get(k) == str(v) for k, v in labels.items())
+
+    buckets = [(s[1]["le"], s[2]) for s in family["samples"] if s[0].endswith("_bucket") and matches(s[1])]
+    total, = [s[2] for s in family["samples"] if s[0].endswith("_sum") and matches(s[1])]
+    count, = [s[2] for s in family["samples"] if s[0].endswith("_count") and matches(s[1])]
+    return buckets, total, count
+
+def test_registry_renders_the_text_format():
+    registry = Registry()
+    counter = registry.counter("jobs_total", "Jobs run\\nper \"worker\"", ("worker",))
+    histogram = registry.histogram("wait_seconds", "Wait time", ("queue",), buckets=(0.1, 1))
+    counter.inc(worker='a "quoted"\\name\nx')
+    counter.inc(2, worker='a "quoted"\\name\nx')
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, queue="q1")
+
+    text = registry.render()
+    assert text.splitlines() == [
+        '# HELP jobs_total Jobs run\\\\nper "worker"',
+        "# TYPE jobs_total counter",
+        'jobs_total{worker="a \\"quoted\\"\\\\name\\nx"} 3',
+        "# HELP wait_seconds Wait time",
+        "# TYPE wait_seconds histogram",
+        'wait_seconds_bucket{queue="q1",le="0.1"} 2',
+        'wait_seconds_bucket{queue="q1",le="1"} 3',
+        'wait_seconds_bucket{queue="q1",le="+Inf"} 4',
+        'wait_seconds_sum{queue="q1"} 3.65',
+        'wait_seconds_count{queue="q1"} 4',
+    ]
+    families = parse_metrics(text)
+    assert families["jobs_total"]["samples"] == [("jobs_total", {"worker": 'a "quoted"\\name\nx'}, 3.0)]
+
+def test_metrics_endpoint_after_a_request(app):
+    client = app.test_client()
+    assert client.get("/api/patterns").status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    families = parse_metrics(response.get_data(as_text=True))
+
+    requests = families["http_request_duration_seconds"]
+    assert requests["type"] == "histogram"
+    assert requests["help"] == "Time spent handling API requests"
+    buckets, total, count = histogram_series(requests, endpoint="/api/patterns", method="GET", status=200)
+    assert buckets[-1][0] == "+Inf" and buckets[-1][1] == count >= 1
+    counts = [c for _, c in buckets]
+    assert counts == sorted(counts)
+    assert [float(le) for le, _ in buckets[:-1]] == sorted(float(le) for le, _ in buckets[:-1])
+    assert total > 0
+
+    assert families["response_cache_requests_total"]["type"] == "counter"
+    assert families["http_request_mongo_queries"]["type"] == "histogram"
+
+def test_profiler_header(app):
+    app.config["PROFILE_TOKEN"] = "secret"
+    client = app.test_client()
+
+    assert "X-Profile-Id" not in client.get("/api/patterns").headers
+    assert "X-Profile-Id" not in client.get("/api/patterns", headers={"X-Profile": "wrong"}).headers
+
+    response = client.get("/api/patterns", headers={"X-Profile": "secret"})
+    profile_id = response.headers["X-Profile-Id"]
+    profile = client.get(f"/metrics/profiles/{profile_id}")
+    assert profile.status_code == 200 and profile.mimetype == "text/plain"
+    assert client.get("/metrics/profiles/unknown").status_code == 404
+
+def test_sampling_profiler_folds_stacks():
+    def busy_wait(seconds):
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+
+    profiler = SamplingProfiler(threading.get_ident()).start()
+    busy_wait(0.1)
+    folded = profiler.stop().folded()
+
+    lines = folded.splitlines()
+    assert lines
+    for line in lines:
+        stack, _, count = line.rpartition(" ")
+        assert int(count) > 0
+        assert stack.split(";")[0]
+    assert any("busy_wait" in line for line in lines)
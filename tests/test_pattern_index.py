@@ -0,0 +1,38 @@
+from backend.models import pattern_index as pattern_index_module
+from backend.models.pattern_index import PatternIndex
+
+def gram_counts(db):
+    return {doc["_id"]: doc["songs"] for doc in db.pattern_grams.find() if doc["songs"]}
+
+def test_reindex_replaces_grams_and_counts(db):
+    index = PatternIndex()
+    index.index_songs([("a", ["I", "V", "vi", "IV"]), ("b", ["I", "V", "I"])])
+    assert gram_counts(db)["I-V"] == 2
+
+    index.index_song("a", ["ii", "V", "I"])
+    grams_a = {doc["gram"] for doc in db.pattern_index.find({"song_id": "a"})}
+    assert grams_a == {"ii", "V", "I", "ii-V", "V-I", "ii-V-I"}
+    assert gram_counts(db) == {
+        doc["_id"]: doc["songs"] for doc in db.pattern_index.aggregate(
+            [{"$group": {"_id": "$gram", "songs": {"$sum": 1}}}]
+        )
+    }
+    assert [m["song_id"] for m in index.search("V-I")] == ["a", "b"]
+    assert index.search("vi-IV") == []
+
+    index.rebuild_gram_counts()
+    assert gram_counts(db)["V-I"] == 2
+
+def test_search_starts_from_the_rarest_gram(db):
+    index = PatternIndex()
+    index.index_songs([(f"s{i}", ["I", "V", "vi", "IV"] if i else ["I", "V", "ii", "IV"]) for i in range(10)])
+    pieces = index._query_pieces(["I", "V", "*", "ii"])
+    assert pieces == [(3, "ii"), (0, "I-V")]
+
+def test_search_chunks_candidate_ids(db, monkeypatch):
+    monkeypatch.setattr(pattern_index_module, "MAX_IN_IDS", 3)
+    index = PatternIndex()
+    index.index_songs([(f"s{i}", ["I", "V", "vi", "IV"]) for i in range(10)])
+    index.index_song("other", ["I", "IV"])
+    matches = index.search("I-V-*-IV", limit=20)
+    assert sorted(m["song_id"] for m in matches) == [f"s{i}" for i in range(10)]
@@ -0,0 +1,47 @@
+from bson import ObjectId
+
+from backend.database.db import count_queries, mongo
+
+def seed_preferences(user_id, n):
+    songs = [{"_id": ObjectId(), "title": f"Song {i}", "artist": "A", "spotify_id": f"{user_id}-{i}"} for i in range(n)]
+    progressions = [
+        {"_id": ObjectId(), "song_id": str(song["_id"]), "progression_pattern": "I-V-vi-IV",
+         "progression": ["C", "G", "Am", "F"]}
+        for song in songs
+    ]
+    mongo.db.songs.insert_many(songs)
+    mongo.db.chord_progressions.insert_many(progressions)
+    mongo.db.user_preferences.insert_many([
+        {"user_id": user_id, "song_id": str(song["_id"]), "chord_progression_id": str(prog["_id"])}
+        for song, prog in zip(songs, progressions)
+    ])
+
+def test_preferences_query_count_is_constant(live_app):
+    client = live_app.test_client()
+    for user_id, n in (("few", 3), ("many", 300)):
+        seed_preferences(user_id, n)
+        # Cache version check, preferences, songs, progressions
+        with count_queries() as queries:
+            response = client.get(f"/api/preferences/{user_id}")
+        assert len(response.get_json()["preferences"]) == n
+        assert queries.count == 4, queries.commands
+
+        # Served from the response cache while fresh
+        with count_queries() as queries:
+            client.get(f"/api/preferences/{user_id}")
+        assert queries.count == 0, queries.commands
+
+def test_patterns_query_count(live_app):
+    mongo.db.pattern_stats.insert_many([
+        {"pattern": f"p{i}", "count": i, "songs": i, "examples": []} for i in range(50)
+    ])
+    client = live_app.test_client()
+    # Cache version check and one read of the materialized statistics
+    with count_queries() as queries:
+        response = client.get("/api/patterns?limit=20")
+    assert len(response.get_json()["patterns"]) == 20
+    assert queries.count == 2, queries.commands
+
+    with count_queries() as queries:
+        client.get("/api/patterns?limit=20")
+    assert queries.count == 0, queries.commands
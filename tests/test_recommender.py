@@ -0,0 +1,87 @@
+import random
+import threading
+
+import numpy as np
+from bson import ObjectId
+
+from backend.api import routes
+from backend.models.chord_analyzer import ChordAnalyzer
+from backend.models.recommendation import ChordRecommender
+
+def save_song(db, analyzer, spotify_id, chords):
+    song = {"_id": ObjectId(), "spotify_id": spotify_id, "title": spotify_id, "language": "English"}
+    db.songs.insert_one(song)
+    analysis = {"key": "C", "progressions": [
+        {"pattern": "-".join(chords), "chords": chords, "confidence": 0.8}
+    ]}
+    analyzer.save_analysis_to_db(str(song["_id"]), analysis, song=song)
+    return str(song["_id"])
+
+def test_recommender_picks_up_songs_saved_by_other_processes(db, monkeypatch):
+    web_analyzer = routes.get_chord_analyzer()
+    first = save_song(db, web_analyzer, "first", ["I", "V", "vi", "IV"])
+    recommender = routes.get_recommender()
+    assert first in recommender
+
+    # A worker process saves with its own analyzer, which has no recommender
+    second = save_song(db, ChordAnalyzer(), "second", ["I", "V", "vi", "IV"])
+    assert second not in recommender
+
+    monkeypatch.setattr(routes, "RECOMMENDER_SYNC_SECONDS", 0)
+    client = routes.current_app.test_client()
+    response = client.get("/api/songs/first/similar")
+    assert [song["spotify_id"] for song in response.get_json()["songs"]] == ["second"]
+
+def test_sync_reads_nothing_when_no_analysis_was_saved(db):
+    first = save_song(db, ChordAnalyzer(), "first", ["ii", "V", "I"])
+    recommender = routes.get_recommender()
+    assert first in recommender
+    assert recommender.sync_from_db() == 0
+
+    save_song(db, ChordAnalyzer(), "second", ["ii", "V", "I"])
+    # Only the newly saved song (and any within the overlap window) is read again
+    assert 1 <= recommender.sync_from_db() <= 2
+    assert len(recommender) == 2
+
+def test_preload_builds_the_index_at_startup(app, db):
+    save_song(db, ChordAnalyzer(), "first", ["I", "IV", "V"])
+    routes.preload_recommender(app).join()
+    assert len(routes.get_chord_analyzer().recommender) == 1
+
+def test_concurrent_adds_keep_the_index_consistent():
+    numerals = ["I", "ii", "iii", "IV", "V", "vi", "bVII"]
+    rng = random.Random(0)
+    songs = [(f"song{i}", [rng.choice(numerals) for _ in range(12)]) for i in range(400)]
+    recommender = ChordRecommender()
+    errors = []
+
+    def add(batch):
+        # Each thread also re-adds songs other threads may be adding
+        for start in range(0, len(batch), 10):
+            recommender.add_songs(batch[start:start + 10] + songs[:5])
+
+    def search(stop):
+        try:
+            while not stop.is_set():
+                recommender.search(recommender.term_frequencies(["I", "V", "vi", "IV"]), k=5)
+                recommender.similar_songs("song0", k=5)
+        except Exception as e:
+            errors.append(e)
+
+    stop = threading.Event()
+    searcher = threading.Thread(target=search, args=(stop,))
+    searcher.start()
+    adders = [threading.Thread(target=add, args=(songs[i::8],)) for i in range(8)]
+    for thread in adders:
+        thread.start()
+    for thread in adders:
+        thread.join()
+    stop.set()
+    searcher.join()
+
+    assert not errors
+    assert sorted(recommender.song_ids) == sorted(song_id for song_id, _ in songs)
+    assert recommender.n_docs == len(songs)
+    expected = sum((recommender.term_frequencies(sequence) != 0).astype(np.int64) for _, sequence in songs)
+    assert np.array_equal(recommender.doc_freq, expected)
+    assert all(np.linalg.norm(recommender._vectors[row]) > 0.99 for row in range(len(songs)))
@@ -0,0 +1,25 @@
+from bson import ObjectId
+
+from backend.api import routes
+from backend.models.chord_analyzer import ChordAnalyzer
+
+def test_song_without_progressions_is_not_cached(app, db):
+    song = {"_id": ObjectId(), "spotify_id": "later", "title": "Later", "analysis_status": "done"}
+    db.songs.insert_one(song)
+    client = app.test_client()
+
+    response = client.get("/api/songs/later")
+    assert response.get_json()["chord_progressions"] == []
+    assert "no-store" in response.headers["Cache-Control"]
+    assert "ETag" not in response.headers
+    assert len(routes.response_cache) == 0
+
+    # A worker process saves the analysis; the next request sees it at once
+    ChordAnalyzer().save_analysis_to_db(str(song["_id"]), {"key": "C", "progressions": [
+        {"pattern": "I-V-vi-IV", "chords": ["I", "V", "vi", "IV"], "confidence": 0.8}
+    ]}, song=song)
+    routes.response_cache.clear()
+    response = client.get("/api/songs/later")
+    assert len(response.get_json()["chord_progressions"]) == 1
+    assert "ETag" in response.headers
+    assert len(routes.response_cache) == 1
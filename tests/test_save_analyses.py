@@ -0,0 +1,46 @@
+from bson import ObjectId
+
+from backend.models.chord_analyzer import ChordAnalyzer
+
+def analysis(key, *patterns):
+    return {"key": key, "progressions": [
+        {"pattern": pattern, "chords": pattern.split("-"), "confidence": 0.8} for pattern in patterns
+    ]}
+
+def stats(db):
+    return {
+        doc["pattern"]: (doc["count"], doc["song_count"], doc["by_key"], doc["by_language"],
+                         [example["song_id"] for example in doc["db_examples"]])
+        for doc in db.pattern_stats.find()
+    }
+
+def test_resaving_a_changed_analysis_replaces_rows_and_counts(db):
+    songs = [{"_id": ObjectId(), "spotify_id": sid, "title": sid, "language": "English"} for sid in ("a", "b")]
+    db.songs.insert_many(songs)
+    a, b = (str(song["_id"]) for song in songs)
+    analyzer = ChordAnalyzer()
+
+    analyzer.save_analyses_to_db([
+        (a, analysis("C", "I-V-vi-IV", "I-V-vi-IV", "ii-V-I-I"), songs[0]),
+        (b, analysis("G", "I-V-vi-IV"), songs[1]),
+    ])
+    analyzer.save_analysis_to_db(a, analysis("Am", "I-V-vi-IV", "vi-IV-I-V"), song=songs[0])
+
+    rows = sorted((doc["section_index"], doc["progression_pattern"]) for doc in db.chord_progressions.find({"song_id": a}))
+    assert rows == [(0, "I-V-vi-IV"), (1, "vi-IV-I-V")]
+    assert db.chord_progressions.count_documents({"song_id": b}) == 1
+
+    assert stats(db) == {
+        "I-V-vi-IV": (2, 2, {"C": 0, "G": 1, "Am": 1}, {"English": 2}, [a, b]),
+        "vi-IV-I-V": (1, 1, {"Am": 1}, {"English": 1}, [a]),
+    }
+
+    # Saving the same analysis again changes nothing
+    analyzer.save_analysis_to_db(a, analysis("Am", "I-V-vi-IV", "vi-IV-I-V"), song=songs[0])
+    assert db.chord_progressions.count_documents({"song_id": a}) == 2
+    assert stats(db)["I-V-vi-IV"][:2] == (2, 2)
+
+    # The diff leaves the same statistics as a full rebuild
+    rebuilt = stats(db)
+    analyzer.pattern_stats.rebuild()
+    assert {p: s[:2] for p, s in stats(db).items()} == {p: s[:2] for p, s in rebuilt.items()}
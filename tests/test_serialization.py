@@ -0,0 +1,75 @@
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from backend.api import serialization
+
+DOC = {
+    "_id": ObjectId("65a1b2c3d4e5f60718293a4b"),
+    "saved_at": datetime(2024, 1, 2, 3, 4, 5),
+    "precise": datetime(2024, 1, 2, 3, 4, 5, 123),
+    "utc": datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    "offset": datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone(timedelta(hours=2))),
+    "release_date": date(2024, 1, 2),
+    "int": np.int64(7),
+    "small_int": np.int8(-3),
+    "score": np.float32(0.5),
+    "float64": np.float64(0.1),
+    "flag": np.bool_(True),
+    "chroma": np.array([[0.25, 0.5], [1.0, 2.0]], dtype=np.float32),
+    "roots": np.arange(3, dtype=np.int16),
+    "nested": [{"song_id": ObjectId("65a1b2c3d4e5f60718293a4c"), "title": "Corazón"}],
+    "none": None,
+}
+
+EXPECTED = {
+    "_id": "65a1b2c3d4e5f60718293a4b",
+    "saved_at": "2024-01-02T03:04:05Z",
+    "precise": "2024-01-02T03:04:05.000123Z",
+    "utc": "2024-01-02T03:04:05Z",
+    "offset": "2024-01-02T03:04:05+02:00",
+    "release_date": "2024-01-02",
+    "int": 7,
+    "small_int": -3,
+    "score": 0.5,
+    "float64": 0.1,
+    "flag": True,
+    "chroma": [[0.25, 0.5], [1.0, 2.0]],
+    "roots": [0, 1, 2],
+    "nested": [{"song_id": "65a1b2c3d4e5f60718293a4c", "title": "Corazón"}],
+    "none": None,
+}
+
+def dumps_both(app, obj, monkeypatch):
+    """Encode with orjson and with the json module fallback, as compact responses are"""
+    fast = app.json.dumps(obj, separators=(",", ":"))
+    with monkeypatch.context() as patch:
+        patch.setattr(serialization, "orjson", None)
+        fallback = app.json.dumps(obj, separators=(",", ":"))
+    return fast, fallback
+
+def test_both_encoders_give_identical_output(app, monkeypatch):
+    pytest.importorskip("orjson")
+    fast, fallback = dumps_both(app, DOC, monkeypatch)
+    assert fast == fallback
+    assert json.loads(fast) == EXPECTED
+    assert "Corazón" in fast
+
+    # Float exponents are spelled differently (1e-7 and 1e-07) but decode alike
+    fast, fallback = dumps_both(app, {"tiny": np.float64(1e-7), "big": 1e21}, monkeypatch)
+    assert json.loads(fast) == json.loads(fallback) == {"tiny": 1e-7, "big": 1e21}
+
+def test_fallback_encoder(app, monkeypatch):
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert json.loads(app.json.dumps(DOC)) == EXPECTED
+    with pytest.raises(TypeError):
+        app.json.dumps({"value": object()})
+
+def test_jsonify_response(app):
+    with app.test_request_context():
+        response = app.json.response(DOC)
+    assert response.mimetype == "application/json"
+    assert response.get_json() == EXPECTED
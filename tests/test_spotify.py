@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from backend.api import spotify
+from backend.api.spotify import MAX_TRACK_IDS, SpotifyAPI, SpotifyError
+
+def make_response(status=200, payload=None, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.reason = "Error" if status >= 400 else "OK"
+    response._content = json.dumps(payload if payload is not None else {}).encode()
+    response.headers.update(headers or {})
+    return response
+
+class StubSession:
+    """Stands in for requests.Session: answers token requests, then scripted or routed responses"""
+
+    def __init__(self, responses=(), route=None, token_delay=0.0):
+        self.responses = list(responses)
+        self.route = route
+        self.token_delay = token_delay
+        self.requests = []
+        self.token_requests = 0
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        if method == "POST":
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            with self._lock:
+                self.token_requests += 1
+            return make_response(200, {"access_token": f"token{self.token_requests}", "expires_in": 3600})
+        with self._lock:
+            self.requests.append((url, kwargs.get("params"), kwargs["headers"]["Authorization"]))
+            response = self.responses.pop(0) if self.responses else None
+        if isinstance(response, Exception):
+            raise response
+        # Responses are falsy when their status is an error
+        return self.route(url, kwargs.get("params")) if response is None else response
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record sleeps instead of sleeping; backoff jitter returns its upper bound"""
+    recorded = []
+    monkeypatch.setattr(spotify.time, "sleep", recorded.append)
+    monkeypatch.setattr(spotify.random, "uniform", lambda low, high: high)
+    return recorded
+
+def make_api(session, **kwargs):
+    api = SpotifyAPI(client_id="id", client_secret="secret", **kwargs)
+    api.session = session
+    return api
+
+def test_429_waits_for_retry_after(sleeps):
+    session = StubSession([
+        make_response(429, headers={"Retry-After": "2"}),
+        make_response(429, headers={"Retry-After": "120"}),
+        make_response(200, {"id": "t1"}),
+    ])
+    api = make_api(session)
+    assert api.get_track("t1") == {"id": "t1"}
+    # Retry-After is capped at max_retry_after
+    assert sleeps == [2, 60]
+    assert len(session.requests) == 3
+
+def test_5xx_backs_off_exponentially_then_raises(sleeps):
+    session = StubSession([make_response(503), make_response(502), make_response(500), make_response(200, {"id": "t1"})])
+    api = make_api(session)
+    assert api.get_track("t1") == {"id": "t1"}
+    assert sleeps == [0.5, 1.0, 2.0]
+
+    sleeps.clear()
+    session.responses = [make_response(503)] * 4
+    with pytest.raises(SpotifyError) as error:
+        api.get_track("t2")
+    assert error.value.status_code == 503 and not error.value.not_found
+    assert len(sleeps) == 3
+
+    session.responses = [requests.ConnectionError("reset"), make_response(200, {"id": "t3"})]
+    assert api.get_track("t3") == {"id": "t3"}
+
+def test_errors_raise_with_spotify_message(sleeps):
+    session = StubSession([make_response(404, {"error": {"status": 404, "message": "Non existing id"}})])
+    api = make_api(session)
+    with pytest.raises(SpotifyError, match="404: Non existing id") as error:
+        api.get_track("missing")
+    assert error.value.not_found
+    assert sleeps == []
+    # Errors are not cached
+    session.responses = [make_response(200, {"id": "missing"})]
+    assert api.get_track("missing") == {"id": "missing"}
+
+def test_expired_token_is_refreshed_once(sleeps):
+    session = StubSession([make_response(401), make_response(200, {"id": "t1"})])
+    api = make_api(session)
+    assert api.get_track("t1") == {"id": "t1"}
+    assert session.token_requests == 2
+    assert [auth for _, _, auth in session.requests] == ["Bearer token1", "Bearer token2"]
+
+def test_token_refresh_is_single_flight():
+    session = StubSession(token_delay=0.05)
+    api = make_api(session)
+    barrier = threading.Barrier(8)
+    headers = []
+
+    def call():
+        barrier.wait()
+        headers.append(api._get_auth_header())
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert session.token_requests == 1
+    assert headers == [{"Authorization": "Bearer token1"}] * 8
+
+def test_get_many_requests_50_ids_at_a_time(sleeps):
+    def route(url, params):
+        assert url.endswith("/tracks")
+        return make_response(200, {"tracks": [
+            None if track_id.startswith("unknown") else {"id": track_id} for track_id in params["ids"].split(",")
+        ]})
+
+    session = StubSession([make_response(200, {"id": "t0"}), make_response(200, {"id": "t1"})], route=route)
+    api = make_api(session)
+    api.get_track("t0")
+    api.get_track("t1")
+
+    ids = [f"t{i}" for i in range(120)] + ["unknown1", "t5"]
+    tracks = api.get_tracks(ids)
+    assert [track and track["id"] for track in tracks] == ids[:-2] + [None, "t5"]
+
+    batches = [params["ids"].split(",") for _, params, _ in session.requests[2:]]
+    # Cached and repeated ids are not requested again
+    assert [len(batch) for batch in batches] == [MAX_TRACK_IDS, MAX_TRACK_IDS, 19]
+    assert sum(batches, []) == ids[2:-1]
+
+    # Fetched items are cached under their single-item URL
+    requests_made = len(session.requests)
+    assert api.get_track("t99") == {"id": "t99"}
+    assert len(session.requests) == requests_made
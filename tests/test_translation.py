@@ -0,0 +1,17 @@
+import pytest
+
+from backend.api import routes
+from backend.app import create_app
+
+def test_stub_translations_are_not_persisted(app, db):
+    service = routes.get_translation_service()
+    assert service.translate(["Hola  mundo", "", "hola mundo"], "en") == ["[en] Hola mundo", "", "[en] hola mundo"]
+    assert service.translate(["Hola mundo"], "en") == ["[en] Hola mundo"]
+    assert service.stats()["memory_hits"] == 1
+    assert db.translations.count_documents({}) == 0
+
+def test_libretranslate_requires_url(monkeypatch):
+    monkeypatch.setenv("TRANSLATION_BACKEND", "libretranslate")
+    monkeypatch.delenv("TRANSLATION_API_URL", raising=False)
+    with pytest.raises(ValueError, match="TRANSLATION_API_URL"):
+        create_app()
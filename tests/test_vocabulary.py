@@ -0,0 +1,111 @@
+import time
+
+from bson import ObjectId
+
+from backend.api import routes
+from backend.models.language_processor import VocabularyIndex, analyze_text, lemmatize, tokenize
+
+SONGS = [
+    ("es1", "Mi corazón, tu corazón. Corazones rotos", "Spanish"),
+    ("es2", "Te quiero, corazón", "Spanish"),
+    ("en1", "I'm running, she runs, we run and we love", "English"),
+    ("en2", "Love me, love me, say that you love me", "English"),
+]
+
+def test_tokenize_and_lemmatize():
+    assert list(tokenize("Don’t STOP, 2 Corazones! d'água rock-n-roll")) == [
+        "don't", "stop", "corazones", "d'água", "rock", "n", "roll"
+    ]
+    assert [lemmatize(w, "English") for w in ("running", "loved", "dancing", "went", "feet", "hearts")] == [
+        "run", "love", "dance", "go", "foot", "heart"
+    ]
+    assert lemmatize("corazones", "Spanish") == "corazón"
+    assert lemmatize("mães", "Portuguese") == "mãe"
+    # Unsupported languages are left as they are
+    assert lemmatize("running", "German") == "running"
+    assert list(analyze_text("I can't stop, she's running, we'll dance", "English")) == [
+        "i", "can", "not", "stop", "she", "run", "we", "will", "dance"
+    ]
+
+def test_songs_with_word_and_top_words():
+    index = VocabularyIndex()
+    index.add_songs(SONGS)
+
+    assert index.songs_with_word("corazones", language="Spanish") == [
+        {"song_id": "es1", "count": 3, "positions": [1, 3, 4]},
+        {"song_id": "es2", "count": 1, "positions": [2]},
+    ]
+    assert [m["song_id"] for m in index.songs_with_word("running")] == ["en1"]
+    assert index.songs_with_word("corazón", language="English") == []
+    assert index.songs_with_word("nada") == []
+
+    assert index.top_words("Spanish", limit=2) == [
+        {"word": "corazón", "count": 4, "songs": 2},
+        {"word": "mi", "count": 1, "songs": 1},
+    ]
+    # Ties keep the order words were first seen in
+    assert index.top_words("English", limit=3) == [
+        {"word": "love", "count": 4, "songs": 2},
+        {"word": "run", "count": 3, "songs": 1},
+        {"word": "me", "count": 3, "songs": 1},
+    ]
+    assert index.top_words("English", limit=1, offset=2)[0]["word"] == "me"
+
+    # Re-adding a song replaces its lyrics
+    index.add_songs([("es2", "Te quiero", "Spanish")])
+    assert len(index) == 4
+    assert [m["song_id"] for m in index.songs_with_word("corazón")] == ["es1"]
+
+def test_known_songs():
+    index = VocabularyIndex()
+    index.add_songs(SONGS)
+
+    assert index.known_songs(["love", "me", "say", "that", "you"], language="English") == [
+        {"song_id": "en2", "coverage": 1.0, "unknown_words": []}
+    ]
+    assert index.known_songs(["love", "me", "say"], min_coverage=0.7) == [
+        {"song_id": "en2", "coverage": 0.7778, "unknown_words": ["that", "you"]}
+    ]
+    assert index.known_songs(["te", "querer", "quiero"], language="Spanish", min_coverage=0.6) == [
+        {"song_id": "es2", "coverage": 0.6667, "unknown_words": ["corazón"]}
+    ]
+
+def test_save_and_load_round_trip(tmp_path):
+    index = VocabularyIndex()
+    index.add_songs(SONGS)
+    index.save(tmp_path / "vocabulary")
+
+    loaded = VocabularyIndex.load(tmp_path / "vocabulary")
+    assert loaded.song_ids == index.song_ids
+    assert loaded.terms == index.terms
+    assert "en1" in loaded
+    assert loaded.songs_with_word("corazones") == index.songs_with_word("corazones")
+    assert loaded.top_words() == index.top_words()
+    assert loaded.known_songs(["love", "me"], min_coverage=0.5) == index.known_songs(["love", "me"], min_coverage=0.5)
+
+    # A loaded index can still be extended
+    loaded.add_songs([("es3", "Corazón", "Spanish")])
+    assert len(loaded.songs_with_word("corazón")) == 3
+
+def test_build_from_db_and_refresh(app, db):
+    song_id = ObjectId()
+    db.songs.insert_many([
+        {"_id": song_id, "spotify_id": "es1", "title": "Corazón", "lyrics": SONGS[0][1], "language": "Spanish"},
+        {"_id": ObjectId(), "spotify_id": "none", "title": "Instrumental"},
+    ])
+    assert VocabularyIndex().build_from_db().song_ids == [str(song_id)]
+
+    client = app.test_client()
+    matches = client.get("/api/vocabulary/search?q=corazones&language=Spanish").get_json()["matches"]
+    assert [(m["spotify_id"], m["count"]) for m in matches] == [("es1", 3)]
+
+    # Lyrics written later are picked up once the index is older than the refresh period
+    new_id = ObjectId()
+    db.songs.insert_one({"_id": new_id, "spotify_id": "es2", "lyrics": SONGS[1][1], "language": "Spanish"})
+    assert len(client.get("/api/vocabulary/search?q=corazón").get_json()["matches"]) == 1
+
+    routes._services["vocabulary_built_at"] = time.monotonic() - routes.VOCABULARY_REFRESH_SECONDS
+    client.get("/api/vocabulary/words")
+    routes._services["vocabulary_refresh"].join(10)
+    matches = client.get("/api/vocabulary/search?q=corazón").get_json()["matches"]
+    assert [m["spotify_id"] for m in matches] == ["es1", "es2"]
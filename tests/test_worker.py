@@ -0,0 +1,45 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from backend import worker
+from backend.api import song_service
+from backend.models.job_queue import JobQueue
+
+def test_long_job_keeps_its_lease(app, db, monkeypatch):
+    db.songs.insert_one({"_id": ObjectId(), "spotify_id": "long", "title": "Long"})
+    JobQueue().enqueue("long")
+
+    def slow_analysis(*args, **kwargs):
+        time.sleep(1.0)
+        return []
+
+    monkeypatch.setattr(song_service, "analyze_song", slow_analysis)
+
+    def run():
+        with app.app_context():
+            worker.work("slow-worker", poll_interval=0, lease_seconds=0.3, max_jobs=1)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(0.7)
+    # Well past the 0.3 s lease, but renewed, so no other worker may take the job
+    assert JobQueue(lease_seconds=0.3).claim("other-worker") is None
+    thread.join()
+
+    job = JobQueue().latest("long")
+    assert (job["status"], job["attempts"], job["worker"]) == ("done", 1, "slow-worker")
+
+def test_renew_fails_once_the_job_is_taken_over(db):
+    queue = JobQueue(lease_seconds=60)
+    queue.enqueue("taken")
+    job = queue.claim("first")
+    assert queue.renew(job)
+    assert db.jobs.find_one()["lease_expires_at"] > datetime.utcnow() + timedelta(seconds=50)
+
+    db.jobs.update_one({"_id": job["_id"]}, {"$set": {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}})
+    assert queue.claim("second")["worker"] == "second"
+    assert not queue.renew(job)
+    assert not queue.complete(job)